@@ -1,176 +1,4039 @@
-"""Commandline Only Version of Ishmael"""
+"""Commandline Only Version of Ishmael
+
+Codebooks are only cached on disk when asked to with --cache. A cached
+codebook is the derived key in plain text, and it stays in --cache-dir until
+it is evicted or deleted with --purge-cache.
+"""
 import string as s
 import math
 import random
 from collections import OrderedDict
 import base64
 import argparse
+from array import array
+import bisect
+import bz2
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import re
+import stat
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+# NumPy is optional, it only powers the vectorized encode engine.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# A list of valid characters in base64
+base_chars = list(s.ascii_letters + s.digits + "+" + "/" + "=")
+
+# Version of the codebook derivation performed by wordlistgen. Bump this when
+# the derivation changes so stale cache entries are no longer picked up.
+ALGORITHM_VERSION = 1
+
+# Key schedules wordlistgen can derive a codebook with. Schedule 1 shuffles
+# every token keyed by the whole text, schedule 2 deduplicates first and
+# permutes only the unique words keyed by a digest of the corpus.
+SCHEDULES = (1, 2)
+DEFAULT_SCHEDULE = 1
+
+# Salts of the schedule 2 digests: of a corpus file, and of the digests of
+# the files of a wordlist made of several.
+SCHEDULE2_SALT = b"ishmael-schedule-2\n"
+SCHEDULE2_SOURCES_SALT = b"ishmael-schedule-2-sources\n"
+
+# Version of the incremental vocabulary kept for wordlists of several files
+VOCABULARY_VERSION = 1
+
+# Default directory for cached codebooks, following the XDG cache convention.
+# Entries hold derived codebooks, that is key material, in plain text.
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME",
+                   os.path.join(os.path.expanduser("~"), ".cache")),
+    "ishmael")
+
+# Default eviction limits for the codebook cache (256 MiB, 30 days unused).
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Names of the files the cache writes: codebooks, vocabularies of wordlists
+# of several files and the temporary files of unfinished writes.
+CACHE_FILE = re.compile(r'(vocabulary-)?[0-9a-f]{64}\.json|tmp\w+\.tmp')
+
+# Default memory budget for codebooks held by a CodebookRegistry (256 MiB).
+DEFAULT_REGISTRY_MAX_BYTES = 256 * 1024 * 1024
+
+# Encoding modes. 'base64' is the original character keyed encoding,
+# 'sixbit' maps 6 bit symbols straight onto a 64 bucket codebook, and 'wide'
+# packs as many bits into every word as the vocabulary allows.
+MODES = ("base64", "sixbit", "wide")
+
+# Modes whose files start with a version symbol.
+HEADER_MODES = ("sixbit", "wide")
+
+# Version of the sixbit format, written as the first symbol of every file.
+SIXBIT_VERSION = 1
+
+# Version of the wide format. The first symbol of every wide file holds it
+# in its upper bits and the number of bits per word in its lower 5 bits.
+WIDE_VERSION = 1
+
+# Bounds on the bits carried per word in wide mode, and the fewest words
+# every bucket must keep so words still vary for the same symbol.
+WIDE_MIN_BITS = 6
+WIDE_MAX_BITS = 16
+WIDE_MIN_SYNONYMS = 4
+
+# Bytes every wide symbol is spread over while being cut out or packed,
+# enough to hold 16 bits starting anywhere within a byte.
+WIDE_LANE = 3
+
+# Translate tables between base64 text and symbol numbers. In base64 mode
+# the '=' padding character is symbol 64, sixbit mode never produces it.
+BASE64_SYMBOLS = bytes.maketrans("".join(base_chars).encode("ascii"),
+                                 bytes(range(len(base_chars))))
+SYMBOLS_BASE64 = bytes.maketrans(bytes(range(len(base_chars))),
+                                 "".join(base_chars).encode("ascii"))
+
+# Translate table stripping punctuation from words, shared by every key
+# schedule so they all cut words out of a corpus the same way.
+REMOVE_PUNCTUATION = str.maketrans('', '', s.punctuation + "”" + "“" + "—")
+
+# Openers for corpora stored compressed, by file extension. Anything else is
+# read as plain UTF-8 text.
+CORPUS_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Codecs for the optional compression stage, by name: the id recorded in the
+# header, and the compressor and decompressor factories.
+CODECS = {
+    "zlib": (1, zlib.compressobj, zlib.decompressobj),
+    "bz2": (2, bz2.BZ2Compressor, bz2.BZ2Decompressor),
+    "lzma": (3, lzma.LZMACompressor, lzma.LZMADecompressor),
+}
+
+# Header put in front of a compressed payload: magic, version and codec id.
+COMPRESSION_MAGIC = b"ISHZ"
+COMPRESSION_VERSION = 1
+COMPRESSION_HEADER_SIZE = len(COMPRESSION_MAGIC) + 2
+
+# Number of decompressed bytes produced per step, bounding memory for
+# payloads that compress extremely well.
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Number of corpus bytes tokenized at a time.
+CORPUS_CHUNK_SIZE = 1024 * 1024
+
+# UTF-8 forms of the characters str.split() treats as whitespace besides the
+# ASCII ones bytes.split() already knows about.
+UNICODE_SPACE = re.compile(rb'[\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80|'
+                           rb'\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|'
+                           rb'\xe3\x80\x80')
+
+# Number of payload bytes encoded per block when streaming. This is a
+# multiple of 3 so every block base64-encodes on its own without padding.
+BLOCK_SIZE = 3 * 64 * 1024
+
+# Number of payload bytes handed to a worker process at a time when encoding
+# with --workers. Also a multiple of 3, so pieces encode independently.
+WORKER_BLOCK_SIZE = 4 * BLOCK_SIZE
+
+# Number of ish bytes handed to a worker process at a time when decoding
+# with --workers. Pieces are cut at the next space after this many bytes.
+WORKER_DECODE_SIZE = 8 * 1024 * 1024
+
+# Sidecar seek index written next to an ish file: magic, version and the
+# checkpoint interval, then a (payload offset, ish offset) pair for every
+# checkpoint. The last pair holds the sizes of the payload and ish file.
+INDEX_MAGIC = b"ISHX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sBxxxQ")
+INDEX_ENTRY = struct.Struct("<QQ")
+INDEX_SUFFIX = ".idx"
+
+# Number of payload bytes between index checkpoints. Checkpoints fall on
+# block starts, so the spacing is rounded up to whole blocks.
+DEFAULT_INDEX_INTERVAL = BLOCK_SIZE
+
+# Checkpoint saved next to the output of a resumable run
+CHECKPOINT_VERSION = 2
+CHECKPOINT_SUFFIX = ".ckpt"
+
+# Seconds between checkpoints of a resumable run
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+# Seconds between progress reports
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
+# Size of the random numbers the Python engine picks words with. Every draw
+# is scaled down to its bucket, so wide draws keep the pick unbiased.
+DRAW_BYTES = array('Q').itemsize
+DRAW_BITS = 8 * DRAW_BYTES
+
+
+class Stage:
+    """Times one pass through a stage and counts the bytes it processed."""
+
+    def __init__(self, record):
+        """Creates the stage timer
+
+        :param record: (dict) The totals of the stage to add this pass to
+        """
+
+        self.record = record
+
+    def add(self, nbytes):
+        """Counts bytes processed by this pass through the stage
+
+        :param nbytes: (int) The number of bytes
+        :return: Nothing, just updates the totals.
+        """
+
+        self.record["bytes"] += nbytes
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record["wall_s"] += time.perf_counter() - self.wall
+        self.record["cpu_s"] += time.process_time() - self.cpu
+        self.record["calls"] += 1
+        return False
+
+
+class NullStage:
+    """Stands in for Stage while statistics are switched off."""
+
+    def add(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class StageStats:
+    """Collects wall time, CPU time and bytes processed per stage.
+
+    Stages are timed with ``with stats.stage("name") as stage:`` and totals
+    are kept per name across every pass, in the order stages first ran.
+    Nothing is measured until enabled is set. Work done inside worker
+    processes is only seen as the time the parent spends waiting on it.
+    """
+
+    def __init__(self):
+        """Creates an empty, disabled, set of statistics"""
+
+        self.enabled = False
+        self.stages = OrderedDict()
+
+    def stage(self, name, nbytes=0):
+        """Starts timing a pass through a stage
+
+        :param name: (str) The name of the stage
+        :param nbytes: (int) Bytes processed by the pass, if already known
+        :return: A context manager timing the pass
+        """
+
+        if not self.enabled:
+            return NULL_STAGE
+
+        record = self.stages.get(name)
+        if record is None:
+            record = {"wall_s": 0.0, "cpu_s": 0.0, "bytes": 0, "calls": 0}
+            self.stages[name] = record
+
+        record["bytes"] += nbytes
+        return Stage(record)
+
+    def as_dict(self):
+        """Returns the collected statistics
+
+        :return: (dict) Totals per stage name, in the order stages first ran
+        """
+
+        return OrderedDict((name, dict(record))
+                           for name, record in self.stages.items())
+
+    def report(self, file):
+        """Prints the collected statistics as a table
+
+        :param file: A text file object to print to
+        :return: Nothing, just prints.
+        """
+
+        print("%-16s %10s %10s %14s %8s" % ("stage", "wall s", "cpu s",
+                                            "bytes", "calls"), file=file)
+        for name, record in self.stages.items():
+            print("%-16s %10.4f %10.4f %14d %8d"
+                  % (name, record["wall_s"], record["cpu_s"],
+                     record["bytes"], record["calls"]), file=file)
+
+
+# Shared stand in returned while statistics are switched off
+NULL_STAGE = NullStage()
+
+# Per stage statistics for this process, switched on by --stats
+stats = StageStats()
+
+
+class Progress:
+    """Reports bytes done, percent, throughput and time left of a stage.
+
+    A stage calls start, then advance with the bytes it got through once
+    per block, then finish. Nothing is reported until enabled is set, and
+    reports are limited to one every interval seconds, so a block costs at
+    most a clock read. Reports go to stderr as a status line, or as one JSON
+    object per line for a job scheduler to scrape when json is set.
+    """
+
+    def __init__(self):
+        """Creates a disabled reporter"""
+
+        self.enabled = False
+        self.json = False
+        self.interval = DEFAULT_PROGRESS_INTERVAL
+        self.file = sys.stderr
+
+        # Name of the running stage, None between stages
+        self.stage = None
+
+    def start(self, stage, total=None, done=0):
+        """Starts reporting a stage
+
+        :param stage: (str) The name of the stage
+        :param total: (int) The number of bytes the stage will get through,
+            None if not known in advance
+        :param done: (int) The number of bytes already done, when resuming
+        :return: Nothing, just starts the clock.
+        """
+
+        if not self.enabled:
+            return
+
+        self.stage = stage
+        self.total = total
+        self.done = self.first = done
+        self.started = self.reported = time.monotonic()
+
+    def advance(self, count):
+        """Adds to the bytes done, reporting if the interval has passed
+
+        :param count: (int) The number of bytes just done
+        :return: Nothing, just reports.
+        """
+
+        if self.stage is None:
+            return
+
+        self.update(self.done + count)
+
+    def update(self, done):
+        """Sets the bytes done, reporting if the interval has passed
+
+        :param done: (int) The number of bytes done so far
+        :return: Nothing, just reports.
+        """
+
+        if self.stage is None:
+            return
+
+        self.done = done
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report(now)
+
+    def finish(self):
+        """Reports the stage one last time and ends it
+
+        :return: Nothing, just reports.
+        """
+
+        if self.stage is None:
+            return
+
+        self.report(time.monotonic(), final=True)
+        self.stage = None
+
+    def report(self, now, final=False):
+        """Prints where the stage has got to
+
+        :param now: (float) The time on the monotonic clock
+        :param final: (bool) Whether the stage is finished
+        :return: Nothing, just prints.
+        """
+
+        # Throughput only counts this run, not what a resumed run skipped.
+        elapsed = now - self.started
+        rate = (self.done - self.first) / elapsed if elapsed > 0 else 0.0
+
+        percent = eta = None
+        if self.total:
+            percent = min(100.0, 100.0 * self.done / self.total)
+            if rate:
+                eta = max(0.0, (self.total - self.done) / rate)
+
+        if self.json:
+            print(json.dumps({"stage": self.stage, "bytes": self.done,
+                              "total_bytes": self.total, "percent": percent,
+                              "mb_s": rate / 1e6, "eta_s": eta,
+                              "elapsed_s": elapsed, "finished": final}),
+                  file=self.file, flush=True)
+            return
+
+        line = "%s: %.1f" % (self.stage, self.done / 1e6)
+        if self.total:
+            line += "/%.1f" % (self.total / 1e6)
+        line += " MB"
+        if percent is not None:
+            line += " (%.1f%%)" % percent
+        line += " %.2f MB/s" % (rate / 1e6)
+        if eta is not None and not final:
+            line += " ETA %d:%02d:%02d" % (eta // 3600, eta // 60 % 60,
+                                            eta % 60)
+
+        # A terminal gets one line rewritten in place, logs get a line each.
+        if self.file.isatty():
+            end = "\n" if final else ""
+            print("\r" + line.ljust(72), end=end, file=self.file, flush=True)
+        else:
+            print(line, file=self.file, flush=True)
+
+
+# Progress reports for this process, switched on by --progress
+progress = Progress()
+
+
+class ProgressReader:
+    """Reports the bytes read from a binary file as progress of a stage."""
+
+    def __init__(self, file):
+        """Creates the reader
+
+        :param file: A binary file object to read from
+        """
+
+        self.file = file
+
+    def read(self, size=-1):
+        """Reads up to size bytes and reports them
+
+        :param size: (int) The number of bytes wanted
+        :return: (bytes) The next bytes, b'' once done
+        """
+
+        data = self.file.read(size)
+        progress.advance(len(data))
+        return data
+
+
+def file_size(file):
+    """Finds the size of an open file, if it has one
+
+    :param file: A binary file object
+    :return: (int) The size in bytes, None for pipes and in-memory files
+    """
+
+    try:
+        status = os.fstat(file.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    return status.st_size if stat.S_ISREG(status.st_mode) else None
+
+
+# Code below from following site
+# https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
+def divide_chunks(list_to_chunk, n):
+    """Yields successive n-sized chunks from list list_to_chunk
+
+    :param list_to_chunk: (list) A list to be chunked
+    :param n: (int) The number of elements to be put into each chunk
+    :return: The chunks of equal size using a yield statement
+    """
+
+    # Yield each chunk.
+    for x in range(0, len(list_to_chunk), n):
+        yield list_to_chunk[x:x + n]
+
+
+def corpus_fingerprint(file_path, schedule=DEFAULT_SCHEDULE):
+    """Computes the cache key for the codebook built from a wordlist.
+
+    A wordlist of several files hashes like the files concatenated, so it
+    shares its key with a single file holding the same bytes.
+
+    :param file_path: (str) filepath for the base wordlist to be used, see
+        corpus_sources.
+    :param schedule: (int) The key schedule, one of SCHEDULES
+    :return: (str) Hex digest over the algorithm version, key schedule and
+        corpus bytes.
+    """
+
+    # Salt the hash with the algorithm version and key schedule so a new
+    # derivation never reuses a codebook built by another one. Schedule 1
+    # keeps its original salt so existing cache entries stay valid.
+    salt = b"ishmael-codebook-v%d" % ALGORITHM_VERSION
+    if schedule != 1:
+        salt += b"-s%d" % schedule
+    digest = hashlib.sha256(salt + b"\n")
+
+    # Hash the corpus in blocks so large wordlists are not held in memory.
+    for source in corpus_sources(file_path):
+        with open(source, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def corpus_parts(file_path):
+    """Splits a wordlist given as several paths into its parts
+
+    A string is only split when it is not an existing path as a whole.
+
+    :param file_path: (str or list) One path, several joined with
+        os.pathsep, or a list of paths
+    :return: (list) The paths
+    """
+
+    if not isinstance(file_path, str):
+        return list(file_path)
+
+    # A path that exists is never split, whatever characters it holds.
+    if os.path.exists(file_path):
+        return [file_path]
+
+    return [part for part in file_path.split(os.pathsep) if part]
+
+
+def corpus_sources(file_path):
+    """Lists the files a wordlist is made of, in the order they are read
+
+    A wordlist is a file, a directory, or several of either. A directory
+    stands for every file below it that is not hidden, sorted by its path
+    relative to the directory, so the order never depends on the file
+    system.
+
+    :param file_path: (str or list) The wordlist, see corpus_parts
+    :return: (list) The filepaths, raises FileNotFoundError naming the
+        part that is missing, or if there are none.
+    """
+
+    sources = []
+    parts = corpus_parts(file_path)
+
+    for part in parts:
+        # Say which part is missing, a mistyped path may have been split.
+        if not os.path.exists(part):
+            if len(parts) > 1:
+                raise FileNotFoundError(
+                    "Wordlist %r is not a path, and its part %r split off "
+                    "at %r does not exist." % (file_path, part, os.pathsep))
+            raise FileNotFoundError("Wordlist %r does not exist." % part)
+
+        if not os.path.isdir(part):
+            sources.append(part)
+            continue
+
+        found = []
+        for root, directories, names in os.walk(part):
+            directories[:] = [name for name in directories
+                              if not name.startswith('.')]
+            found.extend(os.path.join(root, name) for name in names
+                         if not name.startswith('.'))
+
+        sources.extend(sorted(found, key=lambda path: os.path.relpath(
+            path, part).split(os.sep)))
+
+    if not sources:
+        raise FileNotFoundError("No wordlist files in %r." % (file_path,))
+
+    return sources
+
+
+def corpus_signature(file_path):
+    """Identifies the state of every file of a wordlist without reading them
+
+    :param file_path: (str or list) The wordlist, see corpus_parts
+    :return: (tuple) The path, size and modification time of every file
+    """
+
+    signature = []
+    for source in corpus_sources(file_path):
+        status = os.stat(source)
+        signature.append((os.path.abspath(source), status.st_size,
+                          status.st_mtime_ns))
+
+    return tuple(signature)
+
+
+def load_cached_codebook(cache_dir, key):
+    """Loads the word list of a previously built codebook from the cache.
+
+    :param cache_dir: (str) Directory holding cached codebooks
+    :param key: (str) Cache key from corpus_fingerprint
+    :return: (list) The unique words of the codebook, or None on a miss.
+    """
+
+    cache_path = os.path.join(cache_dir, key + ".json")
+
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+        version = entry["version"]
+        words = entry["words"]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError):
+        # A truncated, unreadable or malformed entry is dropped and rebuilt.
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return None
+
+    if version != ALGORITHM_VERSION:
+        return None
+
+    # Touch the entry so eviction treats it as recently used.
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+
+    return words
+
+
+def atomic_write_json(path, data):
+    """Writes JSON to a file in one step, so a reader never sees part of it
+
+    The JSON goes to a temporary file in the same directory first, which is
+    then renamed over path. The temporary file is removed again if anything
+    fails on the way.
+
+    :param path: (str) The filepath to write
+    :param data: The data to write as JSON
+    :return: Nothing, raises OSError if the file cannot be written.
+    """
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def save_cached_codebook(cache_dir, key, words):
+    """Saves the word list of a freshly built codebook to the cache.
+
+    :param cache_dir: (str) Directory holding cached codebooks
+    :param key: (str) Cache key from corpus_fingerprint
+    :param words: (list) The unique words the tables are built from
+    :return: Nothing, just writes the cache entry.
+    """
+
+    # Write in one step so a concurrent reader never sees a partially
+    # written entry.
+    try:
+        atomic_write_json(os.path.join(cache_dir, key + ".json"),
+                          {"version": ALGORITHM_VERSION, "words": words})
+    except OSError:
+        # The cache is only an optimisation, never fail a run because of it.
+        pass
+
+
+def evict_cache(cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                max_age=DEFAULT_CACHE_MAX_AGE):
+    """Removes stale cache entries, least recently used first.
+
+    :param cache_dir: (str) Directory holding cached codebooks
+    :param max_bytes: (int) Total size the cache may occupy, None for no limit
+    :param max_age: (int) Seconds an entry may go unused, None for no limit
+    :return: Nothing, just deletes entries.
+    """
+
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    # Gather (last used, size, path) for every cache entry.
+    entries = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        entries.append((info.st_mtime, info.st_size, path))
+
+    # Oldest entries come first, so they are the first to go.
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+
+    for used, size, path in entries:
+        too_old = max_age is not None and now - used > max_age
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def purge_cache(cache_dir):
+    """Deletes every cached codebook and vocabulary.
+
+    Only files named like the cache's own are touched, so pointing this at
+    the wrong directory does not delete anything else. The directory itself
+    is removed once it is empty.
+
+    :param cache_dir: (str) Directory holding cached codebooks
+    :return: (int) The number of files deleted
+    """
+
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for name in names:
+        if not CACHE_FILE.fullmatch(name):
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        removed += 1
+
+    # Leave the directory in place if anything else lives in it.
+    with contextlib.suppress(OSError):
+        os.rmdir(cache_dir)
+
+    return removed
+
+
+def cut_chunks(blocks):
+    """Re-cuts blocks of corpus bytes so every chunk ends on a word boundary.
+
+    Chunks end right after a space or newline, so no word, UTF-8 character
+    or CRLF pair is ever split between two chunks.
+
+    :param blocks: An iterable of bytes blocks
+    :return: The chunks using a yield statement
+    """
+
+    # Bytes after the last boundary of the previous block
+    carry = b''
+
+    for block in blocks:
+        if carry:
+            block = carry + block
+
+        cut = max(block.rfind(b'\n'), block.rfind(b' ')) + 1
+        if cut == 0:
+            carry = block
+            continue
+
+        yield block[:cut]
+        carry = block[cut:]
+
+    if carry:
+        yield carry
+
+
+def source_blocks(file_path, chunk_size=CORPUS_CHUNK_SIZE):
+    """Yields the raw bytes of one corpus file in blocks.
+
+    Plain files are memory-mapped and sliced, so only one block at a time is
+    copied onto the heap. Files ending in .gz, .bz2 or .xz are decompressed
+    as a stream.
+
+    :param file_path: (str) The filepath of the corpus file
+    :param chunk_size: (int) The number of bytes per block
+    :return: The blocks using a yield statement
+    """
+
+    opener = CORPUS_OPENERS.get(os.path.splitext(file_path)[1].lower())
+
+    if opener is not None:
+        with opener(file_path, 'rb') as file:
+            yield from iter(lambda: file.read(chunk_size), b'')
+        return
+
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+
+        # An empty file cannot be mapped, and has nothing to yield anyway.
+        if size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for i in range(0, size, chunk_size):
+                yield view[i:i + chunk_size]
+
+
+def corpus_size(sources):
+    """Adds up the bytes a build will read, for progress reports
+
+    :param sources: (list) Filepaths from corpus_sources
+    :return: (int) The total size, None if a compressed file makes it
+        unknown in advance
+    """
+
+    if any(os.path.splitext(source)[1].lower() in CORPUS_OPENERS
+           for source in sources):
+        return None
+
+    return sum(os.path.getsize(source) for source in sources)
+
+
+def corpus_chunks(file_path, chunk_size=CORPUS_CHUNK_SIZE):
+    """Yields the raw bytes of a corpus in chunks cut on word boundaries.
+
+    The files of a wordlist are read one after another as if concatenated,
+    exactly like a single file made with cat.
+
+    :param file_path: (str or list) The wordlist, see corpus_sources
+    :param chunk_size: (int) The approximate number of bytes per chunk
+    :return: The chunks using a yield statement
+    """
+
+    sources = corpus_sources(file_path)
+
+    blocks = (block for source in sources
+              for block in source_blocks(source, chunk_size))
+
+    progress.start("build", corpus_size(sources))
+    for chunk in cut_chunks(blocks):
+        progress.advance(len(chunk))
+        yield chunk
+    progress.finish()
+
+
+def lower_chunk(chunk):
+    """Lowercases a chunk of corpus bytes the way the text reader would.
+
+    Line endings are folded to LF like universal newlines do, and letters
+    are lowercased with str.lower(), which is exact here because chunks are
+    cut on whitespace and lowercasing never looks across it.
+
+    :param chunk: (bytes) A chunk from corpus_chunks
+    :return: (bytes) The UTF-8 encoded, lowercased chunk
+    """
+
+    # Fold CRLF and lone CR line endings to LF.
+    if b'\r' in chunk:
+        chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+    # ASCII only text lowercases byte by byte, no decoding needed.
+    if chunk.isascii():
+        return chunk.lower()
+
+    return chunk.decode('utf-8').lower().encode('utf-8')
+
+
+def split_chunk(lowered):
+    """Splits a lowercased chunk into the tokens str.split() would give.
+
+    :param lowered: (bytes) A chunk from lower_chunk
+    :return: (list) The UTF-8 encoded tokens
+    """
+
+    # bytes.split() only knows ASCII whitespace. Fall back to splitting the
+    # text in the rare chunks holding any other kind.
+    if UNICODE_SPACE.search(lowered):
+        return [token.encode('utf-8')
+                for token in lowered.decode('utf-8').split()]
+
+    return lowered.split()
+
+
+def read_corpus_chunks(chunks):
+    """Reads corpus chunks and lowercases them, timing both stages
+
+    Every key schedule tokenizes through here and split_chunk, so the
+    schedules cannot disagree on what the words of a corpus are.
+
+    :param chunks: (iterable) Chunks of corpus bytes, e.g. from corpus_chunks
+    :return: (tuple) Each chunk with its lowercased copy, using a yield
+        statement
+    """
+
+    chunks = iter(chunks)
+    while True:
+        # Read the next part of the wordlist.
+        with stats.stage("corpus read") as stage:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                stage.add(len(chunk))
+        if chunk is None:
+            return
+
+        # Cast all upper case characters to lowercase
+        with stats.stage("lower", len(chunk)):
+            lowered = lower_chunk(chunk)
+
+        yield chunk, lowered
+
+
+def strip_punctuation(tokens):
+    """Strips punctuation from distinct tokens and drops the new dupes
+
+    :param tokens: (iterable) UTF-8 encoded tokens
+    :return: (dict) The words, in the order of the first token each came
+        from. The blank word left by tokens made only of punctuation is kept.
+    """
+
+    with stats.stage("translate"):
+        return dict.fromkeys([w.decode('utf-8').translate(REMOVE_PUNCTUATION)
+                              for w in tokens])
+
+
+def wordlist_words(file_path):
+    """Derives the shuffled list of unique words from a wordlist
+
+    The corpus is read in chunks and tokenized as bytes, so it is never held
+    as a decoded string, a lowercased copy and a list of translated words at
+    the same time. Punctuation is stripped once per distinct token rather
+    than once per occurrence. The words are identical to decoding, lowering
+    and splitting the whole text, which the shuffle key depends on.
+
+    :param file_path: (str) filepath for the base wordlist to be used.
+    :return: (list) The unique words the encode and decode tables are cut from
+    """
+
+    # The lowercased text is needed whole, it is the key of the shuffle.
+    lowered_chunks = []
+    raw_words = []
+
+    for _, lowered in read_corpus_chunks(corpus_chunks(file_path)):
+        lowered_chunks.append(lowered)
+
+        # Split up the chunk into it's component words
+        with stats.stage("split", len(lowered)):
+            raw_words.extend(split_chunk(lowered))
+
+    # Use the text itself as a key to randomly shuffle the word list.
+    # This improves cryptographic security. Seeding with the UTF-8 bytes of
+    # the text is the same as seeding with the text.
+    with stats.stage("seed"):
+        text = b''.join(lowered_chunks)
+        del lowered_chunks[:]
+        shuffler = random.Random(text)
+        del text
+    with stats.stage("shuffle"):
+        shuffler.shuffle(raw_words)
+
+    # Drop repeated tokens first. Every word then keeps the position of the
+    # first token it comes from, just as deduplicating after stripping would.
+    with stats.stage("dedupe"):
+        raw_words = list(dict.fromkeys(raw_words))
+
+    # For each distinct token, strip punctuation and drop the new dupes.
+    # The blank word is kept, the tables have always included it.
+    return list(strip_punctuation(raw_words))
+
+
+def keyed_words(file_path, cache_dir=None):
+    """Derives the permuted list of unique words with key schedule 2
+
+    Tokens are deduplicated as the corpus streams past, so only one chunk
+    and the unique vocabulary are ever held in memory. The unique words are
+    then permuted with a generator keyed by a SHA-256 digest of the corpus,
+    instead of seeding with the whole text and shuffling every token.
+
+    A wordlist of several files is read incrementally instead, see
+    corpus_vocabulary.
+
+    :param file_path: (str or list) The wordlist, see corpus_sources
+    :param cache_dir: (str) Directory holding the incremental vocabulary of
+        a wordlist of several files, None to read every file.
+    :return: (list) The unique words the encode and decode tables are cut from
+    """
+
+    sources = corpus_sources(file_path)
+
+    if len(sources) > 1:
+        key, unique = corpus_vocabulary(file_path, sources, cache_dir)
+        return keyed_permutation(unique, key)
+
+    digest = hashlib.sha256(SCHEDULE2_SALT)
+
+    # Unique tokens in the order they are first seen
+    unique = dict()
+
+    for chunk, lowered in read_corpus_chunks(corpus_chunks(file_path)):
+        with stats.stage("digest", len(chunk)):
+            digest.update(chunk)
+
+        # Split up the lowercased chunk and keep only unseen tokens.
+        with stats.stage("split", len(lowered)):
+            unique.update(dict.fromkeys(split_chunk(lowered)))
+
+    return keyed_permutation(unique, digest.digest())
+
+
+def keyed_permutation(unique, key):
+    """Turns unique tokens into the permuted word list of key schedule 2
+
+    :param unique: (iterable) The UTF-8 encoded unique tokens, in the order
+        they were first seen
+    :param key: (bytes) The key of the permutation
+    :return: (list) The unique words the encode and decode tables are cut from
+    """
+
+    # For each distinct token, strip punctuation and drop the new dupes,
+    # along with the blank word left by tokens made only of punctuation.
+    words = strip_punctuation(unique)
+    words.pop('', None)
+    words = list(words)
+
+    # Permute the unique words, keyed by the corpus digest.
+    with stats.stage("shuffle"):
+        random.Random(key).shuffle(words)
+
+    return words
+
+
+def corpus_vocabulary(file_path, sources, cache_dir=None):
+    """Collects the unique tokens of a wordlist of several files
+
+    Every file is a document of its own, tokenized and digested separately.
+    The unique tokens in first seen order, with the digest, signature and
+    number of new tokens of every file, are kept in cache_dir. A later
+    build reuses them for every leading file that has not changed, so
+    adding a document only reads the new text. Files after the first
+    changed, removed or inserted one are read again, since they may have
+    been the first to see some token.
+
+    The permutation key is a digest over the digests of the files.
+
+    :param file_path: (str or list) The wordlist, see corpus_sources
+    :param sources: (list) Its filepaths from corpus_sources
+    :param cache_dir: (str) Directory holding the vocabulary, None to read
+        every file.
+    :return: (tuple) The permutation key and the UTF-8 encoded unique tokens
+    """
+
+    state = {"version": VOCABULARY_VERSION, "sources": [], "tokens": []}
+    state_path = None
+
+    # The vocabulary belongs to the wordlist as given, so a directory keeps
+    # its vocabulary as files are added to it.
+    if cache_dir is not None:
+        name = hashlib.sha256("\0".join(
+            os.path.abspath(part) for part in corpus_parts(file_path)
+        ).encode("utf-8")).hexdigest()
+        state_path = os.path.join(cache_dir, "vocabulary-%s.json" % name)
+        state = load_vocabulary(state_path) or state
+
+    # Reuse every leading file that is still in place and unchanged.
+    kept = 0
+    token_count = 0
+    for entry, source in zip(state["sources"], sources):
+        status = os.stat(source)
+        if [entry["path"], entry["size"], entry["mtime_ns"]] != \
+                [os.path.abspath(source), status.st_size, status.st_mtime_ns]:
+            break
+        kept += 1
+        token_count += entry["tokens"]
+
+    entries = state["sources"][:kept]
+    unique = dict.fromkeys(token.encode("utf-8")
+                           for token in state["tokens"][:token_count])
+
+    # Read only the files after that.
+    progress.start("build", corpus_size(sources[kept:]))
+    for source in sources[kept:]:
+        status = os.stat(source)
+        digest = hashlib.sha256(SCHEDULE2_SALT)
+        before = len(unique)
+
+        chunks = cut_chunks(source_blocks(source))
+        for chunk, lowered in read_corpus_chunks(chunks):
+            with stats.stage("digest", len(chunk)):
+                digest.update(chunk)
+            with stats.stage("split", len(lowered)):
+                unique.update(dict.fromkeys(split_chunk(lowered)))
+            progress.advance(len(chunk))
+
+        entries.append({"path": os.path.abspath(source),
+                        "size": status.st_size,
+                        "mtime_ns": status.st_mtime_ns,
+                        "digest": digest.hexdigest(),
+                        "tokens": len(unique) - before})
+    progress.finish()
+
+    # Save the vocabulary for the next build if anything changed.
+    if state_path is not None and (kept < len(sources)
+                                   or len(state["sources"]) != kept):
+        save_vocabulary(state_path, {
+            "version": VOCABULARY_VERSION, "sources": entries,
+            "tokens": [token.decode("utf-8") for token in unique]})
+
+    key = hashlib.sha256(SCHEDULE2_SOURCES_SALT)
+    for entry in entries:
+        key.update(bytes.fromhex(entry["digest"]))
+
+    return key.digest(), list(unique)
+
+
+def load_vocabulary(state_path):
+    """Loads the incremental vocabulary of a wordlist of several files
+
+    :param state_path: (str) The filepath of the vocabulary
+    :return: (dict) The vocabulary, None if there is none or it is unusable
+    """
+
+    try:
+        with open(state_path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if state.get("version") != VOCABULARY_VERSION:
+        return None
+
+    return state
+
+
+def save_vocabulary(state_path, state):
+    """Saves the incremental vocabulary of a wordlist of several files
+
+    :param state_path: (str) The filepath of the vocabulary
+    :param state: (dict) The vocabulary
+    :return: Nothing, just writes the file.
+    """
+
+    try:
+        atomic_write_json(state_path, state)
+    except OSError:
+        # The vocabulary is only an optimisation, never fail a build.
+        pass
+
+
+def build_tables(words):
+    """Cuts a list of unique words into the encode and decode tables
+
+    :param words: (list) The unique words from wordlist_words
+    :return:  Two lists, one for encoding, one for decoding.
+    """
+
+    # Determine how many words should be in each chunk.
+    words_per_chunk = math.floor(len(words) / len(base_chars))
+
+    # Call divide_chunks to break the cipher_list into equally sized chunks
+    with stats.stage("chunk"):
+        chunked_wordlist = divide_chunks(list(words), words_per_chunk)
+        chunked_wordlist = list(chunked_wordlist)
+
+    # Create the encoding table as an empty dictionary
+    encode_table = dict()
+
+    # Create an iterator i to track progress through chunked_wordlist
+    i = 0
+
+    # Loop through all the characters in valid characters
+    for char in base_chars:
+        # Selected a chunk as the value for the character
+        encode_table[char] = chunked_wordlist[i]
+
+        # Add one to the iterator to get next chunk.
+        i += 1
+
+    # Create the decoding table as an empty dictionary
+    decode_table = dict()
+
+    # For each word in original dictionary, create a word -> character rel.
+    for key in encode_table.keys():
+        for word in encode_table[key]:
+            decode_table[word] = key
+
+    return encode_table, decode_table
+
+
+def load_words(file_path, cache_dir=None, schedule=DEFAULT_SCHEDULE):
+    """Loads the shuffled unique words of a wordlist, using the cache
+
+    The shuffled unique words are cached under a fingerprint of the corpus,
+    so later runs against an unchanged wordlist skip reading, shuffling and
+    deduplicating it. Cutting the tables from the cached words is cheap.
+
+    :param file_path: (str or list) The wordlist, a file, a directory or
+        several of either, see corpus_sources.
+    :param cache_dir: (str) Directory for cached codebooks, None to disable.
+    :param schedule: (int) The key schedule, one of SCHEDULES
+    :return: (list) The unique words the tables are cut from
+    """
+
+    if schedule not in SCHEDULES:
+        raise ValueError("Unknown key schedule %r." % (schedule,))
+
+    # Schedule 2 builds wordlists of several files incrementally instead,
+    # without hashing every file up front.
+    if schedule == 2 and len(corpus_sources(file_path)) > 1:
+        return keyed_words(file_path, cache_dir)
+
+    words = None
+
+    # Look for a codebook already built from identical corpus bytes.
+    if cache_dir is not None:
+        with stats.stage("cache lookup"):
+            key = corpus_fingerprint(file_path, schedule)
+            words = load_cached_codebook(cache_dir, key)
+
+    # Build the word list from scratch on a miss and remember it.
+    if words is None:
+        if schedule == 2:
+            words = keyed_words(file_path)
+        else:
+            words = wordlist_words(file_path)
+        if cache_dir is not None:
+            save_cached_codebook(cache_dir, key, words)
+
+    return words
+
+
+def wordlistgen(file_path, cache_dir=None, schedule=DEFAULT_SCHEDULE):
+    """Generates an encode and decode table out of a list of mixed words
+
+    With key schedule 1 the files of a wordlist are read as if concatenated,
+    so the tables match those built from one file made with cat. With key
+    schedule 2 every file is a document of its own, and adding a document
+    to a wordlist only reads the new one when cache_dir is given.
+
+    :param file_path: (str or list) The wordlist, a file, a directory or
+        several of either, see corpus_sources.
+    :param cache_dir: (str) Directory for cached codebooks, None to disable.
+    :param schedule: (int) The key schedule, one of SCHEDULES
+    :return:  Two lists, one for encoding, one for decoding.
+    """
+
+    return build_tables(load_words(file_path, cache_dir, schedule))
+
+
+def sixbit_tables(words):
+    """Cuts a list of unique words into the sixbit encode and decode tables
+
+    Unlike build_tables there is no bucket for '=' padding, so the words are
+    spread over 64 buckets indexed directly by symbol number.
+
+    :param words: (list) The unique words from wordlist_words
+    :return: A list of 64 word buckets for encoding, and a dictionary from
+        word to symbol number for decoding.
+    """
+
+    # Determine how many words should be in each of the 64 buckets.
+    words_per_chunk = math.floor(len(words) / 64)
+
+    # Cut the buckets, dropping the remainder words like build_tables does.
+    with stats.stage("chunk"):
+        encode_table = list(divide_chunks(list(words), words_per_chunk))[:64]
+    if len(encode_table) < 64:
+        raise IndexError("Wordlist needs to contain at least 64 words.")
+
+    # For each word in each bucket, create a word -> symbol relationship.
+    decode_table = dict()
+    for symbol, bucket in enumerate(encode_table):
+        for word in bucket:
+            decode_table[word] = symbol
+
+    return encode_table, decode_table
+
+
+def wide_bits(count, min_synonyms=WIDE_MIN_SYNONYMS):
+    """Picks the number of bits a wide word carries for a vocabulary
+
+    :param count: (int) The number of unique words
+    :param min_synonyms: (int) The fewest words every bucket must hold
+    :return: (int) The largest width whose 2**bits buckets all get at
+        least min_synonyms words, capped at WIDE_MAX_BITS.
+    """
+
+    if count < (1 << WIDE_MIN_BITS) * min_synonyms:
+        raise IndexError("Wordlist needs to contain at least %d words."
+                         % ((1 << WIDE_MIN_BITS) * min_synonyms))
+
+    bits = WIDE_MIN_BITS
+    while bits < WIDE_MAX_BITS and (2 << bits) * min_synonyms <= count:
+        bits += 1
+
+    return bits
+
+
+def wide_group(bits):
+    """Returns the number of bytes that fill a whole number of wide words
+
+    :param bits: (int) The bits carried per word
+    :return: (int) The byte length of the smallest such group
+    """
+
+    return bits // math.gcd(8, bits)
+
+
+def wide_layout(bits):
+    """Returns where every symbol of a wide group sits
+
+    A symbol of up to 16 bits always lies within the three bytes starting
+    at its first byte. Copied into a 24 bit lane, it is brought down to
+    the bottom of the lane by a right shift.
+
+    :param bits: (int) The bits carried per word
+    :return: (int) The byte length of a group from wide_group, and (list)
+        the first byte and right shift of every symbol, in order.
+    """
+
+    group = wide_group(bits)
+    layout = [(start // 8, 8 * WIDE_LANE - start % 8 - bits)
+              for start in range(0, 8 * group, bits)]
+
+    return group, layout
+
+
+def lane_mask(bits, lane, count, groups):
+    """Builds a mask selecting one symbol of every group of wide lanes
+
+    :param bits: (int) The bits carried per word
+    :param lane: (int) The number of the symbol within a group
+    :param count: (int) The number of symbols in a group
+    :param groups: (int) The number of groups
+    :return: (int) The bottom bits bits of that lane in every group
+    """
+
+    pattern = (bytes(WIDE_LANE * lane)
+               + ((1 << bits) - 1).to_bytes(WIDE_LANE, 'big')
+               + bytes(WIDE_LANE * (count - lane - 1)))
+
+    return int.from_bytes(pattern * groups, 'big')
+
+
+def wide_padding(length, group):
+    """Returns the end marker and padding that finish a wide payload
+
+    :param length: (int) The length of the payload in bytes
+    :param group: (int) The byte length from wide_group
+    :return: (bytes) A 0x80 byte then zeros up to a whole group
+    """
+
+    return b'\x80' + bytes(-(length + 1) % group)
+
+
+def wide_tables(words):
+    """Cuts a list of unique words into the wide encode and decode tables
+
+    The whole vocabulary is spread over 2**bits buckets indexed directly by
+    symbol number, like sixbit_tables.
+
+    :param words: (list) The unique words from wordlist_words
+    :return: A list of 2**bits word buckets for encoding, and a dictionary
+        from word to symbol number for decoding.
+    """
+
+    bits = wide_bits(len(words))
+    buckets = 1 << bits
+
+    # Cut the buckets, dropping the remainder words like sixbit_tables.
+    words_per_chunk = math.floor(len(words) / buckets)
+    with stats.stage("chunk"):
+        chunks = list(divide_chunks(list(words), words_per_chunk))[:buckets]
+
+    decode_table = dict()
+    for symbol, bucket in enumerate(chunks):
+        for word in bucket:
+            decode_table[word] = symbol
+
+    return chunks, decode_table
+
+
+def mode_tables(file_path, mode="base64", cache_dir=None,
+                schedule=DEFAULT_SCHEDULE):
+    """Generates the encode and decode tables for an encoding mode
+
+    :param file_path: (str) filepath for the base wordlist to be used.
+    :param mode: (str) The encoding mode, one of MODES
+    :param cache_dir: (str) Directory for cached codebooks, None to disable.
+    :param schedule: (int) The key schedule, one of SCHEDULES
+    :return: The encode and decode tables for the mode.
+    """
+
+    words = load_words(file_path, cache_dir, schedule)
+
+    if mode == "sixbit":
+        return sixbit_tables(words)
+    if mode == "wide":
+        return wide_tables(words)
+
+    return build_tables(words)
+
+
+class BucketView:
+    """A read only sequence of the words in one bucket of a CompactCodebook"""
+
+    def __init__(self, codebook, start, stop):
+        """Creates the view
+
+        :param codebook: (CompactCodebook) The codebook holding the words
+        :param start: (int) The number of the first word in the bucket
+        :param stop: (int) One past the number of the last word
+        """
+
+        self.blob = codebook.blob
+        self.offsets = codebook.offsets
+        self.start = start
+        self.size = stop - start
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("bucket index out of range")
+
+        number = self.start + index
+        offsets = self.offsets
+        return self.blob[offsets[number]:offsets[number + 1]].decode('utf-8')
+
+
+class CompactDecodeTable:
+    """Maps words back to keys using the hash index of a CompactCodebook"""
+
+    def __init__(self, codebook):
+        """Creates the decode table
+
+        :param codebook: (CompactCodebook) The codebook holding the words
+        """
+
+        self.codebook = codebook
+
+    def __getitem__(self, word):
+        codebook = self.codebook
+        slots = codebook.slots
+        mask = len(slots) - 1
+
+        # Hashes of 0 mark empty slots, so 0 is stored as 1.
+        key = hash(word) or 1
+        position = key & mask
+
+        # Probe linearly until the hash or an empty slot turns up.
+        while True:
+            found = slots[position]
+            if found == key:
+                return codebook.keys[codebook.slot_buckets[position]]
+            if not found:
+                raise KeyError(word)
+            position = (position + 1) & mask
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+
+class CompactCodebook:
+    """Holds an encode table in a few flat arrays instead of Python objects.
+
+    Every word is stored once in a single UTF-8 blob, located through an
+    offsets array, and every bucket is a range of word numbers. Words are
+    found again through an open addressing table of their 64 bit hashes
+    with a parallel array of bucket numbers, rather than a dict of str. A
+    foreign word matching the full hash of a codebook word is as unlikely
+    as a SipHash collision, so matches are not checked against the blob.
+
+    The codebook indexes like the table it was made from, codebook[key]
+    giving a sequence of the bucket's words, and decode_table maps a word to
+    its key, so both work anywhere encode_table and decode_table do.
+    """
+
+    def __init__(self, buckets, keys):
+        """Packs a codebook
+
+        :param buckets: (list) The word list of every bucket
+        :param keys: (list) The character or symbol number of every bucket
+        """
+
+        self.keys = list(keys)
+        self.key_index = {key: number for number, key in enumerate(self.keys)}
+
+        blob = bytearray()
+        self.offsets = array('I', [0])
+        self.starts = array('I', [0])
+
+        # Append every word to the blob and note where it ends.
+        for bucket in buckets:
+            for word in bucket:
+                blob += word.encode('utf-8')
+                self.offsets.append(len(blob))
+            self.starts.append(len(self.offsets) - 1)
+
+        self.blob = bytes(blob)
+        self.build_index()
+
+    @classmethod
+    def from_table(cls, encode_table):
+        """Packs an encode table from build_tables or sixbit_tables
+
+        :param encode_table: (dict or list) The buckets keyed by character,
+            or listed in symbol order.
+        :return: (CompactCodebook) The packed codebook
+        """
+
+        if isinstance(encode_table, dict):
+            return cls(encode_table.values(), encode_table.keys())
+
+        return cls(encode_table, range(len(encode_table)))
+
+    def build_index(self):
+        """Builds the hash table used to look words up
+
+        The table uses Python's str hash, which differs between processes,
+        so it is rebuilt rather than pickled.
+
+        :return: Nothing, just sets the index arrays.
+        """
+
+        # Keep the table at most three quarters full so probes stay short.
+        size = 1
+        while 3 * size < 4 * (len(self.offsets) - 1):
+            size *= 2
+        mask = size - 1
+
+        self.slots = array('q', bytes(8 * size))
+        self.slot_buckets = array('H', bytes(2 * size))
+
+        for bucket in range(len(self.keys)):
+            for number in range(self.starts[bucket], self.starts[bucket + 1]):
+                key = hash(self.word(number)) or 1
+                position = key & mask
+                while self.slots[position]:
+                    position = (position + 1) & mask
+                self.slots[position] = key
+                self.slot_buckets[position] = bucket
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["slots"], state["slot_buckets"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.build_index()
+
+    def word(self, number):
+        """Returns a word by its number
+
+        :param number: (int) The number of the word
+        :return: (str) The word
+        """
+
+        return self.blob[self.offsets[number]:
+                         self.offsets[number + 1]].decode('utf-8')
+
+    def __getitem__(self, key):
+        number = self.key_index[key]
+        return BucketView(self, self.starts[number], self.starts[number + 1])
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def decode_table(self):
+        """The matching decode table, mapping a word to its bucket's key"""
+
+        return CompactDecodeTable(self)
+
+    @property
+    def nbytes(self):
+        """The number of bytes held by the blob and arrays"""
+
+        return len(self.blob) + sum(
+            values.itemsize * len(values)
+            for values in (self.offsets, self.starts, self.slots,
+                           self.slot_buckets))
+
+
+def compact_tables(encode_table):
+    """Packs an encode table into a CompactCodebook and its decode table
+
+    :param encode_table: (dict or list) The table from build_tables or
+        sixbit_tables
+    :return: The packed codebook, for encoding, and its decode table.
+    """
+
+    codebook = CompactCodebook.from_table(encode_table)
+    return codebook, codebook.decode_table
+
+
+def table_footprint(encrypt_list, decrypt_list):
+    """Estimates the memory held by a pair of tables
+
+    :param encrypt_list: The encode table from mode_tables or compact_tables
+    :param decrypt_list: The matching decode table
+    :return: (int) The estimated size in bytes
+    """
+
+    # Compact codebooks know their own size, the decode table is a view.
+    if isinstance(encrypt_list, CompactCodebook):
+        return encrypt_list.nbytes + sys.getsizeof(encrypt_list.key_index)
+
+    if isinstance(encrypt_list, dict):
+        buckets = encrypt_list.values()
+    else:
+        buckets = encrypt_list
+
+    # Both tables share the same word objects, count them once.
+    size = sys.getsizeof(encrypt_list) + sys.getsizeof(decrypt_list)
+    for bucket in buckets:
+        size += sys.getsizeof(bucket)
+        size += sum(sys.getsizeof(word) for word in bucket)
+
+    return size
+
+
+class CodebookRegistry:
+    """Keeps the tables of several wordlists in memory at once.
+
+    Tables are looked up by wordlist path, mode and key schedule. When their
+    estimated footprint goes over the budget the least recently used tables
+    are dropped, though the most recent one is always kept. A wordlist that
+    changes on disk is rebuilt on its next lookup.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_REGISTRY_MAX_BYTES, cache_dir=None,
+                 codebook="dict"):
+        """Creates an empty registry
+
+        :param max_bytes: (int) The memory budget for all tables together
+        :param cache_dir: (str) Directory for cached codebooks, None to
+            disable.
+        :param codebook: (str) How tables are held, 'dict' or 'compact'
+        """
+
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.codebook = codebook
+
+        # (signature, tables, size) by key, least recently used first
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(file_path, mode="base64", schedule=DEFAULT_SCHEDULE):
+        """Returns the key tables are registered under
+
+        :param file_path: (str) filepath for the base wordlist to be used.
+        :param mode: (str) The encoding mode, one of MODES
+        :param schedule: (int) The key schedule, one of SCHEDULES
+        :return: (tuple) The key
+        """
+
+        path = os.pathsep.join(os.path.abspath(part)
+                               for part in corpus_parts(file_path))
+        return path, mode, schedule
+
+    def get(self, file_path, mode="base64", schedule=DEFAULT_SCHEDULE,
+            signature=None):
+        """Returns the tables for a wordlist, building them on a miss
+
+        :param file_path: (str) filepath for the base wordlist to be used.
+        :param mode: (str) The encoding mode, one of MODES
+        :param schedule: (int) The key schedule, one of SCHEDULES
+        :param signature: (tuple) The wordlist's corpus_signature when the
+            caller already checked it, None to look it up.
+        :return: The encode and decode tables for the mode.
+        """
+
+        key = self.key(file_path, mode, schedule)
+        if signature is None:
+            signature = corpus_signature(file_path)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        tables = mode_tables(file_path, mode, self.cache_dir, schedule)
+        if self.codebook == "compact":
+            tables = compact_tables(tables[0])
+
+        self.add(key, tables, signature)
+        return tables
+
+    def add(self, key, tables, signature=None):
+        """Registers tables that were built elsewhere
+
+        :param key: (tuple) The key from CodebookRegistry.key
+        :param tables: The encode and decode tables
+        :param signature: (tuple) The wordlist's corpus_signature, None to
+            look it up.
+        :return: Nothing, just stores the tables and evicts others.
+        """
+
+        if signature is None:
+            signature = corpus_signature(key[0])
+
+        self.discard(key)
+
+        size = table_footprint(*tables)
+        self.entries[key] = (signature, tables, size)
+        self.nbytes += size
+
+        # Drop the least recently used tables until back under budget.
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def discard(self, key):
+        """Drops the tables under a key, if any
+
+        :param key: (tuple) The key from CodebookRegistry.key
+        :return: Nothing, just drops the tables.
+        """
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def counters(self):
+        """Returns the registry counters
+
+        :return: (dict) Hits, misses, evictions, tables held and their size
+        """
+
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "codebooks": len(self.entries),
+                "bytes": self.nbytes, "max_bytes": self.max_bytes}
+
+
+# Codebooks held by this process for the command line
+codebooks = CodebookRegistry()
+
+# Path that stands for standard input or standard output.
+STDIO_PATH = "-"
+
+
+def open_input(file_path):
+    """Opens a payload or ish file for binary reading
+
+    :param file_path: (str) The filepath, or STDIO_PATH for standard input
+    :return: A context manager giving a binary file object. Standard input
+        is left open when it exits.
+    """
+
+    if file_path == STDIO_PATH:
+        return contextlib.nullcontext(sys.stdin.buffer)
+
+    return open(file_path, 'rb')
+
+
+def open_output(save_path):
+    """Opens a file for binary writing
+
+    :param save_path: (str) The filepath, or STDIO_PATH for standard output
+    :return: A context manager giving a binary file object. Standard output
+        is flushed but left open when it exits.
+    """
+
+    if save_path == STDIO_PATH:
+        return flushing(sys.stdout.buffer)
+
+    return open(save_path, 'wb')
+
+
+@contextlib.contextmanager
+def replacing_output(save_path):
+    """Opens a file for binary writing that only appears once it is complete
+
+    The output goes to a temporary file next to save_path, which is renamed
+    over it when the block finishes and removed if the block raises, so a
+    failed run never leaves part of its output behind. Standard output and
+    anything else that is not a regular file, like a device or a pipe, are
+    written to directly.
+
+    :param save_path: (str) The filepath, or STDIO_PATH for standard output
+    :return: A binary file object using a yield statement
+    """
+
+    if save_path == STDIO_PATH or (os.path.exists(save_path)
+                                   and not os.path.isfile(save_path)):
+        with open_output(save_path) as save:
+            yield save
+        return
+
+    # Replace the file a symlink points to, not the symlink.
+    save_path = os.path.realpath(save_path)
+    temp_path = os.path.join(os.path.dirname(save_path), ".%s.%s.tmp"
+                             % (os.path.basename(save_path),
+                                os.urandom(4).hex()))
+
+    # Create it with the permissions open() would give the output.
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as save:
+            yield save
+        os.replace(temp_path, save_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+@contextlib.contextmanager
+def flushing(file):
+    """Gives a file object back and flushes it once the block is done
+
+    :param file: A file object that must stay open
+    :return: The file object using a yield statement
+    """
+
+    try:
+        yield file
+    finally:
+        file.flush()
+
+
+class CompressingReader:
+    """Reads a binary file as its compressed form, header first.
+
+    Wraps the payload before encoding so only the compressed bytes are
+    turned into words. The input is compressed a chunk at a time as reads
+    ask for more, so it is never held in memory whole.
+    """
+
+    def __init__(self, file, codec, chunk_size=BLOCK_SIZE):
+        """Creates the reader
+
+        :param file: A binary file object to read the payload from
+        :param codec: (str) The name of the codec, one of CODECS
+        :param chunk_size: (int) The number of payload bytes read at a time
+        """
+
+        codec_id, make_compressor, make_decompressor = CODECS[codec]
+
+        self.file = file
+        self.chunk_size = chunk_size
+        self.compressor = make_compressor()
+        self.buffer = bytearray(COMPRESSION_MAGIC)
+        self.buffer += bytes([COMPRESSION_VERSION, codec_id])
+        self.done = False
+
+    def read(self, size):
+        """Reads up to size compressed bytes
+
+        :param size: (int) The number of bytes wanted
+        :return: (bytes) size bytes, fewer only at the end, b'' once done
+        """
+
+        # Compress more of the payload until the read can be filled.
+        while len(self.buffer) < size and not self.done:
+            data = self.file.read(self.chunk_size)
+            with stats.stage("compress", len(data)):
+                if data:
+                    self.buffer += self.compressor.compress(data)
+                else:
+                    self.buffer += self.compressor.flush()
+                    self.done = True
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class DecompressingWriter:
+    """Writes the decompressed form of a compressed payload to a file.
+
+    Takes the decoded bytes as they are produced, reads the codec from the
+    header and decompresses a bounded amount at a time.
+    """
+
+    def __init__(self, file):
+        """Creates the writer
+
+        :param file: A binary file object to write the payload to
+        """
+
+        self.file = file
+        self.header = b''
+        self.codec = None
+        self.decompressor = None
+
+    def write(self, data):
+        """Decompresses and writes the next decoded bytes
+
+        :param data: (bytes) The next bytes of the compressed payload
+        :return: Nothing, just writes the decompressed bytes.
+        """
+
+        # Collect the header before anything can be decompressed.
+        if self.decompressor is None:
+            self.header += data
+            if len(self.header) < COMPRESSION_HEADER_SIZE:
+                return
+            data = self.start()
+
+        decompressor = self.decompressor
+
+        while not decompressor.eof:
+            with stats.stage("decompress") as stage:
+                chunk = decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)
+                stage.add(len(chunk))
+            self.file.write(chunk)
+
+            # Keep going while input is left over or output may be waiting.
+            if self.codec == "zlib":
+                data = decompressor.unconsumed_tail
+                more = bool(data) or len(chunk) == DECOMPRESS_CHUNK_SIZE
+            else:
+                data = b''
+                more = not decompressor.needs_input
+            if not more:
+                break
+
+        if data or decompressor.unused_data:
+            raise ValueError("Unexpected data after the compressed payload.")
+
+    def start(self):
+        """Reads the header and sets up the decompressor
+
+        :return: (bytes) The compressed bytes that followed the header
+        """
+
+        header = self.header[:COMPRESSION_HEADER_SIZE]
+        if header[:len(COMPRESSION_MAGIC)] != COMPRESSION_MAGIC:
+            raise ValueError("Payload is not compressed, decrypt it without "
+                             "--decompress.")
+        if header[-2] != COMPRESSION_VERSION:
+            raise ValueError("Unsupported compression version %d, expected "
+                             "%d." % (header[-2], COMPRESSION_VERSION))
+
+        for name, (codec_id, make_compressor, make_decompressor) \
+                in CODECS.items():
+            if codec_id == header[-1]:
+                self.codec = name
+                self.decompressor = make_decompressor()
+                return self.header[COMPRESSION_HEADER_SIZE:]
+
+        raise ValueError("Unknown compression codec id %d." % header[-1])
+
+    def finish(self):
+        """Checks the whole compressed payload was written
+
+        :return: Nothing, raises ValueError if it was cut short.
+        """
+
+        if self.decompressor is None or not self.decompressor.eof:
+            raise ValueError("Compressed payload is truncated.")
+
+
+class PaddedReader:
+    """Reads a binary file followed by an end marker and padding.
+
+    Wide mode packs bytes into words in whole groups, so the payload is
+    finished with a 0x80 byte and then zero bytes up to a whole group. The
+    decoder strips the zeros and the marker again.
+    """
+
+    def __init__(self, file, group):
+        """Creates the reader
+
+        :param file: A binary file object to read the payload from
+        :param group: (int) The byte length the padded payload must fill
+        """
+
+        self.file = file
+        self.group = group
+        self.length = 0
+        self.padding = None
+
+    def read(self, size):
+        """Reads up to size bytes, the padding once the file runs out
+
+        :param size: (int) The number of bytes wanted
+        :return: (bytes) The next bytes, b'' once done
+        """
+
+        if self.padding is None:
+            data = self.file.read(size)
+            if data:
+                self.length += len(data)
+                return data
+            self.padding = wide_padding(self.length, self.group)
+
+        data = self.padding[:size]
+        self.padding = self.padding[size:]
+        return data
+
+
+def read_aligned(file, block_size=BLOCK_SIZE, quantum=3):
+    """Yields blocks of a binary file whose lengths are multiples of quantum.
+
+    Only the final block may be shorter, so every block but the last
+    base64-encodes without any '=' padding.
+
+    :param file: A binary file object opened for reading
+    :param block_size: (int) The number of bytes to read per block
+    :param quantum: (int) The number of bytes every block is a multiple of
+    :return: The blocks using a yield statement
+    """
+
+    # Bytes left over from the previous read that did not fill a 3 byte group
+    carry = b''
+
+    while True:
+        with stats.stage("read") as stage:
+            data = file.read(block_size)
+            stage.add(len(data))
+        if not data:
+            break
+
+        # Put back whatever did not fit into the last block.
+        if carry:
+            data = carry + data
+
+        # Cut the block down to a whole number of groups.
+        cut = len(data) - len(data) % quantum
+        carry = data[cut:]
+        if cut:
+            yield data[:cut]
+
+    # Whatever is left becomes the final, padded block.
+    if carry:
+        yield carry
+
+
+class IndexWriter:
+    """Writes the sidecar seek index of an ish file as it is encoded.
+
+    Every block starts on a whole base64 quantum or wide group and on a
+    word, so any block start can be decoded without what came before it.
+    A checkpoint is recorded at the first block start after every interval
+    payload bytes.
+    """
+
+    def __init__(self, file, interval=DEFAULT_INDEX_INTERVAL):
+        """Creates the writer and writes the index header
+
+        :param file: A binary file object to write the index to
+        :param interval: (int) The number of payload bytes between
+            checkpoints
+        """
+
+        self.file = file
+        self.interval = interval
+
+        # Payload bytes encoded and ish bytes written so far
+        self.payload = 0
+        self.position = 0
+
+        # Size of the payload when padding was encoded after it, set by
+        # encrypt_stream for wide mode, None when every byte is payload
+        self.length = None
+
+        # Payload offset from which the next checkpoint is due
+        self.due = 0
+
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, interval))
+
+    def skip(self, ish_bytes):
+        """Accounts for words written that carry no payload, i.e. a header
+
+        :param ish_bytes: (bytes) The words written
+        :return: Nothing, just moves the ish offset on.
+        """
+
+        self.position += len(ish_bytes)
+
+    def add(self, separator, ish_bytes, size):
+        """Accounts for one block written, recording a checkpoint if due
+
+        :param separator: (bytes) Written before the block's words
+        :param ish_bytes: (bytes) The block's words
+        :param size: (int) The number of payload bytes in the block
+        :return: Nothing, just writes the checkpoint if one is due.
+        """
+
+        self.position += len(separator)
+
+        if self.payload >= self.due:
+            self.file.write(INDEX_ENTRY.pack(self.payload, self.position))
+            self.due = self.payload + self.interval
+
+        self.position += len(ish_bytes)
+        self.payload += size
+
+    def finish(self):
+        """Writes the closing pair holding the payload and ish file sizes
+
+        The wide end marker and padding are encoded like payload, but are
+        not counted in the payload size.
+
+        :return: Nothing, just finishes the index.
+        """
+
+        payload = self.payload if self.length is None else self.length
+        self.file.write(INDEX_ENTRY.pack(payload, self.position))
+
+
+def read_index(index_path):
+    """Reads a sidecar seek index written by IndexWriter
+
+    :param index_path: (str) The filepath of the index
+    :return: (list) The (payload offset, ish offset) pair of every
+        checkpoint, then the sizes of the payload and ish file.
+    """
+
+    with open(index_path, 'rb') as file:
+        data = file.read()
+
+    # Check the index is one this version can read.
+    if len(data) < INDEX_HEADER.size:
+        raise ValueError("%s is too short to be a seek index." % index_path)
+    magic, version, interval = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC:
+        raise ValueError("%s is not a seek index." % index_path)
+    if version != INDEX_VERSION:
+        raise ValueError("Unsupported seek index version %d, expected %d."
+                         % (version, INDEX_VERSION))
+
+    body = memoryview(data)[INDEX_HEADER.size:]
+    if not body or len(body) % INDEX_ENTRY.size:
+        raise ValueError("Seek index %s is truncated." % index_path)
+
+    return list(INDEX_ENTRY.iter_unpack(body))
+
+
+class BoundedReader:
+    """Reads no further than a set number of bytes of a binary file."""
+
+    def __init__(self, file, size):
+        """Creates the reader
+
+        :param file: A binary file object, positioned where reading starts
+        :param size: (int) The number of bytes that may be read
+        """
+
+        self.file = file
+        self.left = size
+
+    def read(self, size):
+        """Reads up to size bytes without passing the bound
+
+        :param size: (int) The number of bytes wanted
+        :return: (bytes) The next bytes, b'' once the bound is reached
+        """
+
+        data = self.file.read(min(size, self.left))
+        self.left -= len(data)
+        return data
+
+
+class SliceWriter:
+    """Passes on one slice of the bytes written to it, dropping the rest."""
+
+    def __init__(self, file, skip, count):
+        """Creates the writer
+
+        :param file: A binary file object to write the slice to
+        :param skip: (int) The number of bytes to drop before the slice
+        :param count: (int) The length of the slice
+        """
+
+        self.file = file
+        self.skip = skip
+        self.left = count
+
+    def write(self, data):
+        """Writes whatever part of data falls inside the slice
+
+        :param data: (bytes) The next bytes
+        :return: Nothing, just writes the part inside the slice.
+        """
+
+        if self.skip:
+            dropped = min(self.skip, len(data))
+            data = data[dropped:]
+            self.skip -= dropped
+
+        data = data[:self.left]
+        self.left -= len(data)
+        if data:
+            self.file.write(data)
+
+
+class UrandomDraws:
+    """Draws the random numbers words are picked with from os.urandom.
+
+    A whole block's worth of numbers comes from one os.urandom call, which
+    is far cheaper per symbol than a call into the random module, and needs
+    no seeding. Every encoder holds its own, so encoders running in separate
+    threads never share or reset any state.
+    """
+
+    def draws(self, count):
+        """Draws a batch of random numbers
+
+        :param count: (int) The number of draws
+        :return: (array) count random numbers of DRAW_BITS bits each
+        """
+
+        return array('Q', os.urandom(count * DRAW_BYTES))
+
+
+class SeededDraws:
+    """Draws reproducible random numbers from a seed, for tests and benchmarks.
+
+    The same seed always picks the same words, so this must never be used
+    for real messages.
+    """
+
+    def __init__(self, seed):
+        """Creates the generator
+
+        :param seed: (int, str or bytes) The seed
+        """
+
+        self.random = random.Random(seed)
+
+    def draws(self, count):
+        """Draws a batch of random numbers
+
+        :param count: (int) The number of draws
+        :return: (array) count random numbers of DRAW_BITS bits each
+        """
+
+        return array('Q', self.random.randbytes(count * DRAW_BYTES))
+
+
+class PythonEncoder:
+    """Maps symbol numbers to ish words one symbol at a time."""
+
+    def __init__(self, buckets, rng=None):
+        """Creates the encoder
+
+        :param buckets: (list) The word bucket for every symbol number
+        :param rng: (UrandomDraws or SeededDraws) Source of the random
+            numbers to pick words with, defaults to a new UrandomDraws.
+        """
+
+        self.buckets = buckets
+        self.sizes = [len(bucket) for bucket in buckets]
+        self.rng = rng if rng is not None else UrandomDraws()
+
+    def __call__(self, symbols):
+        """Encodes a block of symbols
+
+        :param symbols: (bytes) One symbol number per byte
+        :return: (str) The ish words for the block, separated by spaces
+        """
+
+        buckets = self.buckets
+        sizes = self.sizes
+
+        # For each symbol, pick a random word from all words that are
+        # associated with that symbol. Scaling a draw by the bucket size
+        # and keeping the top bits gives an index with a bias far too small
+        # to ever measure.
+        with stats.stage("encode", len(symbols)):
+            draws = self.rng.draws(len(symbols))
+            ish_list = [buckets[symbol][(draw * sizes[symbol]) >> DRAW_BITS]
+                        for symbol, draw in zip(symbols, draws)]
+
+        # Cast the encoded block back into a string.
+        with stats.stage("join"):
+            return ' '.join(ish_list)
+
+
+class NumpyEncoder:
+    """Maps symbol numbers to ish words with vectorized NumPy operations.
+
+    The buckets are flattened into one array of words with the start and
+    size of every bucket, so a whole block is encoded with a handful of
+    array operations instead of a Python loop over every symbol.
+    """
+
+    def __init__(self, buckets, rng=None):
+        """Creates the encoder
+
+        :param buckets: (list) The word bucket for every symbol number
+        :param rng: (numpy.random.Generator) Random number generator to pick
+            words with, defaults to a freshly seeded one.
+        """
+
+        flat_words = []
+        starts = []
+        sizes = []
+
+        for bucket in buckets:
+            starts.append(len(flat_words))
+            sizes.append(len(bucket))
+            flat_words.extend(bucket)
+
+        self.words = np.array(flat_words, dtype=object)
+        self.starts = np.array(starts, dtype=np.intp)
+        self.sizes = np.array(sizes, dtype=np.intp)
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def __call__(self, symbols):
+        """Encodes a block of symbols
+
+        :param symbols: (bytes or array) One symbol number per item
+        :return: (str) The ish words for the block, separated by spaces
+        """
+
+        with stats.stage("encode", len(symbols)):
+            symbols = np.asarray(memoryview(symbols))
+
+            # Draw one random offset per symbol, scaled to its bucket size.
+            offsets = self.rng.random(len(symbols)) * self.sizes[symbols]
+
+            # Gather the chosen words.
+            chosen = self.words[self.starts[symbols]
+                                + offsets.astype(np.intp)]
+
+        # Join them in one go.
+        with stats.stage("join"):
+            return ' '.join(chosen.tolist())
+
+
+# Encode engines selectable with --engine
+ENGINES = {"python": PythonEncoder, "numpy": NumpyEncoder}
+
+
+def make_rng(engine="python", seed=None):
+    """Creates a random number generator of the kind an engine picks with
+
+    :param engine: (str) One of the names in ENGINES
+    :param seed: Seed for reproducible output in tests, None to draw from
+        the operating system.
+    :return: A new generator for make_encoder
+    """
+
+    if engine == "numpy" and np is not None:
+        return np.random.default_rng(seed)
+
+    if seed is None:
+        return UrandomDraws()
+
+    return SeededDraws(seed)
+
+
+def make_encoder(buckets, engine="python", rng=None):
+    """Creates the encoder for an engine, falling back to pure Python.
+
+    :param buckets: (list) The word bucket for every symbol number
+    :param engine: (str) One of the names in ENGINES
+    :param rng: Random number generator from make_rng, None for a new one
+        drawing from the operating system
+    :return: A callable turning symbol numbers into a string of ish words
+    """
+
+    # The NumPy engine can only be used when NumPy is installed.
+    if engine == "numpy" and np is None:
+        engine = "python"
+        rng = None
+
+    return ENGINES[engine](buckets, rng)
+
+
+def mode_buckets(encrypt_list, mode="base64"):
+    """Orders an encode table as a list of buckets indexed by symbol number
+
+    :param encrypt_list: The encode table for the mode from mode_tables
+    :param mode: (str) The encoding mode, one of MODES
+    :return: (list) The word bucket for every symbol number
+    """
+
+    # Sixbit and wide buckets are already indexed by symbol.
+    if mode in HEADER_MODES:
+        return [encrypt_list[symbol] for symbol in range(len(encrypt_list))]
+
+    return [encrypt_list[character] for character in base_chars]
+
+
+def mode_quantum(mode="base64", bits=6):
+    """Returns the number of payload bytes blocks are cut in multiples of
+
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word
+    :return: (int) The byte length of a whole group of symbols
+    """
+
+    if mode == "wide":
+        return wide_group(bits)
+
+    return 3
+
+
+def header_symbols(mode="base64", bits=6):
+    """Returns the version symbol a file of a mode starts with
+
+    :param mode: (str) The encoding mode, one of HEADER_MODES
+    :param bits: (int) The bits carried per word
+    :return: The symbol, ready to pass to an encoder
+    """
+
+    if mode == "wide":
+        return array('H', [WIDE_VERSION << 5 | bits])
+
+    return bytes([SIXBIT_VERSION])
+
+
+def decode_bits(decrypt_list, mode="base64"):
+    """Returns the bits every word of a decode table carries
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param mode: (str) The encoding mode, one of MODES
+    :return: (int) The bits per word
+    """
+
+    if mode != "wide":
+        return 6
+
+    # Compact tables know their number of buckets, a dict holds the highest
+    # symbol among its values.
+    codebook = getattr(decrypt_list, "codebook", None)
+    if codebook is not None:
+        return len(codebook).bit_length() - 1
+
+    return max(decrypt_list.values()).bit_length()
+
+
+def empty_symbols(mode="base64"):
+    """Returns an empty run of decoded symbols, before any words arrive
+
+    :param mode: (str) The encoding mode, one of MODES
+    :return: (bytes or array) Nothing left pending yet
+    """
+
+    if mode == "wide":
+        return array('H')
+
+    return b''
+
+
+def unpack_symbols(block, bits):
+    """Cuts whole groups of payload bytes into wide symbols
+
+    Rather than looping over every group, the three bytes each symbol lies
+    in are copied into a lane of their own with slice assignments, and the
+    whole block is turned into one integer. Shifting and masking that
+    integer once per symbol of a group then cuts out every symbol of the
+    block at the same time.
+
+    :param block: (bytes) Payload bytes, a whole number of groups
+    :param bits: (int) The bits carried per word
+    :return: (array) The symbol numbers
+    """
+
+    group, layout = wide_layout(bits)
+    count = len(layout)
+    groups = len(block) // group
+    step = WIDE_LANE * count
+
+    # Copy the bytes of every symbol into its lane.
+    lanes = bytearray(step * groups)
+    for lane, (first, shift) in enumerate(layout):
+        for offset in range(min(WIDE_LANE, group - first)):
+            lanes[WIDE_LANE * lane + offset::step] = \
+                block[first + offset::group]
+
+    # Bring every symbol down to the bottom of its lane.
+    value = int.from_bytes(lanes, 'big')
+    symbols = 0
+    for lane, (first, shift) in enumerate(layout):
+        symbols |= value >> shift & lane_mask(bits, lane, count, groups)
+
+    # The bottom two bytes of every lane hold a big endian symbol.
+    lanes = symbols.to_bytes(len(lanes), 'big')
+    pairs = bytearray(2 * count * groups)
+    pairs[0::2] = lanes[1::WIDE_LANE]
+    pairs[1::2] = lanes[2::WIDE_LANE]
+
+    symbols = array('H', pairs)
+    if sys.byteorder == "little":
+        symbols.byteswap()
+
+    return symbols
+
+
+def pack_symbols(symbols, bits):
+    """Packs whole groups of wide symbols back into payload bytes
+
+    The reverse of unpack_symbols, every symbol is put in a lane of its own
+    and shifted up to its place in one go, then the lanes are copied back
+    into the bytes they cover.
+
+    :param symbols: (array) Symbol numbers, a whole number of groups
+    :param bits: (int) The bits carried per word
+    :return: (bytes) The bytes the symbols carry
+    """
+
+    group, layout = wide_layout(bits)
+    count = len(layout)
+    groups = len(symbols) // count
+    step = WIDE_LANE * count
+
+    # Put every big endian symbol in the bottom two bytes of its lane.
+    pairs = array('H', symbols)
+    if sys.byteorder == "little":
+        pairs.byteswap()
+    pairs = pairs.tobytes()
+    lanes = bytearray(WIDE_LANE * len(symbols))
+    lanes[1::WIDE_LANE] = pairs[0::2]
+    lanes[2::WIDE_LANE] = pairs[1::2]
+    value = int.from_bytes(lanes, 'big')
+
+    # Shift every symbol up to its place, then merge its bytes into the
+    # group, sharing bytes with its neighbours.
+    data = 0
+    for lane, (first, shift) in enumerate(layout):
+        placed = (value & lane_mask(bits, lane, count, groups)) << shift
+        placed = placed.to_bytes(len(lanes), 'big')
+        merged = bytearray(group * groups)
+        for offset in range(min(WIDE_LANE, group - first)):
+            merged[first + offset::group] = \
+                placed[WIDE_LANE * lane + offset::step]
+        data |= int.from_bytes(merged, 'big')
+
+    return data.to_bytes(group * groups, 'big')
+
+
+def block_symbols(block, mode="base64", bits=6):
+    """Casts a block of payload bytes to one symbol number per item
+
+    :param block: (bytes) Payload bytes, a whole number of groups unless
+        last
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: (bytes or array) The symbol numbers for the block
+    """
+
+    # Cut every group of a wide block into words of the chosen width.
+    if mode == "wide":
+        with stats.stage("symbols", len(block)):
+            return unpack_symbols(block, bits)
+
+    # Cast the block to base64, then to one symbol number per byte.
+    with stats.stage("symbols", len(block)):
+        base_bytes = base64.b64encode(block)
+        if mode == "sixbit":
+            base_bytes = base_bytes.rstrip(b'=')
+
+        return base_bytes.translate(BASE64_SYMBOLS)
+
+
+# Encoder of the current worker process, set up by init_encode_worker
+worker_encoder = None
+
+
+def init_encode_worker(buckets, engine, mode):
+    """Sets up a worker process for encrypt_stream_parallel
+
+    Every worker gets its own random number generator, so workers never
+    share random state.
+
+    :param buckets: (list) The word bucket for every symbol number
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param mode: (str) The encoding mode, one of MODES
+    :return: Nothing, just stores the encoder for encode_piece.
+    """
+
+    global worker_encoder
+
+    bits = len(buckets).bit_length() - 1
+    worker_encoder = (make_encoder(buckets, engine), mode, bits)
+
+
+def encode_piece(block):
+    """Encodes one piece of the payload inside a worker process
+
+    :param block: (bytes) Payload bytes, a whole number of groups unless
+        last
+    :return: (bytes) The UTF-8 encoded ish words for the piece
+    """
+
+    encoder, mode, bits = worker_encoder
+    return encoder(block_symbols(block, mode, bits)).encode("utf-8")
+
+
+def encrypt_stream_parallel(buckets, in_file, out_file, workers,
+                            engine="python", mode="base64",
+                            block_size=WORKER_BLOCK_SIZE, separator=b'',
+                            index=None):
+    """Encrypts a binary stream with a pool of worker processes.
+
+    The payload is cut into pieces on 3 byte boundaries, so every piece
+    base64-encodes on its own. Pieces are encoded concurrently and their
+    words are written back in order. Only a bounded number of pieces is in
+    flight at once, which keeps memory flat for any input size.
+
+    :param buckets: (list) The word bucket for every symbol number
+    :param in_file: A binary file object to read the payload from
+    :param out_file: A binary file object to write the encoded words to
+    :param workers: (int) The number of worker processes
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param mode: (str) The encoding mode, one of MODES
+    :param block_size: (int) The number of payload bytes per piece
+    :param separator: (bytes) Written before the first piece, b' ' when
+        words have already been written.
+    :param index: (IndexWriter) Records checkpoints of the pieces, None
+        to write no index.
+    :return: Nothing, just writes the encoded words.
+    """
+
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_encode_worker,
+            initargs=(buckets, engine, mode)) as pool:
+
+        # Pieces being encoded with their payload sizes, oldest first.
+        in_flight = collections.deque()
+
+        quantum = mode_quantum(mode, len(buckets).bit_length() - 1)
+        for block in read_aligned(in_file, block_size, quantum):
+            in_flight.append((len(block), pool.submit(encode_piece, block)))
+
+            # Write the oldest piece once enough work is queued.
+            if len(in_flight) >= 2 * workers:
+                write_piece(out_file, separator, in_flight.popleft(), index)
+                separator = b' '
+
+        # Write whatever is still in flight.
+        while in_flight:
+            write_piece(out_file, separator, in_flight.popleft(), index)
+            separator = b' '
+
+
+def write_piece(out_file, separator, piece, index=None):
+    """Waits for an encoded piece and writes it.
+
+    :param out_file: A binary file object to write the encoded words to
+    :param separator: (bytes) Written before the piece
+    :param piece: (tuple) The payload size of the piece and the future of
+        its encode_piece call
+    :param index: (IndexWriter) Records a checkpoint for the piece, None to
+        write no index.
+    :return: Nothing, just writes the encoded words.
+    """
+
+    size, future = piece
+
+    with stats.stage("workers"):
+        ish_bytes = future.result()
+
+    with stats.stage("write", len(ish_bytes)):
+        out_file.write(separator)
+        out_file.write(ish_bytes)
+
+    if index is not None:
+        index.add(separator, ish_bytes, size)
+
+
+def encrypt_stream(encrypt_list, in_file, out_file, block_size=BLOCK_SIZE,
+                   engine="python", mode="base64", workers=1, rng=None,
+                   index=None):
+    """Encrypts a binary stream block by block using ish.
+
+    Only one block of the payload is held in memory at a time. The words are
+    written with single spaces between them, exactly as encrypt() always
+    has, so the output is identical in format to a one-shot encode.
+
+    In both modes a block becomes one byte per 6 bit symbol by translating
+    its base64 form, which runs in C rather than hashing every character.
+    The sixbit stream starts with a SIXBIT_VERSION symbol and drops the '='
+    padding, the length of its final quantum gives the trailing byte count.
+    The wide stream starts with a symbol holding WIDE_VERSION and its width,
+    and packs the payload's bits straight into words, finished with an end
+    marker byte and zero padding to a whole group.
+
+    :param encrypt_list: The encode table for the mode from mode_tables
+    :param in_file: A binary file object to read the payload from
+    :param out_file: A binary file object to write the encoded words to
+    :param block_size: (int) The number of payload bytes encoded per block
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param mode: (str) The encoding mode, one of MODES
+    :param workers: (int) The number of worker processes, 1 to encode in
+        this process.
+    :param rng: Random number generator from make_rng to pick words with,
+        None for a new one. Worker processes always create their own.
+    :param index: (IndexWriter) Records checkpoints as blocks are written,
+        None to write no index.
+    :return: Nothing, just writes the encoded words.
+    """
+
+    buckets = mode_buckets(encrypt_list, mode)
+    encoder = make_encoder(buckets, engine, rng)
+    bits = len(buckets).bit_length() - 1
+
+    # The first block has nothing before it to separate from.
+    separator = b''
+
+    # Sixbit and wide files start with their version symbol.
+    if mode in HEADER_MODES:
+        header = encoder(header_symbols(mode, bits)).encode("utf-8")
+        out_file.write(header)
+        if index is not None:
+            index.skip(header)
+        separator = b' '
+
+    # Wide payloads are finished off with their end marker.
+    if mode == "wide":
+        in_file = PaddedReader(in_file, wide_group(bits))
+
+    if workers > 1:
+        encrypt_stream_parallel(buckets, in_file, out_file, workers, engine,
+                                mode, separator=separator, index=index)
+    else:
+        for block in read_aligned(in_file, block_size,
+                                  mode_quantum(mode, bits)):
+            ish_string = encoder(block_symbols(block, mode, bits))
+
+            # Save the block, continuing the word stream from the last one.
+            with stats.stage("write") as stage:
+                ish_bytes = ish_string.encode("utf-8")
+                out_file.write(separator)
+                out_file.write(ish_bytes)
+                stage.add(len(ish_bytes))
+            if index is not None:
+                index.add(separator, ish_bytes, len(block))
+            separator = b' '
+
+    # The index records the payload without its end marker and padding.
+    if index is not None and mode == "wide":
+        index.length = in_file.length
+
+
+def encrypt(encrypt_list, file_path, save_path, block_size=BLOCK_SIZE,
+            engine="python", mode="base64", workers=1, compress=None,
+            rng=None, index_path=None, index_interval=DEFAULT_INDEX_INTERVAL,
+            checkpoint_path=None, resume=False):
+    """Function to encrypt a file using ish.
+
+    :param encrypt_list: The encode table for the mode from mode_tables
+    :param file_path: The filepath for the file to be encrypted, or
+        STDIO_PATH to read standard input
+    :param save_path: The filepath for the encrypted file to be saved to, or
+        STDIO_PATH to write standard output
+    :param block_size: (int) The number of payload bytes encoded per block
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param mode: (str) The encoding mode, one of MODES
+    :param workers: (int) The number of worker processes to encode with
+    :param compress: (str) Codec from CODECS to compress the payload with
+        before encoding, None to encode it as is.
+    :param rng: Random number generator from make_rng to pick words with,
+        None for a new one drawing from the operating system.
+    :param index_path: (str) Where to write a sidecar seek index for
+        decrypt_range, None to write none.
+    :param index_interval: (int) The number of payload bytes between index
+        checkpoints
+    :param checkpoint_path: (str) Where to save checkpoints the run can be
+        resumed from, None for a run that cannot be resumed. Resumable runs
+        encode real files in this process, without compression or index.
+    :param resume: (bool) Whether to continue from the checkpoint, if any
+
+    :return: Nothing, just saves encrypted file.
+    """
+
+    # Resumable runs save checkpoints of how far they have got.
+    if checkpoint_path is not None:
+        if compress or index_path is not None or workers > 1 \
+                or STDIO_PATH in (file_path, save_path):
+            raise ValueError("A resumable run cannot compress, write an "
+                             "index, use workers or standard input/output.")
+        encrypt_resumable(encrypt_list, file_path, save_path, checkpoint_path,
+                          block_size, engine, mode, resume)
+        return
+
+    # Offsets into a compressed payload say nothing about the original.
+    if index_path is not None and compress:
+        raise ValueError("A seek index cannot be written for a compressed "
+                         "payload.")
+
+    index_file = (open(index_path, 'wb') if index_path is not None
+                  else contextlib.nullcontext())
+
+    # Stream the file to be encrypted as bytecode into the resulting file.
+    with open_input(file_path) as file, open_output(save_path) as save, \
+            index_file:
+        # Progress is counted in payload bytes, before any compression.
+        if progress.enabled:
+            progress.start("encode", file_size(file))
+            file = ProgressReader(file)
+        if compress:
+            file = CompressingReader(file, compress)
+
+        index = None
+        if index_path is not None:
+            index = IndexWriter(index_file, index_interval)
+
+        encrypt_stream(encrypt_list, file, save, block_size, engine, mode,
+                       workers, rng, index)
+
+        if index is not None:
+            index.finish()
+
+    progress.finish()
+
+
+def words_base64(decrypt_list, ish_bytes, mode="base64"):
+    """Casts a run of whole ish words to the base64 text they stand for.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param ish_bytes: (bytes) Space separated words, cut on a word boundary
+    :param mode: (str) The encoding mode, one of MODES
+    :return: (bytes) The base64 encoded bytecode, one character per word.
+        In wide mode an array of the symbol numbers the words stand for.
+    """
+
+    with stats.stage("word split", len(ish_bytes)):
+        ish_list = ish_bytes.decode("utf-8").split(" ")
+
+    # Cast the ish words to the base64 encoded bytecode they stand for.
+    with stats.stage("lookup"):
+        if mode == "sixbit":
+            symbols = bytes([decrypt_list[word] for word in ish_list])
+            return symbols.translate(SYMBOLS_BASE64)
+
+        if mode == "wide":
+            return array('H', [decrypt_list[word] for word in ish_list])
+
+        base_string = ''.join([decrypt_list[word] for word in ish_list])
+        return base_string.encode("ascii")
+
+
+def write_quanta(base_bytes, out_file, mode="base64", bits=6):
+    """Decodes and writes every whole 4 character base64 quantum.
+
+    In wide mode whole groups of symbols are packed and written instead,
+    always holding back the last whole group, as it may hold the end
+    marker and padding.
+
+    :param base_bytes: (bytes) base64 encoded bytecode, or wide symbols
+    :param out_file: A binary file object to write the decoded bytes to
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: (bytes) The base64 characters that do not yet fill a 4
+        character quantum, to be passed back in with the next run.
+    """
+
+    if mode == "wide":
+        count = len(wide_layout(bits)[1])
+        cut = max(0, len(base_bytes) - count)
+        cut -= cut % count
+        if cut:
+            with stats.stage("unpack", cut):
+                data = pack_symbols(base_bytes[:cut], bits)
+            with stats.stage("write", len(data)):
+                out_file.write(data)
+        return base_bytes[cut:]
+
+    # Only whole 4 character quanta can be decoded on their own.
+    cut = len(base_bytes) - len(base_bytes) % 4
+    if cut:
+        with stats.stage("base64 decode", cut):
+            data = base64.b64decode(base_bytes[:cut])
+        with stats.stage("write", len(data)):
+            out_file.write(data)
+
+    return base_bytes[cut:]
+
+
+def finish_quanta(pending, out_file, mode="base64", bits=6):
+    """Decodes and writes the base64 characters left at the end of a file.
+
+    :param pending: (bytes) The characters left over by write_quanta
+    :param out_file: A binary file object to write the decoded bytes to
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: Nothing, just writes the decoded bytes.
+    """
+
+    # Wide payloads end with a marker byte and zero padding to strip.
+    if mode == "wide":
+        if len(pending) % len(wide_layout(bits)[1]):
+            raise ValueError("Wide payload does not end on a whole group.")
+        data = pack_symbols(pending, bits).rstrip(b'\x00')
+        if not data.endswith(b'\x80'):
+            raise ValueError("Wide payload is missing its end marker.")
+        out_file.write(data[:-1])
+        return
+
+    if not pending:
+        return
+
+    # The unpadded final sixbit quantum gets its padding back.
+    if mode == "sixbit":
+        pending += b'=' * (-len(pending) % 4)
+
+    # A well formed base64 file always ends on a whole quantum. Let base64
+    # raise its usual padding error for anything else.
+    out_file.write(base64.b64decode(pending))
+
+
+def decode_words(decrypt_list, ish_bytes, pending, out_file, mode="base64",
+                 bits=6):
+    """Decodes a run of whole ish words and writes the bytes they carry.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param ish_bytes: (bytes) Space separated words, cut on a word boundary
+    :param pending: (bytes) base64 characters left over from the last run
+    :param out_file: A binary file object to write the decoded bytes to
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: (bytes) The base64 characters that do not yet fill a 4
+        character quantum, to be passed back in with the next run.
+    """
+
+    base_bytes = words_base64(decrypt_list, ish_bytes, mode)
+    return write_quanta(pending + base_bytes, out_file, mode, bits)
+
+
+def decrypt_stream(decrypt_list, in_file, out_file, block_size=BLOCK_SIZE,
+                   mode="base64", header=True, finish=True, pending=None,
+                   on_block=None):
+    """Decrypts a binary stream of ish words block by block.
+
+    Blocks are cut at the last space they contain, the word that straddles
+    the cut is carried into the next block, and base64 is decoded in whole
+    quanta as it arrives. Memory stays bounded by the block size.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param in_file: A binary file object to read the ish words from
+    :param out_file: A binary file object to write the decoded bytes to
+    :param block_size: (int) The number of ish bytes read per block
+    :param mode: (str) The encoding mode, one of MODES
+    :param header: (bool) Whether in_file starts with the header word of a
+        sixbit or wide file, False when it starts at an index checkpoint.
+    :param finish: (bool) Whether in_file runs to the end of the payload,
+        False when it stops just before an index checkpoint.
+    :param pending: (bytes) base64 characters, or wide symbols, left over
+        from where an interrupted run stopped, None for none
+    :param on_block: Called after every block with the number of ish bytes
+        decoded so far and the characters still pending, None for no calls.
+    :return: Nothing, just writes the decoded bytes.
+    """
+
+    # Word cut off at the end of the previous block
+    partial = b''
+
+    if pending is None:
+        pending = empty_symbols(mode)
+    bits = decode_bits(decrypt_list, mode)
+
+    # Number of ish bytes read so far
+    consumed = 0
+
+    # The header word has not been checked yet.
+    header = header and mode in HEADER_MODES
+
+    # An empty file holds no words at all, not a single empty word.
+    empty = True
+
+    while True:
+        with stats.stage("read") as stage:
+            data = in_file.read(block_size)
+            stage.add(len(data))
+        if not data:
+            break
+        empty = False
+        consumed += len(data)
+
+        # Rejoin the word that was cut off by the previous block.
+        if partial:
+            data = partial + data
+
+        # Check the version symbol before decoding anything after it.
+        if header:
+            cut = data.find(b' ')
+            if cut < 0:
+                partial = data
+                continue
+            check_header(decrypt_list, data[:cut], mode, bits)
+            data = data[cut + 1:]
+            header = False
+
+        # Decode every whole word, hold back the one that may be cut off.
+        cut = data.rfind(b' ')
+        if cut < 0:
+            partial = data
+            continue
+        partial = data[cut + 1:]
+        pending = decode_words(decrypt_list, data[:cut], pending, out_file,
+                               mode, bits)
+
+        # Everything before the held back word is now decoded.
+        if on_block is not None:
+            on_block(consumed - len(partial), pending)
+
+    if empty:
+        return
+
+    # A file holding nothing but the header decodes to nothing.
+    if header:
+        check_header(decrypt_list, partial, mode, bits)
+        return
+
+    # The last word ends with the file.
+    pending = decode_words(decrypt_list, partial, pending, out_file, mode,
+                           bits)
+
+    # A checkpoint falls on a whole group, so the wide symbols held back
+    # are whole bytes of payload rather than the end marker.
+    if not finish:
+        if mode == "wide" and pending:
+            out_file.write(pack_symbols(pending, bits))
+        return
+
+    finish_quanta(pending, out_file, mode, bits)
+
+
+def check_header(decrypt_list, word, mode="sixbit", bits=6):
+    """Checks the version symbol that starts a sixbit or wide file.
+
+    :param decrypt_list: (dict) The decode table for the mode
+    :param word: (bytes) The first word of the file
+    :param mode: (str) The encoding mode, one of HEADER_MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: Nothing, raises ValueError for an unsupported version.
+    """
+
+    version = decrypt_list[word.decode("utf-8")]
+
+    # The wide symbol also records the width it was written with.
+    if mode == "wide":
+        if version != WIDE_VERSION << 5 | bits:
+            raise ValueError("Unsupported wide header %d, expected version "
+                             "%d at %d bits." % (version, WIDE_VERSION, bits))
+        return
+
+    if version != SIXBIT_VERSION:
+        raise ValueError("Unsupported sixbit version %d, expected %d."
+                         % (version, SIXBIT_VERSION))
+
+
+def find_space(file, position):
+    """Finds the first space at or after a position in a binary file.
+
+    :param file: A seekable binary file object
+    :param position: (int) The byte offset to start looking from
+    :return: (int) The byte offset of the space, or -1 if there is none.
+    """
+
+    file.seek(position)
+
+    while True:
+        data = file.read(64 * 1024)
+        if not data:
+            return -1
+
+        found = data.find(b' ')
+        if found >= 0:
+            return position + found
+
+        position += len(data)
+
+
+def word_ranges(file, start, end, piece_size=WORKER_DECODE_SIZE):
+    """Cuts part of an ish file into byte ranges that hold whole words.
+
+    Every range runs up to, but not including, the space that separates it
+    from the next range, so splitting each range on spaces gives exactly the
+    words of the file in order.
+
+    :param file: A seekable binary file object holding ish words
+    :param start: (int) The byte offset of the first word
+    :param end: (int) The byte offset the last word ends at
+    :param piece_size: (int) The approximate number of bytes per range
+    :return: (begin, end) byte offsets using a yield statement
+    """
+
+    begin = start
+
+    while True:
+        # The rest of the file fits in one range.
+        if begin + piece_size >= end:
+            yield begin, end
+            return
+
+        # Cut at the first space past the target size.
+        cut = find_space(file, begin + piece_size)
+        if cut < 0 or cut >= end:
+            yield begin, end
+            return
+
+        yield begin, cut
+        begin = cut + 1
+
+
+# Decode table of the current worker process, set up by init_decode_worker
+worker_decoder = None
+
+
+def init_decode_worker(decrypt_list, mode):
+    """Sets up a worker process for decrypt_file_parallel
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param mode: (str) The encoding mode, one of MODES
+    :return: Nothing, just stores the table for decode_range.
+    """
+
+    global worker_decoder
+
+    worker_decoder = (decrypt_list, mode)
+
+
+def decode_range(file_path, begin, end):
+    """Casts one byte range of an ish file to base64 inside a worker process
+
+    :param file_path: The filepath for the file to be decrypted
+    :param begin: (int) The byte offset of the first word in the range
+    :param end: (int) The byte offset the last word in the range ends at
+    :return: (bytes) The base64 encoded bytecode for the range
+    """
+
+    decrypt_list, mode = worker_decoder
+
+    with open(file_path, 'rb') as file:
+        file.seek(begin)
+        ish_bytes = file.read(end - begin)
+
+    return words_base64(decrypt_list, ish_bytes, mode)
+
+
+def decrypt_file_parallel(decrypt_list, file_path, out_file, workers,
+                          mode="base64", piece_size=WORKER_DECODE_SIZE):
+    """Decrypts an ish file with a pool of worker processes.
+
+    The file is cut into byte ranges at spaces and every range is cast to
+    base64 in a worker. The base64 streams are stitched back together in
+    order, re-aligned to whole 4 character quanta and decoded here.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param file_path: The filepath for the file to be decrypted
+    :param out_file: A binary file object to write the decoded bytes to
+    :param workers: (int) The number of worker processes
+    :param mode: (str) The encoding mode, one of MODES
+    :param piece_size: (int) The approximate number of ish bytes per range
+    :return: Nothing, just writes the decoded bytes.
+    """
+
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+
+        # An empty file holds no words at all, not a single empty word.
+        if size == 0:
+            return
 
+        start = 0
+        bits = decode_bits(decrypt_list, mode)
 
-# A list of valid characters in base64
-base_chars = list(s.ascii_letters + s.digits + "+" + "/" + "=")
+        # Check the version symbol and start after it.
+        if mode in HEADER_MODES:
+            cut = find_space(file, 0)
+            file.seek(0)
+            check_header(decrypt_list, file.read(size if cut < 0 else cut),
+                         mode, bits)
+            if cut < 0:
+                return
+            start = cut + 1
 
+        progress.start("decode", size, start)
 
-# Code below from following site
-# https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
-def divide_chunks(list_to_chunk, n):
-    """Yields successive n-sized chunks from list list_to_chunk
+        with concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=init_decode_worker,
+                initargs=(decrypt_list, mode)) as pool:
 
-    :param list_to_chunk: (list) A list to be chunked
-    :param n: (int) The number of elements to be put into each chunk
-    :return: The chunks of equal size using a yield statement
+            # Ranges being decoded with where they end, oldest first.
+            in_flight = collections.deque()
+
+            # base64 characters still waiting on the rest of their quantum
+            pending = empty_symbols(mode)
+
+            for begin, end in word_ranges(file, start, size, piece_size):
+                in_flight.append((end, pool.submit(decode_range, file_path,
+                                                   begin, end)))
+
+                # Stitch in the oldest range once enough work is queued.
+                if len(in_flight) >= 2 * workers:
+                    end, future = in_flight.popleft()
+                    pending = stitch_range(pending, future, out_file, mode,
+                                           bits)
+                    progress.update(end)
+
+            # Stitch in whatever is still in flight.
+            while in_flight:
+                end, future = in_flight.popleft()
+                pending = stitch_range(pending, future, out_file, mode, bits)
+                progress.update(end)
+
+    finish_quanta(pending, out_file, mode, bits)
+
+
+def stitch_range(pending, future, out_file, mode="base64", bits=6):
+    """Waits for a decoded range and decodes its whole base64 quanta.
+
+    :param pending: (bytes) base64 characters left over from the last range
+    :param future: The future of a decode_range call
+    :param out_file: A binary file object to write the decoded bytes to
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: (bytes) The base64 characters left over from this range
     """
 
-    # Yield each chunk.
-    for x in range(0, len(list_to_chunk), n):
-        yield list_to_chunk[x:x + n]
+    with stats.stage("workers"):
+        base_bytes = future.result()
 
+    return write_quanta(pending + base_bytes, out_file, mode, bits)
 
-def wordlistgen(file_path):
-    """Generates an encode and decode table out of a list of mixed words
 
-    :param file_path: (str) filepath for the base wordlist to be used.
-    :return:  Two lists, one for encoding, one for decoding.
+def decrypt(decrypt_list, file_path, save_path, block_size=BLOCK_SIZE,
+            mode="base64", workers=1, decompress=False, checkpoint_path=None,
+            resume=False):
+    """Function to decrypt a file using ish.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param file_path: The filepath for the file to be decrypted, or
+        STDIO_PATH to read standard input
+    :param save_path: The filepath for the decrypted file to be saved to, or
+        STDIO_PATH to write standard output
+    :param block_size: (int) The number of ish bytes read per block
+    :param mode: (str) The encoding mode, one of MODES
+    :param workers: (int) The number of worker processes to decode with.
+        Standard input cannot be split into ranges, so it is always decoded
+        in this process.
+    :param decompress: (bool) Whether the payload was compressed by
+        encrypt, the codec is read from its header.
+    :param checkpoint_path: (str) Where to save checkpoints the run can be
+        resumed from, None for a run that cannot be resumed. Resumable runs
+        decode real files in this process, without decompression.
+    :param resume: (bool) Whether to continue from the checkpoint, if any
+
+    :return: Nothing, just saves decrypted file.
     """
 
-    # Create the master word list as a set to prevent duplicate words.
-    word_list = list()
+    if checkpoint_path is not None:
+        if decompress or workers > 1 or STDIO_PATH in (file_path, save_path):
+            raise ValueError("A resumable run cannot decompress, use workers "
+                             "or standard input/output.")
+        decrypt_resumable(decrypt_list, file_path, save_path, checkpoint_path,
+                          block_size, mode, resume)
+        return
 
-    # Open the wordlist and read it's contents into the variable 'text'
-    with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
+    # Open the input first, and only put the output in place once all of
+    # it decoded, so a missing or malformed file leaves no plaintext behind.
+    with open_input(file_path) as file, replacing_output(save_path) as save:
+        out_file = DecompressingWriter(save) if decompress else save
 
-        # Cast all upper case characters to lowercase
-        text = text.lower()
+        # Decode ranges of the file in parallel when asked to.
+        if workers > 1 and file_path != STDIO_PATH:
+            decrypt_file_parallel(decrypt_list, file_path, out_file, workers,
+                                  mode)
+        else:
+            # Stream the file to decrypt into the resulting file.
+            if progress.enabled:
+                progress.start("decode", file_size(file))
+                file = ProgressReader(file)
+            decrypt_stream(decrypt_list, file, out_file, block_size, mode)
+
+        if decompress:
+            out_file.finish()
+
+    progress.finish()
+
+
+def table_fingerprint(table):
+    """Hashes an encode or decode table
 
-        # Split up the line into it's component words
-        raw_words = text.split()
+    A resumed run checks this against its checkpoint, so it never carries
+    on with a different codebook than the one the run started with.
 
-        # Use the text itself as a key to randomly shuffle the word list.
-        # This improves cryptographic security.
-        random.seed(a=text, version=2)
-        random.shuffle(raw_words)
+    :param table: The encode or decode table, dict or compact
+    :return: (str) Hex digest over every word and what it stands for
+    """
+
+    digest = hashlib.sha256()
+
+    # Compact tables already hold all of their words in a few flat arrays.
+    codebook = getattr(table, "codebook", table)
+    if isinstance(codebook, CompactCodebook):
+        digest.update(repr(codebook.keys).encode("utf-8"))
+        for part in (codebook.starts, codebook.offsets, codebook.blob):
+            digest.update(part)
+        return digest.hexdigest()
+
+    # Sixbit encode tables are lists indexed by symbol.
+    items = table.items() if isinstance(table, dict) else enumerate(table)
+    for key, value in items:
+        digest.update(repr((key, value)).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Saves the progress of a resumable run so it can be continued.
+
+    A checkpoint is only saved once the output up to it is flushed to disk,
+    and it replaces the previous one in a single rename, so the file always
+    describes a consistent point of the run. Anything written after it is
+    cut off again when the run is resumed.
+    """
+
+    def __init__(self, path, run, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """Creates the checkpoint
+
+        :param path: (str) The filepath of the checkpoint
+        :param run: (dict) What identifies the run: the action, mode,
+            codebook fingerprint, input signature and so on
+        :param interval: (float) The minimum seconds between saves
+        """
+
+        self.path = path
+        self.run = run
+        self.interval = interval
+        self.saved = time.monotonic()
 
-        # Create a translate table to remove punctuation
-        remove_punctuation = str.maketrans('', '',
-                                           s.punctuation + "”" + "“" + "—")
+    def load(self):
+        """Reads the progress of an interrupted run
 
-        # Use a list comprehension. For each word, strip punctuation
-        words = [w.translate(remove_punctuation) for w in raw_words]
+        :return: (dict) The progress saved, None if there is no checkpoint.
+            Raises ValueError if it belongs to a different run.
+        """
 
-        # Remove the blank entry that can sometimes be created for the wordlist
         try:
-            word_list.remove('')
-        except ValueError:
-            pass
+            with open(self.path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return None
 
-        # Briefly cast the word list as keys in an ordered dict to remove dupes
-        words = list(OrderedDict.fromkeys(words))
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version %s, expected %d."
+                             % (state.get("version"), CHECKPOINT_VERSION))
 
-        # Determine how many words should be in each chunk.
-        words_per_chunk = math.floor(len(words) / len(base_chars))
+        # Continuing with another input, codebook or setting would leave a
+        # file that matches neither run.
+        for name, value in self.run.items():
+            if state.get(name) != value:
+                raise ValueError("Checkpoint %s was saved with a different "
+                                 "%s, it cannot be resumed." % (self.path,
+                                                                name))
 
-        # Call divide_chunks to break the cipher_list into equally sized chunks
-        chunked_wordlist = divide_chunks(list(words), words_per_chunk)
-        chunked_wordlist = list(chunked_wordlist)
+        return state["progress"]
 
-        # Create the encoding table as an empty dictionary
-        encode_table = dict()
+    def save(self, out_file, resumed, force=False):
+        """Saves the progress if the interval has passed
 
-        # Create an iterator i to track progress through chunked_wordlist
-        i = 0
+        :param out_file: The binary file object the output is written to
+        :param resumed: (dict) The offsets and state to resume from
+        :param force: (bool) Whether to save even if the interval has not
+            passed
+        :return: Nothing, just saves the checkpoint.
+        """
 
-        # Loop through all the characters in valid characters
-        for char in base_chars:
-            # Selected a chunk as the value for the character
-            encode_table[char] = chunked_wordlist[i]
+        if not force and time.monotonic() - self.saved < self.interval:
+            return
 
-            # Add one to the iterator to get next chunk.
-            i += 1
+        # The output must be on disk before the checkpoint points past it.
+        with stats.stage("checkpoint"):
+            out_file.flush()
+            os.fsync(out_file.fileno())
 
-        # Create the decoding table as an empty dictionary
-        decode_table = dict()
+            state = dict(self.run, version=CHECKPOINT_VERSION,
+                         progress=resumed)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(state, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
 
-        # For each word in original dictionary, create a word -> character rel.
-        for key in encode_table.keys():
-            for word in encode_table[key]:
-                decode_table[word] = key
+        self.saved = time.monotonic()
 
-        return encode_table, decode_table
+    def remove(self):
+        """Deletes the checkpoint once the run is complete
 
+        :return: Nothing, just deletes the file.
+        """
 
-def encrypt(encrypt_list, file_path, save_path):
-    """Function to encrypt a file using ish.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
 
-    :param encrypt_list: (dict) The wordlist translation table from wordlistgen
+
+def file_signature(file_path):
+    """Identifies the contents of a file without reading it
+
+    :param file_path: (str) The filepath
+    :return: (list) The size and modification time in nanoseconds
+    """
+
+    status = os.stat(file_path)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def open_resumed(save_path, resumed):
+    """Opens the output of a resumable run where its checkpoint left it
+
+    :param save_path: (str) The filepath of the output
+    :param resumed: (dict) The progress from the checkpoint, None to start
+        from scratch
+    :return: A binary file object positioned at the checkpoint, anything
+        after it cut off.
+    """
+
+    if resumed is None:
+        return open(save_path, 'wb')
+
+    save = open(save_path, 'r+b')
+    if os.fstat(save.fileno()).st_size < resumed["output_offset"]:
+        save.close()
+        raise ValueError("%s is shorter than its checkpoint, it cannot be "
+                         "resumed." % save_path)
+
+    save.truncate(resumed["output_offset"])
+    save.seek(resumed["output_offset"])
+    return save
+
+
+def encrypt_resumable(encrypt_list, file_path, save_path, checkpoint_path,
+                      block_size=BLOCK_SIZE, engine="python", mode="base64",
+                      resume=False, interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """Encrypts a file, saving checkpoints it can be resumed from.
+
+    A checkpoint records how many payload bytes are encoded and how many
+    ish bytes are written, so a resumed run cuts off anything written after
+    it and carries on from the next block. Words are picked with random
+    numbers from the operating system as always, nothing about them is kept
+    in the checkpoint, so the resumed file decodes the same but does not
+    repeat the words an uninterrupted run would have picked. The checkpoint
+    is deleted once the file is complete.
+
+    :param encrypt_list: The encode table for the mode from mode_tables
     :param file_path: The filepath for the file to be encrypted
     :param save_path: The filepath for the encrypted file to be saved to
-
+    :param checkpoint_path: (str) The filepath of the checkpoint
+    :param block_size: (int) The number of payload bytes encoded per block
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param mode: (str) The encoding mode, one of MODES
+    :param resume: (bool) Whether to continue from the checkpoint, if any
+    :param interval: (float) The minimum seconds between checkpoints
     :return: Nothing, just saves encrypted file.
     """
 
-    # Open the file to be encrypted as bytecode.
-    with open(file_path, 'rb') as file:
-        file_raw = file.read()
+    buckets = mode_buckets(encrypt_list, mode)
+    bits = len(buckets).bit_length() - 1
 
-    # Cast raw byte code to base64 encoded bytecode
-    file_base = base64.b64encode(file_raw)
+    # Whole groups only, so a resumed run starts on a whole group.
+    quantum = mode_quantum(mode, bits)
+    block_size = max(quantum, block_size - block_size % quantum)
 
-    # Cast base64 bytecode into base64 encoded strings
-    base_string = file_base.decode("utf-8")
+    run = {"action": "encrypt", "mode": mode,
+           "codebook": table_fingerprint(encrypt_list),
+           "input": file_signature(file_path)}
+    checkpoint = Checkpoint(checkpoint_path, run, interval)
 
-    # Create a list to store the encoded message.
-    ish_list = []
+    resumed = checkpoint.load() if resume else None
+    save = open_resumed(save_path, resumed)
+    if resumed is None:
+        resumed = {"input_offset": 0, "output_offset": 0}
 
-    # Reset the random seed so encrypted files are not predictable
-    random.seed(a=None, version=2)
+    offset = resumed["input_offset"]
 
-    # Loop through all the characters, include whitespaces
-    for character in base_string:
-        # For each character, add a random word from all words that are
-        # associated with that character to the list.
-        ish_list.append(random.choice(encrypt_list[character]))
+    with open(file_path, 'rb') as file, save:
+        encoder = make_encoder(buckets, engine)
+        separator = b' ' if resumed["output_offset"] else b''
 
-    # Cast the encoded message back into a string.
-    ish_string = ' '.join(ish_list)
+        # Sixbit and wide files start with their version symbol.
+        if mode in HEADER_MODES and not separator:
+            save.write(encoder(header_symbols(mode, bits)).encode("utf-8"))
+            separator = b' '
 
-    # Save the resulting file.
-    with open(save_path, "w") as file:
-        file.write(ish_string)
+        # Wide padding depends on the length of the whole payload. Once it
+        # is written the offset runs past the end and nothing is left.
+        file.seek(offset)
+        if progress.enabled:
+            progress.start("encode", run["input"][0], offset)
+            file = ProgressReader(file)
+        if mode == "wide" and offset <= run["input"][0]:
+            file = PaddedReader(file, wide_group(bits))
+            file.length = offset
 
+        for block in read_aligned(file, block_size, quantum):
+            ish_bytes = encoder(block_symbols(block, mode, bits)).encode(
+                "utf-8")
 
-def decrypt(decrypt_list, file_path, save_path):
-    """Function to decrypt a file using ish.
+            with stats.stage("write", len(ish_bytes)):
+                save.write(separator)
+                save.write(ish_bytes)
+            separator = b' '
 
-    :param decrypt_list: (dict) the wordlist translation table from wordlistgen
-    :param file_path: The filepath for the file to be decrypted
-    :param save_path: The filepath for the decrypted file to be saved to.
+            offset += len(block)
+            checkpoint.save(save, {"input_offset": offset,
+                                   "output_offset": save.tell()})
+
+    progress.finish()
+    checkpoint.remove()
 
+
+def decrypt_resumable(decrypt_list, file_path, save_path, checkpoint_path,
+                      block_size=BLOCK_SIZE, mode="base64", resume=False,
+                      interval=DEFAULT_CHECKPOINT_INTERVAL):
+    """Decrypts a file, saving checkpoints it can be resumed from.
+
+    A checkpoint records how many ish bytes are decoded, how many payload
+    bytes are written and the base64 characters still pending, so a
+    resumed run seeks straight back to the word it stopped at. The
+    checkpoint is deleted once the file is complete.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param file_path: The filepath for the file to be decrypted
+    :param save_path: The filepath for the decrypted file to be saved to
+    :param checkpoint_path: (str) The filepath of the checkpoint
+    :param block_size: (int) The number of ish bytes read per block
+    :param mode: (str) The encoding mode, one of MODES
+    :param resume: (bool) Whether to continue from the checkpoint, if any
+    :param interval: (float) The minimum seconds between checkpoints
     :return: Nothing, just saves decrypted file.
     """
 
-    # Open filepath to decrypt and save contents as ish_string.
-    with open(file_path, "r") as file:
-        ish_string = file.read()
+    run = {"action": "decrypt", "mode": mode,
+           "codebook": table_fingerprint(decrypt_list),
+           "input": file_signature(file_path)}
+    checkpoint = Checkpoint(checkpoint_path, run, interval)
+
+    resumed = checkpoint.load() if resume else None
+    save = open_resumed(save_path, resumed)
+    if resumed is None:
+        resumed = {"input_offset": 0, "output_offset": 0,
+                   "pending": [] if mode == "wide" else ""}
+
+    start = resumed["input_offset"]
+
+    # Wide symbols are kept as a list of numbers, base64 as text.
+    if mode == "wide":
+        pending = array('H', resumed["pending"])
+    else:
+        pending = resumed["pending"].encode("ascii")
+
+    def save_progress(consumed, pending):
+        checkpoint.save(save, {"input_offset": start + consumed,
+                               "output_offset": save.tell(),
+                               "pending": pending.tolist() if mode == "wide"
+                               else pending.decode("ascii")})
+
+    with open(file_path, 'rb') as file, save:
+        file.seek(start)
+        if progress.enabled:
+            progress.start("decode", run["input"][0], start)
+            file = ProgressReader(file)
+        decrypt_stream(decrypt_list, file, save, block_size, mode,
+                       header=start == 0, pending=pending,
+                       on_block=save_progress)
+
+    progress.finish()
+    checkpoint.remove()
+
+
+def decrypt_range(decrypt_list, file_path, save_path, start, end=None,
+                  mode="base64", index_path=None, block_size=BLOCK_SIZE):
+    """Decrypts only the payload bytes from start up to end.
+
+    The sidecar seek index written by encrypt gives the last checkpoint at
+    or before start and the first at or after end. Only the words between
+    those two are read and decoded, so the time taken depends on the length
+    of the range rather than the size of the file.
+
+    :param decrypt_list: The decode table for the mode from mode_tables
+    :param file_path: The filepath of the ish file, which must be seekable
+    :param save_path: The filepath to save the range to, or STDIO_PATH to
+        write standard output
+    :param start: (int) The payload offset the range starts at
+    :param end: (int) The payload offset the range stops before, None for
+        the end of the payload
+    :param mode: (str) The encoding mode, one of MODES
+    :param index_path: (str) The filepath of the index, None for file_path
+        with INDEX_SUFFIX added
+    :param block_size: (int) The number of ish bytes read per block
+
+    :return: Nothing, just saves the decrypted range.
+    """
+
+    if index_path is None:
+        index_path = file_path + INDEX_SUFFIX
+
+    checkpoints = read_index(index_path)
+
+    # An index written for another file would point into the middle of
+    # words, so refuse it outright.
+    payload_size, ish_size = checkpoints[-1]
+    if os.path.getsize(file_path) != ish_size:
+        raise ValueError("Seek index %s does not match %s."
+                         % (index_path, file_path))
+
+    if end is None or end > payload_size:
+        end = payload_size
+
+    with open(file_path, 'rb') as file, open_output(save_path) as save:
+        if start >= end:
+            return
+
+        # Sixbit and wide files still get their version symbol checked.
+        if mode in HEADER_MODES:
+            check_header(decrypt_list, file.read(checkpoints[0][1] - 1), mode,
+                         decode_bits(decrypt_list, mode))
+
+        # Find the checkpoints either side of the range.
+        offsets = [payload for payload, position in checkpoints]
+        first = bisect.bisect_right(offsets, start) - 1
+        last = bisect.bisect_left(offsets, end, first + 1)
+        begin, position = checkpoints[first]
+        stop = checkpoints[last][1]
+
+        # Stop before the space that leads into the next checkpoint.
+        finish = last == len(checkpoints) - 1
+        if not finish:
+            stop -= 1
+
+        file.seek(position)
+        decrypt_stream(decrypt_list, BoundedReader(file, stop - position),
+                       SliceWriter(save, start - begin, end - start),
+                       block_size, mode, header=False, finish=finish)
+
+
+# Number of random payload bytes timed by the --plan calibration run.
+CALIBRATION_BYTES = 3 * 64 * 1024
+
+
+def expected_symbols(size, mode="base64", bits=6):
+    """Counts the symbols a payload of a given size encodes to
+
+    :param size: (int) The payload size in bytes
+    :param mode: (str) The encoding mode, one of MODES
+    :param bits: (int) The bits carried per word in wide mode
+    :return: (int) Data symbols, (int) '=' padding symbols and (int)
+        header symbols.
+    """
+
+    if mode == "wide":
+        padded = size + len(wide_padding(size, wide_group(bits)))
+        return padded * 8 // bits, 0, 1
+
+    if mode == "sixbit":
+        return math.ceil(size * 4 / 3), 0, 1
+
+    padding = -size % 3
+    return 4 * math.ceil(size / 3) - padding, padding, 0
+
+
+def mean_word_bytes(bucket):
+    """Returns the mean UTF-8 length of the words in a bucket
+
+    :param bucket: A sequence of words
+    :return: (float) The mean length in bytes
+    """
+
+    return sum(len(word.encode("utf-8")) for word in bucket) / len(bucket)
+
+
+def calibrate(encrypt_list, decrypt_list, mode="base64", engine="python",
+              size=CALIBRATION_BYTES, repeat=3):
+    """Times encoding and decoding a small random payload on this machine
+
+    :param encrypt_list: The encode table for the mode from mode_tables
+    :param decrypt_list: The matching decode table
+    :param mode: (str) The encoding mode, one of MODES
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param size: (int) The payload size to time, in bytes
+    :param repeat: (int) The number of runs, the fastest is kept
+    :return: (float) Encode and (float) decode seconds per payload byte
+    """
+
+    payload = os.urandom(size)
+    encode_s = decode_s = float("inf")
+
+    for _ in range(repeat):
+        ish_file = io.BytesIO()
+        start = time.perf_counter()
+        encrypt_stream(encrypt_list, io.BytesIO(payload), ish_file,
+                       engine=engine, mode=mode)
+        middle = time.perf_counter()
+        ish_file.seek(0)
+        decrypt_stream(decrypt_list, ish_file, io.BytesIO(), mode=mode)
+        end = time.perf_counter()
+
+        encode_s = min(encode_s, middle - start)
+        decode_s = min(decode_s, end - middle)
+
+    return encode_s / size, decode_s / size
+
+
+def plan(encrypt_list, decrypt_list, size, mode="base64", engine="python",
+         calibration_bytes=CALIBRATION_BYTES):
+    """Predicts the output size and runtime of encrypting a payload
+
+    Payload bytes are assumed to be random, so every data symbol is equally
+    likely and every word of its bucket is equally likely to be chosen. The
+    expected output size then follows from the mean word length of every
+    bucket. Runtimes are scaled up from a timed calibration run.
+
+    :param encrypt_list: The encode table for the mode from mode_tables
+    :param decrypt_list: The matching decode table
+    :param size: (int) The payload size in bytes
+    :param mode: (str) The encoding mode, one of MODES
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param calibration_bytes: (int) The payload size timed for calibration
+    :return: (dict) The expected words, bytes and seconds
+    """
+
+    buckets = mode_buckets(encrypt_list, mode)
+    bits = len(buckets).bit_length() - 1
+    means = [mean_word_bytes(bucket) for bucket in buckets]
+
+    data, padding, header = expected_symbols(size, mode, bits)
+    words = data + padding + header
+
+    # Data symbols fall in any bucket but the base64 '=' padding bucket.
+    data_buckets = means[:64] if mode == "base64" else means
+    output = data * sum(data_buckets) / len(data_buckets)
+    output += padding * means[-1]
+    if header:
+        output += means[header_symbols(mode, bits)[0]]
+    output += max(words - 1, 0)
+
+    encode_rate, decode_rate = calibrate(encrypt_list, decrypt_list, mode,
+                                         engine, calibration_bytes)
+
+    return {
+        "payload_bytes": size,
+        "mode": mode,
+        "bits_per_word": 6 if mode != "wide" else bits,
+        "words": words,
+        "output_bytes": round(output),
+        "expansion": output / size if size else None,
+        "encode_s": encode_rate * size,
+        "decode_s": decode_rate * size,
+    }
+
+
+def print_plan(estimate, file):
+    """Prints a plan from plan()
+
+    :param estimate: (dict) The plan
+    :param file: A text file object to print to
+    :return: Nothing, just prints.
+    """
+
+    print("payload bytes   %14d" % estimate["payload_bytes"], file=file)
+    print("bits per word   %14d" % estimate["bits_per_word"], file=file)
+    print("words           %14d" % estimate["words"], file=file)
+    print("output bytes    %14d (expected)" % estimate["output_bytes"],
+          file=file)
+    if estimate["expansion"] is not None:
+        print("expansion       %14.2fx" % estimate["expansion"], file=file)
+    print("encode time     %14.2f s (estimated)" % estimate["encode_s"],
+          file=file)
+    print("decode time     %14.2f s (estimated)" % estimate["decode_s"],
+          file=file)
+
+
+# Suffix given to encrypted files by batch mode, and stripped on decrypt.
+ISH_SUFFIX = ".ish"
+
+# Suffix given to decrypted files whose name does not end in ISH_SUFFIX.
+OUT_SUFFIX = ".out"
+
+
+def batch_output_name(path, action):
+    """Names the output of a file processed in batch mode
+
+    :param path: (str) The path of the input file
+    :param action: (str) 'encrypt' or 'decrypt'
+    :return: (str) The path with ISH_SUFFIX added, or removed on decrypt.
+    """
+
+    if action == "encrypt":
+        return path + ISH_SUFFIX
+
+    if path.endswith(ISH_SUFFIX):
+        return path[:-len(ISH_SUFFIX)]
+
+    return path + OUT_SUFFIX
+
+
+def manifest_jobs(manifest_path):
+    """Reads the files to process from a manifest
+
+    Every line holds an input path and an output path separated by a tab.
+    Blank lines and lines starting with '#' are skipped.
+
+    :param manifest_path: (str) The filepath of the manifest
+    :return: (list) (input path, output path) pairs
+    """
+
+    jobs = []
+
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+
+            fields = line.split("\t")
+            if len(fields) != 2:
+                raise ValueError("%s:%d: expected 'input<TAB>output'."
+                                 % (manifest_path, number))
+            jobs.append((fields[0], fields[1]))
+
+    return jobs
+
+
+def tree_jobs(input_dir, output_dir, action):
+    """Lists every file under a directory, mirrored into an output directory
+
+    :param input_dir: (str) The directory to walk
+    :param output_dir: (str) The directory to mirror the tree into
+    :param action: (str) 'encrypt' or 'decrypt'
+    :return: (list) (input path, output path) pairs, in sorted order
+    """
+
+    jobs = []
+
+    for root, dirs, files in os.walk(input_dir):
+        # Walk in a stable order so runs are reproducible.
+        dirs.sort()
+
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, input_dir)
+            jobs.append((path, os.path.join(
+                output_dir, batch_output_name(relative, action))))
+
+    return jobs
+
+
+def glob_jobs(pattern, output_dir, action):
+    """Lists the files matching a glob, mirrored into an output directory
+
+    Paths are mirrored relative to the part of the pattern before its first
+    wildcard. '**' matches any number of directories.
+
+    :param pattern: (str) The glob pattern
+    :param output_dir: (str) The directory to mirror the matches into
+    :param action: (str) 'encrypt' or 'decrypt'
+    :return: (list) (input path, output path) pairs, in sorted order
+    """
+
+    # Find the directory the pattern is anchored at.
+    root = pattern
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+
+    jobs = []
+
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        if not os.path.isfile(path):
+            continue
+        relative = os.path.relpath(path, root or os.curdir)
+        jobs.append((path, os.path.join(
+            output_dir, batch_output_name(relative, action))))
+
+    return jobs
+
+
+# Table and settings of the current batch process, set by init_batch_worker
+batch_state = None
+
+
+def init_batch_worker(table, action, mode, engine, compress=None):
+    """Sets up a process to run batch_file
+
+    :param table: The encode table when encrypting, the decode table when
+        decrypting
+    :param action: (str) 'encrypt' or 'decrypt'
+    :param mode: (str) The encoding mode, one of MODES
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param compress: (str) Codec the payloads are compressed with, None for
+        none
+    :return: Nothing, just stores the settings.
+    """
+
+    global batch_state
+
+    batch_state = (table, action, mode, engine, compress)
+
+
+def batch_file(job):
+    """Encrypts or decrypts one file of a batch
+
+    :param job: (tuple) The input path and output path
+    :return: (dict) The paths, sizes, elapsed seconds and any error
+    """
+
+    table, action, mode, engine, compress = batch_state
+    file_path, save_path = job
+
+    result = {"input": file_path, "output": save_path, "error": None}
+    start = time.perf_counter()
+
+    try:
+        # Create the mirrored directory the output goes into.
+        directory = os.path.dirname(save_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if action == "encrypt":
+            encrypt(table, file_path, save_path, engine=engine, mode=mode,
+                    compress=compress)
+        else:
+            decrypt(table, file_path, save_path, mode=mode,
+                    decompress=bool(compress))
+
+        result["input_bytes"] = os.path.getsize(file_path)
+        result["output_bytes"] = os.path.getsize(save_path)
+    except Exception as error:
+        # One bad file must not stop the rest of the batch.
+        result["error"] = "%s: %s" % (type(error).__name__, error)
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(table, jobs, action, mode="base64", engine="python",
+              concurrency=1, compress=None):
+    """Encrypts or decrypts many files with one codebook
+
+    :param table: The encode table when encrypting, the decode table when
+        decrypting
+    :param jobs: (list) (input path, output path) pairs
+    :param action: (str) 'encrypt' or 'decrypt'
+    :param mode: (str) The encoding mode, one of MODES
+    :param engine: (str) The encode engine to use, one of ENGINES
+    :param concurrency: (int) The number of files processed at once
+    :param compress: (str) Codec payloads are compressed with before
+        encoding, None for none. Any value decompresses when decrypting.
+    :return: (list) The result of every file, in the order of jobs
+    """
+
+    # Small batches, or a single lane, are not worth a process pool.
+    if concurrency <= 1 or len(jobs) <= 1:
+        init_batch_worker(table, action, mode, engine, compress)
+        return [batch_file(job) for job in jobs]
+
+    # Each process gets the codebook once, then works through its share.
+    with concurrent.futures.ProcessPoolExecutor(
+            concurrency, initializer=init_batch_worker,
+            initargs=(table, action, mode, engine, compress)) as pool:
+        return list(pool.map(batch_file, jobs, chunksize=4))
+
+
+def print_batch_report(results, file):
+    """Prints the per file throughput and totals of a batch
+
+    :param results: (list) The results from run_batch
+    :param file: A text file object to print to
+    :return: Nothing, just prints.
+    """
+
+    total_bytes = 0
+    total_seconds = 0.0
+    failed = 0
+
+    print("%12s %10s %10s  %s" % ("bytes", "seconds", "MB/s", "file"),
+          file=file)
+
+    for result in results:
+        if result["error"]:
+            failed += 1
+            print("%12s %10.3f %10s  %s  FAILED %s"
+                  % ("-", result["seconds"], "-", result["input"],
+                     result["error"]), file=file)
+            continue
+
+        size = result["input_bytes"]
+        seconds = result["seconds"]
+        total_bytes += size
+        total_seconds += seconds
+        rate = size / seconds / 1e6 if seconds else 0.0
+        print("%12d %10.3f %10.2f  %s" % (size, seconds, rate,
+                                          result["input"]), file=file)
+
+    rate = total_bytes / total_seconds / 1e6 if total_seconds else 0.0
+    print("%d files, %d failed, %d bytes, %.3f s of work, %.2f MB/s"
+          % (len(results), failed, total_bytes, total_seconds, rate),
+          file=file)
+
 
-    # Cast the list encoded by ish to a string
-    ish_list = ish_string.split(" ")
+def byte_range(text):
+    """Parses a START:END range of payload bytes given on the command line
 
-    # Cast the ish string to a base64 encoded list
-    base_list = [decrypt_list[word] for word in ish_list]
+    :param text: (str) The range, either end may be left out
+    :return: (tuple) The start offset and the end offset, None for the end
+        of the payload
+    """
 
-    # Cast the base64 encoded list to a base64 encoded string
-    base_string = " ".join(base_list)
+    start, colon, end = text.partition(":")
 
-    # Cast the base64 encoded string to a base64 encoded bytecode
-    decode_base = base_string.encode("utf-8")
+    try:
+        start = int(start) if start else 0
+        end = int(end) if end else None
+    except ValueError:
+        colon = None
 
-    # Cast base64 encoded bytecode to raw bytecode for writing
-    new_file_base = base64.b64decode(decode_base)
+    if not colon or start < 0 or (end is not None and end < start):
+        raise argparse.ArgumentTypeError("'%s' is not a START:END range of "
+                                         "bytes" % text)
 
-    # Write new_file_base to file.
-    with open(save_path, "wb") as file:
-        file.write(new_file_base)
+    return start, end
 
 
 def main():
@@ -181,31 +4044,409 @@ def main():
 
     # Create the arg parser
     parser = argparse.ArgumentParser(description="Process arguments for ish "
-                                                 "modes.")
+                                                 "modes.",
+                                     epilog="A wordlist path may be a file, a "
+                                            "directory of files read in "
+                                            "sorted order, or several of "
+                                            "either joined with %r."
+                                            % os.pathsep)
 
     # Defining encryption argument for parser
     parser.add_argument("-e", "--encrypt", type=str, nargs=3,
                         metavar=('encrypt_path', 'file_path', 'save_path'),
                         default=None,
                         help="Encrypt file at file_path using wordlist at "
-                             "encrypt_path. Save results to save_path.")
+                             "encrypt_path. Save results to save_path. "
+                             "Use - for standard input or output.")
 
     # Defining decryption argument for parser
     parser.add_argument("-d", "--decrypt", type=str, nargs=3,
                         metavar=('decrypt_path', 'file_path', 'save_path'),
                         default=None,
                         help="Decrypt file at file_path using wordlist at "
-                             "decrypt_path. Save results to save_path.")
+                             "decrypt_path. Save results to save_path. "
+                             "Use - for standard input or output.")
+
+    # Defining plan argument for parser
+    parser.add_argument("-p", "--plan", type=str, nargs=2,
+                        metavar=('wordlist_path', 'file_path'), default=None,
+                        help="Predict the output size and runtime of "
+                             "encrypting file_path with the wordlist at "
+                             "wordlist_path, without encrypting it.")
+
+    # Defining batch arguments for parser
+    parser.add_argument("-b", "--batch", type=str, nargs=2,
+                        metavar=('action', 'wordlist_path'), default=None,
+                        help="Encrypt or decrypt (action) many files with "
+                             "one build of the wordlist at wordlist_path. "
+                             "Files come from --manifest, --input-dir or "
+                             "--glob.")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Batch file listing 'input<TAB>output' lines.")
+    parser.add_argument("--input-dir", type=str, default=None,
+                        help="Batch every file under this directory, "
+                             "mirrored into --output-dir.")
+    parser.add_argument("--glob", type=str, default=None,
+                        help="Batch every file matching this pattern, "
+                             "mirrored into --output-dir.")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="Where --input-dir and --glob batches write.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of batch files processed at once. "
+                             "Defaults to %(default)s.")
+    parser.add_argument("--report", type=str, default=None,
+                        metavar="JSON_PATH",
+                        help="Also write the batch summary as JSON.")
+
+    # Defining compression arguments for parser
+    parser.add_argument("--compress", choices=sorted(CODECS), default=None,
+                        help="Compress the payload before encrypting it.")
+    parser.add_argument("--decompress", action="store_true",
+                        help="Decompress the payload after decrypting it. "
+                             "The codec is read from the payload.")
+
+    # Defining seek index arguments for parser
+    parser.add_argument("--index", action="store_true",
+                        help="Also write a seek index next to the encrypted "
+                             "file, save_path%s, for --range." % INDEX_SUFFIX)
+    parser.add_argument("--index-interval", type=int,
+                        default=DEFAULT_INDEX_INTERVAL, metavar="BYTES",
+                        help="Payload bytes between index checkpoints. "
+                             "Defaults to %(default)s.")
+    parser.add_argument("--range", type=byte_range, default=None,
+                        metavar="START:END",
+                        help="Decrypt only payload bytes START up to END, "
+                             "seeking with the index written by --index. "
+                             "Either end may be left out.")
+
+    # Defining progress arguments for parser
+    parser.add_argument("--progress", choices=("human", "json"), nargs="?",
+                        const="human", default=None,
+                        help="Report bytes done, percent, MB/s and ETA on "
+                             "stderr while building, encoding and decoding. "
+                             "'json' prints one JSON object per line instead.")
+    parser.add_argument("--progress-interval", type=float,
+                        default=DEFAULT_PROGRESS_INTERVAL, metavar="SECONDS",
+                        help="Seconds between progress reports. Defaults to "
+                             "%(default)s.")
+
+    # Defining checkpoint arguments for parser
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Save progress to save_path%s so an "
+                             "interrupted run can be continued with "
+                             "--resume." % CHECKPOINT_SUFFIX)
+    parser.add_argument("--checkpoint-interval", type=float,
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        metavar="SECONDS",
+                        help="Seconds between checkpoints. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted --checkpoint run from "
+                             "its last checkpoint, or start one if there is "
+                             "none.")
+
+    # Defining encode engine argument for parser
+    parser.add_argument("--engine", choices=sorted(ENGINES),
+                        default="python",
+                        help="Engine used to encode. 'numpy' needs NumPy and "
+                             "falls back to 'python' without it.")
+
+    # Defining worker count argument for parser
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="Number of processes to encrypt or decrypt "
+                             "with. Defaults to %(default)s.")
+
+    # Defining encoding mode argument for parser
+    parser.add_argument("--mode", choices=MODES, default="base64",
+                        help="Encoding mode. Files must be decrypted with the "
+                             "mode they were encrypted with. Defaults to "
+                             "%(default)s.")
+
+    # Defining codebook representation argument for parser
+    parser.add_argument("--codebook", choices=("dict", "compact"),
+                        default="dict",
+                        help="In-memory codebook representation. 'compact' "
+                             "uses far less memory but looks words up more "
+                             "slowly. Defaults to %(default)s.")
+    parser.add_argument("--codebook-budget", type=float,
+                        default=DEFAULT_REGISTRY_MAX_BYTES / (1024 * 1024),
+                        metavar="MB",
+                        help="Memory budget for codebooks held at once. "
+                             "Defaults to %(default)s MB.")
+
+    # Defining key schedule argument for parser
+    parser.add_argument("--schedule", type=int, choices=SCHEDULES,
+                        default=DEFAULT_SCHEDULE,
+                        help="Key schedule used to derive the codebook. 1 is "
+                             "the original, 2 builds much faster. Files must "
+                             "be decrypted with the schedule they were "
+                             "encrypted with. Defaults to %(default)s.")
+
+    # Defining codebook cache arguments for parser
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache codebooks in --cache-dir so later runs "
+                             "skip building them. Off by default, as a "
+                             "cached codebook is the key in plain text and "
+                             "stays on disk until evicted or purged.")
+    parser.add_argument("--no-cache", action="store_false", dest="cache",
+                        help="Always rebuild the codebook from the wordlist. "
+                             "This is the default.")
+    parser.add_argument("--purge-cache", action="store_true",
+                        help="Delete every cached codebook in --cache-dir.")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached codebooks. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--cache-max-size", type=float,
+                        default=DEFAULT_CACHE_MAX_BYTES / (1024 * 1024),
+                        metavar="MB",
+                        help="Evict least recently used codebooks once the "
+                             "cache exceeds this size. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--cache-max-age", type=float,
+                        default=DEFAULT_CACHE_MAX_AGE / (24 * 60 * 60),
+                        metavar="DAYS",
+                        help="Evict codebooks unused for this many days. "
+                             "Defaults to %(default)s.")
+
+    # Defining instrumentation arguments for parser
+    parser.add_argument("--stats", type=str, nargs="?", const="",
+                        default=None, metavar="JSON_PATH",
+                        help="Record wall time, CPU time and bytes per stage. "
+                             "Prints a table to stderr, or dumps JSON to "
+                             "JSON_PATH when given.")
+    parser.add_argument("--profile", type=str, default=None,
+                        metavar="DIR",
+                        help="Write a cProfile profile and a tracemalloc "
+                             "snapshot of the whole run to DIR.")
 
     # Parse the arguments from standard input
     args = parser.parse_args()
 
+    # Check the batch arguments fit together before doing any work.
+    if args.batch:
+        if args.batch[0] not in ("encrypt", "decrypt"):
+            parser.error("batch action must be 'encrypt' or 'decrypt'")
+        sources = [args.manifest, args.input_dir, args.glob]
+        if sum(source is not None for source in sources) != 1:
+            parser.error("batch needs exactly one of --manifest, "
+                         "--input-dir or --glob")
+        if args.manifest is None and args.output_dir is None:
+            parser.error("--input-dir and --glob need --output-dir")
+
+    # The index sits next to a real file and maps the uncompressed payload.
+    if args.index:
+        if not args.encrypt or args.encrypt[2] == STDIO_PATH:
+            parser.error("--index needs -e with a save_path")
+        if args.compress:
+            parser.error("--index cannot be used with --compress")
+    if args.range:
+        if not args.decrypt or args.decrypt[1] == STDIO_PATH:
+            parser.error("--range needs -d with a file_path")
+        if args.decompress:
+            parser.error("--range cannot be used with --decompress")
+
+    # Resumable runs work on real files in a single process.
+    if args.resume:
+        args.checkpoint = True
+    if args.checkpoint:
+        paths = args.encrypt or args.decrypt
+        if not paths or args.range or STDIO_PATH in paths[1:]:
+            parser.error("--checkpoint needs -e or -d with a file_path and "
+                         "save_path")
+        if args.workers > 1 or args.compress or args.decompress or args.index:
+            parser.error("--checkpoint cannot be used with --workers, "
+                         "--compress, --decompress or --index")
+
+    # Files of a batch run side by side, their progress would interleave.
+    if args.progress and args.batch:
+        parser.error("--progress cannot be used with --batch")
+
+    stats.enabled = args.stats is not None
+    progress.enabled = args.progress is not None
+    progress.json = args.progress == "json"
+    progress.interval = args.progress_interval
+
+    # Profile the whole run when asked to.
+    if args.profile is None:
+        run_piped(args)
+        return
+
+    os.makedirs(args.profile, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        run_piped(args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(args.profile, "ish.prof"))
+        tracemalloc.take_snapshot().dump(
+            os.path.join(args.profile, "ish.tracemalloc"))
+        tracemalloc.stop()
+
+
+def run_piped(args):
+    """Runs the program, exiting quietly when the reader of a pipe goes away
+
+    :param args: (argparse.Namespace) The parsed command line arguments
+    :return: Nothing, just runs the program.
+    """
+
+    try:
+        run(args)
+    except BrokenPipeError:
+        # Point stdout at devnull so the flush at exit does not fail again.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def run(args):
+    """Runs the mode selected on the command line
+
+    :param args: (argparse.Namespace) The parsed command line arguments
+    :return: Nothing, just runs the program.
+    """
+
+    # Work out where codebooks are cached, if anywhere.
+    cache_dir = args.cache_dir if args.cache else None
+
+    # Delete what earlier runs cached first, when asked to.
+    if args.purge_cache:
+        removed = purge_cache(args.cache_dir)
+        print("Deleted %d cached files from %s." % (removed, args.cache_dir),
+              file=sys.stderr)
+
+    # Let the user know when the requested engine is unavailable.
+    if args.engine == "numpy" and np is None:
+        print("NumPy is not installed, using the python engine.",
+              file=sys.stderr)
+
     if args.encrypt:
-        encryptlist, decryptlist = wordlistgen(args.encrypt[0])
-        encrypt(encryptlist, args.encrypt[1], args.encrypt[2])
+        encryptlist, decryptlist = cli_tables(args.encrypt[0], args,
+                                              cache_dir)
+        index_path = None
+        if args.index:
+            index_path = args.encrypt[2] + INDEX_SUFFIX
+        if args.checkpoint:
+            encrypt_resumable(encryptlist, args.encrypt[1], args.encrypt[2],
+                              args.encrypt[2] + CHECKPOINT_SUFFIX,
+                              engine=args.engine, mode=args.mode,
+                              resume=args.resume,
+                              interval=args.checkpoint_interval)
+        else:
+            encrypt(encryptlist, args.encrypt[1], args.encrypt[2],
+                    engine=args.engine, mode=args.mode, workers=args.workers,
+                    compress=args.compress, index_path=index_path,
+                    index_interval=args.index_interval)
+    elif args.decrypt and args.range:
+        encryptlist, decryptlist = cli_tables(args.decrypt[0], args,
+                                              cache_dir)
+        decrypt_range(decryptlist, args.decrypt[1], args.decrypt[2],
+                      *args.range, mode=args.mode)
+    elif args.decrypt and args.checkpoint:
+        encryptlist, decryptlist = cli_tables(args.decrypt[0], args,
+                                              cache_dir)
+        decrypt_resumable(decryptlist, args.decrypt[1], args.decrypt[2],
+                          args.decrypt[2] + CHECKPOINT_SUFFIX, mode=args.mode,
+                          resume=args.resume,
+                          interval=args.checkpoint_interval)
     elif args.decrypt:
-        encryptlist, decryptlist = wordlistgen(args.decrypt[0])
-        decrypt(decryptlist, args.decrypt[1], args.decrypt[2])
+        encryptlist, decryptlist = cli_tables(args.decrypt[0], args,
+                                              cache_dir)
+        decrypt(decryptlist, args.decrypt[1], args.decrypt[2],
+                mode=args.mode, workers=args.workers,
+                decompress=args.decompress)
+    elif args.plan:
+        encryptlist, decryptlist = cli_tables(args.plan[0], args, cache_dir)
+        estimate = plan(encryptlist, decryptlist,
+                        os.path.getsize(args.plan[1]), args.mode,
+                        args.engine)
+        print_plan(estimate, sys.stdout)
+
+        # The compressed size depends on the payload's contents.
+        if args.compress:
+            print("Compression is not accounted for, these figures are an "
+                  "upper bound.")
+        if args.workers > 1:
+            print("Times are for one process, %d workers can at best divide "
+                  "them by %d." % (args.workers, args.workers))
+    elif args.batch:
+        run_cli_batch(args, cache_dir)
+
+    # Keep the cache within its limits.
+    if cache_dir is not None:
+        evict_cache(cache_dir, int(args.cache_max_size * 1024 * 1024),
+                    args.cache_max_age * 24 * 60 * 60)
+
+    # Print or dump the per stage statistics.
+    if args.stats == "":
+        stats.report(sys.stderr)
+        print("codebooks: %(hits)d hits, %(misses)d misses, %(evictions)d "
+              "evictions, %(codebooks)d held in %(bytes)d bytes"
+              % codebooks.counters(), file=sys.stderr)
+    elif args.stats:
+        with open(args.stats, 'w') as file:
+            json.dump(stats.as_dict(), file, indent=2)
+
+
+def cli_tables(wordlist_path, args, cache_dir):
+    """Builds or loads the tables selected on the command line
+
+    :param wordlist_path: (str) filepath for the base wordlist to be used.
+    :param args: (argparse.Namespace) The parsed command line arguments
+    :param cache_dir: (str) Directory for cached codebooks, None to disable.
+    :return: The encode and decode tables.
+    """
+
+    codebooks.cache_dir = cache_dir
+    codebooks.codebook = args.codebook
+    codebooks.max_bytes = int(args.codebook_budget * 1024 * 1024)
+
+    return codebooks.get(wordlist_path, args.mode, args.schedule)
+
+
+def run_cli_batch(args, cache_dir):
+    """Runs batch mode as selected on the command line
+
+    :param args: (argparse.Namespace) The parsed command line arguments
+    :param cache_dir: (str) Directory for cached codebooks, None to disable.
+    :return: Nothing, exits with status 1 if any file failed.
+    """
+
+    action, wordlist_path = args.batch
+
+    if args.manifest is not None:
+        jobs = manifest_jobs(args.manifest)
+    elif args.input_dir is not None:
+        jobs = tree_jobs(args.input_dir, args.output_dir, action)
+    else:
+        jobs = glob_jobs(args.glob, args.output_dir, action)
+
+    # Build the codebook once for the whole batch.
+    encryptlist, decryptlist = cli_tables(wordlist_path, args, cache_dir)
+    table = encryptlist if action == "encrypt" else decryptlist
+
+    start = time.perf_counter()
+    # Decrypting batches only need to know whether to decompress.
+    compress = args.compress
+    if action == "decrypt":
+        compress = args.decompress or None
+
+    results = run_batch(table, jobs, action, args.mode, args.engine,
+                        args.jobs, compress)
+    elapsed = time.perf_counter() - start
+
+    print_batch_report(results, sys.stdout)
+    print("%.3f s wall clock" % elapsed)
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump({"action": action, "wall_s": elapsed,
+                       "files": results}, file, indent=2)
+
+    if any(result["error"] for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
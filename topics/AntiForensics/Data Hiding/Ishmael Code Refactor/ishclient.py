@@ -0,0 +1,292 @@
+"""Client helpers for the ish daemon
+
+Talks to ishdaemon.py over a Unix domain socket or localhost TCP. Every
+message on the wire is a frame: a 4 byte big-endian length followed by that
+many bytes.
+
+A request is a JSON header frame, then the payload as any number of data
+frames, then an empty frame. The reply is the output as data frames, an
+empty frame, then a JSON status frame. A connection can carry any number of
+requests one after another.
+
+Example:
+    with connect("/tmp/ish.sock") as sock:
+        ish_bytes = encrypt_bytes(sock, "mobydick", b"hello")
+        data = decrypt_bytes(sock, "mobydick", ish_bytes)
+"""
+import argparse
+import io
+import json
+import socket
+import struct
+import sys
+import threading
+
+# Length prefix of every frame
+FRAME = struct.Struct("!I")
+
+# Largest frame either side accepts, guards against garbage lengths.
+MAX_FRAME = 16 * 1024 * 1024
+
+# Payload bytes sent per data frame
+CHUNK_SIZE = 256 * 1024
+
+# Port the daemon listens on when using TCP
+DEFAULT_PORT = 47300
+
+
+class DaemonError(Exception):
+    """Raised when the daemon reports a failed request."""
+
+
+def connect(socket_path=None, host="127.0.0.1", port=DEFAULT_PORT,
+            timeout=None):
+    """Opens a connection to the daemon
+
+    :param socket_path: (str) The daemon's Unix socket, None to use TCP
+    :param host: (str) The daemon's host when using TCP
+    :param port: (int) The daemon's port when using TCP
+    :param timeout: (float) Socket timeout in seconds, None to block
+    :return: (socket.socket) The connected socket
+    """
+
+    if socket_path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        return sock
+
+    return socket.create_connection((host, port), timeout)
+
+
+def send_frame(sock, data):
+    """Sends one frame
+
+    :param sock: (socket.socket) The connection
+    :param data: (bytes) The frame contents, b'' for an end marker
+    :return: Nothing, just sends the frame.
+    """
+
+    # Small frames go out in one packet, large ones are not copied.
+    if len(data) < 4096:
+        sock.sendall(FRAME.pack(len(data)) + data)
+    else:
+        sock.sendall(FRAME.pack(len(data)))
+        sock.sendall(data)
+
+
+def recv_exact(sock, size):
+    """Receives exactly size bytes
+
+    :param sock: (socket.socket) The connection
+    :param size: (int) The number of bytes to receive
+    :return: (bytes) The bytes, raises ConnectionError if the daemon hangs up
+    """
+
+    view = memoryview(bytearray(size))
+    received = 0
+
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Daemon closed the connection.")
+        received += count
+
+    return view.tobytes()
+
+
+def recv_frame(sock):
+    """Receives one frame
+
+    :param sock: (socket.socket) The connection
+    :return: (bytes) The frame contents, b'' for an end marker
+    """
+
+    size, = FRAME.unpack(recv_exact(sock, FRAME.size))
+    if size > MAX_FRAME:
+        raise ConnectionError("Frame of %d bytes is too large." % size)
+
+    return recv_exact(sock, size)
+
+
+def send_payload(sock, header, in_file, chunk_size=CHUNK_SIZE):
+    """Sends a whole request: header, payload frames and end marker
+
+    :param sock: (socket.socket) The connection
+    :param header: (dict) The request header
+    :param in_file: A binary file object to read the payload from
+    :param chunk_size: (int) The number of payload bytes per frame
+    :return: Nothing, just sends the request.
+    """
+
+    send_frame(sock, json.dumps(header).encode("utf-8"))
+
+    while True:
+        data = in_file.read(chunk_size)
+        if not data:
+            break
+        send_frame(sock, data)
+
+    send_frame(sock, b'')
+
+
+def request(sock, header, in_file, out_file, chunk_size=CHUNK_SIZE):
+    """Runs one request, streaming the payload in and the output out
+
+    The payload is sent from a second thread while the output is read, so
+    neither side stalls on a full socket buffer with large payloads.
+
+    :param sock: (socket.socket) The connection
+    :param header: (dict) The request header
+    :param in_file: A binary file object to read the payload from
+    :param out_file: A binary file object to write the output to
+    :param chunk_size: (int) The number of payload bytes per frame
+    :return: (dict) The status frame, raises DaemonError on failure.
+    """
+
+    # Errors raised while sending, reported once the reply is read
+    errors = []
+
+    def sender():
+        try:
+            send_payload(sock, header, in_file, chunk_size)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=sender, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            data = recv_frame(sock)
+            if not data:
+                break
+            out_file.write(data)
+
+        status = json.loads(recv_frame(sock))
+    finally:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    if not status.get("ok"):
+        raise DaemonError(status.get("error", "Request failed."))
+
+    return status
+
+
+def encrypt(sock, codebook, in_file, out_file, mode="base64", schedule=1):
+    """Encrypts a stream with a codebook loaded in the daemon
+
+    :param sock: (socket.socket) The connection
+    :param codebook: (str) The name of the codebook
+    :param in_file: A binary file object to read the payload from
+    :param out_file: A binary file object to write the ish words to
+    :param mode: (str) The encoding mode
+    :param schedule: (int) The key schedule the codebook was built with
+    :return: (dict) The status frame
+    """
+
+    header = {"action": "encrypt", "codebook": codebook, "mode": mode,
+              "schedule": schedule}
+    return request(sock, header, in_file, out_file)
+
+
+def decrypt(sock, codebook, in_file, out_file, mode="base64", schedule=1):
+    """Decrypts a stream of ish words with a codebook loaded in the daemon
+
+    :param sock: (socket.socket) The connection
+    :param codebook: (str) The name of the codebook
+    :param in_file: A binary file object to read the ish words from
+    :param out_file: A binary file object to write the payload to
+    :param mode: (str) The encoding mode
+    :param schedule: (int) The key schedule the codebook was built with
+    :return: (dict) The status frame
+    """
+
+    header = {"action": "decrypt", "codebook": codebook, "mode": mode,
+              "schedule": schedule}
+    return request(sock, header, in_file, out_file)
+
+
+def encrypt_bytes(sock, codebook, data, mode="base64", schedule=1):
+    """Encrypts a small payload held in memory
+
+    :param sock: (socket.socket) The connection
+    :param codebook: (str) The name of the codebook
+    :param data: (bytes) The payload
+    :param mode: (str) The encoding mode
+    :param schedule: (int) The key schedule the codebook was built with
+    :return: (bytes) The UTF-8 encoded ish words
+    """
+
+    out_file = io.BytesIO()
+    encrypt(sock, codebook, io.BytesIO(data), out_file, mode, schedule)
+    return out_file.getvalue()
+
+
+def decrypt_bytes(sock, codebook, ish_bytes, mode="base64", schedule=1):
+    """Decrypts a small ish message held in memory
+
+    :param sock: (socket.socket) The connection
+    :param codebook: (str) The name of the codebook
+    :param ish_bytes: (bytes) The UTF-8 encoded ish words
+    :param mode: (str) The encoding mode
+    :param schedule: (int) The key schedule the codebook was built with
+    :return: (bytes) The payload
+    """
+
+    out_file = io.BytesIO()
+    decrypt(sock, codebook, io.BytesIO(ish_bytes), out_file, mode, schedule)
+    return out_file.getvalue()
+
+
+def main():
+    """Main function
+
+    :return: Nothing, just runs one request against the daemon.
+    """
+
+    parser = argparse.ArgumentParser(description="Send a file through the "
+                                                 "ish daemon.")
+    parser.add_argument("action", choices=("encrypt", "decrypt"))
+    parser.add_argument("codebook", help="Name of a codebook the daemon "
+                                         "serves.")
+    parser.add_argument("file_path", help="Input file, - for stdin.")
+    parser.add_argument("save_path", help="Output file, - for stdout.")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Unix socket of the daemon. Uses TCP if unset.")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="TCP host of the daemon.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="TCP port of the daemon.")
+    parser.add_argument("--mode", type=str, default="base64",
+                        help="Encoding mode. Defaults to %(default)s.")
+    parser.add_argument("--schedule", type=int, default=1,
+                        help="Key schedule. Defaults to %(default)s.")
+    args = parser.parse_args()
+
+    function = encrypt if args.action == "encrypt" else decrypt
+
+    in_file = (sys.stdin.buffer if args.file_path == "-"
+               else open(args.file_path, 'rb'))
+    out_file = (sys.stdout.buffer if args.save_path == "-"
+                else open(args.save_path, 'wb'))
+
+    try:
+        with connect(args.socket, args.host, args.port) as sock:
+            function(sock, args.codebook, in_file, out_file, args.mode,
+                     args.schedule)
+    except DaemonError as error:
+        sys.exit("ish daemon: %s" % error)
+    finally:
+        if in_file is not sys.stdin.buffer:
+            in_file.close()
+        if out_file is not sys.stdout.buffer:
+            out_file.close()
+        else:
+            out_file.flush()
+
+
+if __name__ == "__main__":
+    main()
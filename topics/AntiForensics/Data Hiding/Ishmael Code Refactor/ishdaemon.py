@@ -0,0 +1,666 @@
+"""Long-lived ish daemon that keeps codebooks warm
+
+Builds the configured codebooks once at startup and serves encrypt and
+decrypt requests over a Unix domain socket or localhost TCP, using the
+framed protocol described in ishclient.py. Connections are handled
+concurrently by asyncio. Payloads are streamed through in blocks, and the
+encoding and decoding of every block runs in a pool of worker processes
+that each hold their own copy of the codebooks.
+
+Example:
+    python ishdaemon.py --socket /tmp/ish.sock \\
+        --wordlist mobydick=../"Ishmael Performance Analysis"/mobydick.txt
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import io
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+
+import IshCMDOnly as ish
+from ishclient import CHUNK_SIZE, FRAME, MAX_FRAME, DEFAULT_PORT
+
+# Payload bytes encoded per worker task, a multiple of 3.
+ENCODE_PIECE_SIZE = ish.WORKER_BLOCK_SIZE
+
+# Ish bytes decoded per worker task
+DECODE_PIECE_SIZE = 1024 * 1024
+
+# Worker tasks of one request queued at once
+MAX_IN_FLIGHT = 4
+
+# Permissions masked off the Unix socket as it is created, so only the owner
+# can ever connect to it.
+SOCKET_UMASK = 0o177
+
+# Codebooks of the current worker process, set up by init_daemon_worker
+worker_codebooks = None
+
+# Encoders of the current worker process, by (name, mode, schedule), along
+# with the encode table they were made from
+worker_encoders = {}
+
+# Settings of the current worker process, set up by init_daemon_worker
+worker_settings = None
+
+
+def init_daemon_worker(paths, engine, registry):
+    """Sets up a worker process of the daemon
+
+    :param paths: (dict) Wordlist path of every codebook name
+    :param engine: (str) The encode engine to use, one of ish.ENGINES
+    :param registry: (ish.CodebookRegistry) The codebooks built at startup,
+        every worker gets its own copy to grow within the budget
+    :return: Nothing, just stores the codebooks and settings.
+    """
+
+    global worker_codebooks, worker_settings
+
+    worker_codebooks = registry
+    worker_settings = (paths, engine)
+
+
+def worker_codebook(key, signature):
+    """Finds a codebook in the worker, loading it on first use
+
+    :param key: (tuple) The codebook name, mode and schedule
+    :param signature: (tuple) The wordlist's corpus_signature, checked once
+        per request by the daemon rather than on every block
+    :return: The encoder, the decode table and the bits per symbol.
+    """
+
+    paths, engine = worker_settings
+    name, mode, schedule = key
+
+    encrypt_list, decrypt_list = worker_codebooks.get(paths[name], mode,
+                                                      schedule, signature)
+
+    # Reuse the encoder while its table is still the registered one.
+    encoder, table, bits = worker_encoders.get(key, (None, None, None))
+    if table is not encrypt_list:
+        # Every encoder picks words with its own random number generator.
+        buckets = ish.mode_buckets(encrypt_list, mode)
+        encoder = ish.make_encoder(buckets, engine)
+        bits = len(buckets).bit_length() - 1
+        worker_encoders[key] = (encoder, encrypt_list, bits)
+
+        # Forget encoders whose tables the registry has dropped.
+        for other in list(worker_encoders):
+            if worker_codebooks.key(paths[other[0]], *other[1:]) \
+                    not in worker_codebooks:
+                del worker_encoders[other]
+
+    return encoder, decrypt_list, bits
+
+
+def codebook_bits(key, signature):
+    """Returns the bits every word of a codebook carries
+
+    :param key: (tuple) The codebook name, mode and schedule
+    :param signature: (tuple) The wordlist's corpus_signature
+    :return: (int) The bits per symbol
+    """
+
+    return worker_codebook(key, signature)[2]
+
+
+def encode_block(key, signature, block, first):
+    """Encodes one block of a payload inside a worker process
+
+    :param key: (tuple) The codebook name, mode and schedule
+    :param signature: (tuple) The wordlist's corpus_signature
+    :param block: (bytes) Payload bytes, a whole number of groups unless
+        last
+    :param first: (bool) Whether this is the first block of the payload
+    :return: (bytes) The UTF-8 encoded ish words for the block
+    """
+
+    encoder, decrypt_list, bits = worker_codebook(key, signature)
+    mode = key[1]
+
+    symbols = ish.block_symbols(block, mode, bits)
+
+    # Sixbit and wide output starts with its version symbol.
+    if first and mode in ish.HEADER_MODES:
+        symbols = ish.header_symbols(mode, bits) + symbols
+
+    return encoder(symbols).encode("utf-8")
+
+
+def decode_block(key, signature, ish_bytes, first):
+    """Casts a run of whole ish words to base64 inside a worker process
+
+    :param key: (tuple) The codebook name, mode and schedule
+    :param signature: (tuple) The wordlist's corpus_signature
+    :param ish_bytes: (bytes) Space separated words, cut on a word boundary
+    :param first: (bool) Whether these are the first words of the message
+    :return: (bytes) The base64 encoded bytecode, one character per word
+    """
+
+    encoder, decrypt_list, bits = worker_codebook(key, signature)
+    mode = key[1]
+
+    # Check and drop the version symbol.
+    if first and mode in ish.HEADER_MODES:
+        word, space, ish_bytes = ish_bytes.partition(b' ')
+        ish.check_header(decrypt_list, word, mode, bits)
+        if not space:
+            return ish.empty_symbols(mode)
+
+    return ish.words_base64(decrypt_list, ish_bytes, mode)
+
+
+async def read_frame(reader):
+    """Reads one frame
+
+    :param reader: (asyncio.StreamReader) The connection
+    :return: (bytes) The frame contents, b'' for an end marker, None if the
+        client hung up between frames.
+    """
+
+    try:
+        prefix = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError as error:
+        if not error.partial:
+            return None
+        raise ConnectionError("Client closed the connection mid frame.")
+
+    size, = FRAME.unpack(prefix)
+    if size > MAX_FRAME:
+        raise ConnectionError("Frame of %d bytes is too large." % size)
+
+    return await reader.readexactly(size)
+
+
+async def write_frame(writer, data):
+    """Writes one frame, waiting while the client is behind
+
+    :param writer: (asyncio.StreamWriter) The connection
+    :param data: (bytes) The frame contents, b'' for an end marker
+    :return: Nothing, just writes the frame.
+    """
+
+    writer.write(FRAME.pack(len(data)))
+    if data:
+        writer.write(data)
+    await writer.drain()
+
+
+async def write_data(writer, data):
+    """Writes output as data frames of at most CHUNK_SIZE bytes
+
+    The output of a piece grows with the length of the words, so it is cut
+    into frames the same size the client sends rather than one frame that
+    could go over MAX_FRAME.
+
+    :param writer: (asyncio.StreamWriter) The connection
+    :param data: (bytes) The output, nothing is sent when empty
+    :return: Nothing, just writes the frames.
+    """
+
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        await write_frame(writer, view[start:start + CHUNK_SIZE])
+
+
+async def payload_frames(reader):
+    """Yields the payload frames of a request up to its end marker
+
+    :param reader: (asyncio.StreamReader) The connection
+    :return: The frame contents using a yield statement
+    """
+
+    while True:
+        data = await read_frame(reader)
+        if data is None:
+            raise ConnectionError("Client closed the connection mid request.")
+        if not data:
+            return
+        yield data
+
+
+class Daemon:
+    """Serves requests for a fixed set of named codebooks."""
+
+    def __init__(self, paths, pool, workers):
+        """Creates the daemon
+
+        :param paths: (dict) Wordlist path of every codebook name
+        :param pool: (concurrent.futures.Executor) The worker pool
+        :param workers: (int) The number of worker processes
+        """
+
+        self.paths = paths
+        self.pool = pool
+        self.workers = workers
+
+    def run_in_pool(self, function, *args):
+        """Runs a function in the worker pool
+
+        :param function: The function to run
+        :return: (asyncio.Future) The pending result
+        """
+
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.pool, function, *args)
+
+    async def handle(self, reader, writer):
+        """Serves every request of one connection
+
+        :param reader: (asyncio.StreamReader) The connection
+        :param writer: (asyncio.StreamWriter) The connection
+        :return: Nothing, returns once the client hangs up.
+        """
+
+        try:
+            while True:
+                header = await read_frame(reader)
+                if header is None:
+                    break
+                await self.serve_request(header, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_request(self, header, reader, writer):
+        """Serves one request and sends its status
+
+        :param header: (bytes) The JSON header frame
+        :param reader: (asyncio.StreamReader) The connection
+        :param writer: (asyncio.StreamWriter) The connection
+        :return: Nothing, just answers the request.
+        """
+
+        frames = payload_frames(reader)
+        status = {"ok": True}
+
+        try:
+            action, key = self.parse_header(header)
+
+            # Check the wordlist on disk once for the whole request, in a
+            # thread as a directory of files takes a while to walk.
+            loop = asyncio.get_running_loop()
+            signature = await loop.run_in_executor(
+                None, ish.corpus_signature, self.paths[key[0]])
+
+            if action == "encrypt":
+                await self.encrypt(key, signature, frames, writer)
+            else:
+                await self.decrypt(key, signature, frames, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as error:
+            status = {"ok": False,
+                      "error": "%s: %s" % (type(error).__name__, error)}
+
+        # Skip whatever is left of a failed request to stay in step.
+        async for data in frames:
+            pass
+
+        await write_frame(writer, b'')
+        await write_frame(writer, json.dumps(status).encode("utf-8"))
+
+    def parse_header(self, header):
+        """Checks a request header
+
+        :param header: (bytes) The JSON header frame
+        :return: The action and the (name, mode, schedule) codebook key.
+        """
+
+        request = json.loads(header)
+
+        action = request.get("action")
+        if action not in ("encrypt", "decrypt"):
+            raise ValueError("Unknown action %r." % action)
+
+        name = request.get("codebook")
+        if name not in self.paths:
+            raise ValueError("Unknown codebook %r." % name)
+
+        mode = request.get("mode", "base64")
+        if mode not in ish.MODES:
+            raise ValueError("Unknown mode %r." % mode)
+
+        schedule = request.get("schedule", ish.DEFAULT_SCHEDULE)
+        if schedule not in ish.SCHEDULES:
+            raise ValueError("Unknown schedule %r." % schedule)
+
+        return action, (name, mode, schedule)
+
+    async def encrypt(self, key, signature, frames, writer):
+        """Encrypts a streamed payload
+
+        :param key: (tuple) The codebook name, mode and schedule
+        :param signature: (tuple) The wordlist's corpus_signature
+        :param frames: The payload frames from payload_frames
+        :param writer: (asyncio.StreamWriter) The connection
+        :return: Nothing, just sends the ish words.
+        """
+
+        in_flight = collections.deque()
+        buffer = b''
+        first = True
+        separator = b''
+        length = 0
+
+        # Blocks must hold whole groups of symbols to encode on their own.
+        mode = key[1]
+        bits = 6
+        if mode == "wide":
+            bits = await self.run_in_pool(codebook_bits, key, signature)
+        quantum = ish.mode_quantum(mode, bits)
+        piece_size = ENCODE_PIECE_SIZE - ENCODE_PIECE_SIZE % quantum
+
+        async def submit(block):
+            nonlocal first, separator
+
+            in_flight.append(self.run_in_pool(encode_block, key, signature,
+                                              block, first))
+            first = False
+
+            # Send the oldest block once enough work is queued.
+            if len(in_flight) >= MAX_IN_FLIGHT:
+                separator = await self.send_words(writer, separator,
+                                                  in_flight.popleft())
+
+        async for data in frames:
+            buffer += data
+            length += len(data)
+
+            # Hand out whole blocks as soon as they are complete.
+            while len(buffer) >= piece_size:
+                await submit(buffer[:piece_size])
+                buffer = buffer[piece_size:]
+
+        # Wide payloads are finished off with their end marker.
+        if mode == "wide":
+            buffer += ish.wide_padding(length, quantum)
+
+        # The last block is padded, an empty payload still gets its header.
+        if buffer or first:
+            await submit(buffer)
+
+        while in_flight:
+            separator = await self.send_words(writer, separator,
+                                              in_flight.popleft())
+
+    async def send_words(self, writer, separator, future):
+        """Sends the words of an encoded block once they are ready
+
+        :param writer: (asyncio.StreamWriter) The connection
+        :param separator: (bytes) Sent before the words, b' ' after the first
+        :param future: (asyncio.Future) The pending encode_block result
+        :return: (bytes) The separator for the next block
+        """
+
+        ish_bytes = await future
+        if not ish_bytes:
+            return separator
+
+        await write_data(writer, separator + ish_bytes)
+        return b' '
+
+    async def decrypt(self, key, signature, frames, writer):
+        """Decrypts a streamed message of ish words
+
+        Words are only cut apart at spaces, so input that has none in a
+        whole piece is refused rather than buffered without end.
+
+        :param key: (tuple) The codebook name, mode and schedule
+        :param signature: (tuple) The wordlist's corpus_signature
+        :param frames: The payload frames from payload_frames
+        :param writer: (asyncio.StreamWriter) The connection
+        :return: Nothing, just sends the decoded payload.
+        """
+
+        in_flight = collections.deque()
+        buffer = b''
+        first = True
+        empty = True
+
+        # base64 characters still waiting on the rest of their quantum
+        mode = key[1]
+        pending = ish.empty_symbols(mode)
+        bits = 6
+        if mode == "wide":
+            bits = await self.run_in_pool(codebook_bits, key, signature)
+
+        async def submit(ish_bytes):
+            nonlocal first, pending
+
+            in_flight.append(self.run_in_pool(decode_block, key, signature,
+                                              ish_bytes, first))
+            first = False
+
+            if len(in_flight) >= MAX_IN_FLIGHT:
+                pending = await self.send_quanta(writer, pending,
+                                                 in_flight.popleft(), mode,
+                                                 bits)
+
+        async for data in frames:
+            buffer += data
+            empty = False
+
+            # Hand out whole words once a piece is full.
+            if len(buffer) >= DECODE_PIECE_SIZE:
+                cut = buffer.rfind(b' ')
+                if cut < 0:
+                    raise ValueError("No space in %d bytes of input, it is "
+                                     "not a message of ish words."
+                                     % len(buffer))
+                await submit(buffer[:cut])
+                buffer = buffer[cut + 1:]
+
+        # An empty message holds no words, otherwise the last word ends it.
+        if not empty:
+            await submit(buffer)
+
+        while in_flight:
+            pending = await self.send_quanta(writer, pending,
+                                             in_flight.popleft(), mode, bits)
+
+        out_file = io.BytesIO()
+        ish.finish_quanta(pending, out_file, mode, bits)
+        await write_data(writer, out_file.getvalue())
+
+    async def send_quanta(self, writer, pending, future, mode="base64",
+                          bits=6):
+        """Decodes and sends the whole quanta of a decoded piece
+
+        :param writer: (asyncio.StreamWriter) The connection
+        :param pending: (bytes) base64 characters left from the last piece
+        :param future: (asyncio.Future) The pending decode_block result
+        :param mode: (str) The encoding mode, one of ish.MODES
+        :param bits: (int) The bits carried per word in wide mode
+        :return: (bytes) The base64 characters left for the next piece
+        """
+
+        out_file = io.BytesIO()
+        pending = ish.write_quanta(pending + await future, out_file, mode,
+                                   bits)
+        await write_data(writer, out_file.getvalue())
+
+        return pending
+
+
+def parse_wordlists(specs):
+    """Parses the NAME=PATH codebook options
+
+    :param specs: (list) The option values
+    :return: (dict) Wordlist path of every codebook name
+    """
+
+    paths = {}
+
+    for spec in specs:
+        name, equals, path = spec.partition("=")
+        if not equals:
+            # A bare path is named after its file.
+            path = spec
+            name = os.path.splitext(os.path.basename(spec))[0]
+        paths[name] = path
+
+    return paths
+
+
+def clear_stale_socket(path):
+    """Removes a Unix socket left behind by a daemon that is gone
+
+    :param path: (str) The filepath to listen on
+    :return: Nothing, raises ValueError if something else is at the path or
+        a daemon still answers on it.
+    """
+
+    try:
+        status = os.lstat(path)
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(status.st_mode):
+        raise ValueError("%s exists and is not a socket." % path)
+
+    # A refused connection means nothing is listening any more.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+
+    raise ValueError("A daemon is already listening on %s." % path)
+
+
+async def serve(args, paths, pool):
+    """Listens for connections until interrupted
+
+    :param args: (argparse.Namespace) The parsed command line arguments
+    :param paths: (dict) Wordlist path of every codebook name
+    :param pool: (concurrent.futures.Executor) The worker pool
+    :return: Nothing, returns on SIGINT or SIGTERM.
+    """
+
+    daemon = Daemon(paths, pool, args.workers)
+
+    if args.socket is not None:
+        clear_stale_socket(args.socket)
+
+        # Only the owner may talk to the daemon, from the moment the socket
+        # exists.
+        umask = os.umask(SOCKET_UMASK)
+        try:
+            server = await asyncio.start_unix_server(daemon.handle,
+                                                     path=args.socket)
+        finally:
+            os.umask(umask)
+        where = args.socket
+    else:
+        server = await asyncio.start_server(daemon.handle, args.host,
+                                            args.port)
+        where = "%s:%d" % (args.host, args.port)
+
+    print("Serving %s on %s" % (", ".join(sorted(paths)), where),
+          file=sys.stderr, flush=True)
+
+    # Stop cleanly on either signal.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    async with server:
+        await stop.wait()
+
+    if args.socket is not None and os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+
+def main():
+    """Main function
+
+    :return: Nothing, just runs the daemon.
+    """
+
+    parser = argparse.ArgumentParser(description="Serve ish requests with "
+                                                 "warm codebooks.")
+    parser.add_argument("--wordlist", type=str, action="append",
+                        required=True, metavar="NAME=PATH",
+                        help="A codebook to serve. May be given more than "
+                             "once. NAME defaults to the file name.")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="TCP host to listen on. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="TCP port to listen on. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes. Defaults to %(default)s.")
+    parser.add_argument("--mode", choices=ish.MODES, action="append",
+                        default=None,
+                        help="Modes to build at startup, others are built "
+                             "on first use. Defaults to base64.")
+    parser.add_argument("--schedule", type=int, choices=ish.SCHEDULES,
+                        default=ish.DEFAULT_SCHEDULE,
+                        help="Key schedule to build at startup. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--engine", choices=sorted(ish.ENGINES),
+                        default="python",
+                        help="Encode engine. Defaults to %(default)s.")
+    parser.add_argument("--codebook", choices=("dict", "compact"),
+                        default="dict",
+                        help="How the tables are held in memory. Defaults "
+                             "to %(default)s.")
+    parser.add_argument("--codebook-budget", type=float,
+                        default=ish.DEFAULT_REGISTRY_MAX_BYTES / (1024 * 1024),
+                        metavar="MB",
+                        help="Memory budget for the codebooks each worker "
+                             "holds. Defaults to %(default)s MB.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache codebooks in --cache-dir so restarts "
+                             "skip building them. Off by default, as a "
+                             "cached codebook is the key in plain text.")
+    parser.add_argument("--no-cache", action="store_false", dest="cache",
+                        help="Build codebooks without the on-disk cache. "
+                             "This is the default.")
+    parser.add_argument("--cache-dir", type=str,
+                        default=ish.DEFAULT_CACHE_DIR,
+                        help="Directory for cached codebooks. Defaults to "
+                             "%(default)s.")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir if args.cache else None
+    paths = parse_wordlists(args.wordlist)
+
+    # Fail before building anything if the socket cannot be used.
+    if args.socket is not None:
+        try:
+            clear_stale_socket(args.socket)
+        except ValueError as error:
+            parser.error(str(error))
+
+    registry = ish.CodebookRegistry(
+        int(args.codebook_budget * 1024 * 1024), cache_dir, args.codebook)
+
+    # Build every codebook once here, the workers receive copies.
+    for name in paths:
+        for mode in args.mode or ["base64"]:
+            registry.get(paths[name], mode, args.schedule)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max(1, args.workers), initializer=init_daemon_worker,
+            initargs=(paths, args.engine, registry)) as pool:
+        # Start the workers now so the first request does not wait on them.
+        pool.submit(int).result()
+        asyncio.run(serve(args, paths, pool))
+
+
+if __name__ == "__main__":
+    main()
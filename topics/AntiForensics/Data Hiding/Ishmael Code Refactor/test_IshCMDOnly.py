@@ -0,0 +1,407 @@
+"""Tests for IshCMDOnly
+
+Run with:
+    python -m unittest test_IshCMDOnly
+"""
+import io
+import json
+import os
+import random
+import string
+import tempfile
+import unittest
+from unittest import mock
+
+import IshCMDOnly as ish
+
+
+class WideIndexTest(unittest.TestCase):
+    """The seek index of a wide file records the true payload size."""
+
+    def setUp(self):
+        # Enough made up words for 12 bit wide words, 3 byte groups.
+        words = ["word%d" % number for number in range(4 * 4096)]
+        self.encrypt_list, self.decrypt_list = ish.wide_tables(words)
+        self.group = ish.wide_group(12)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.payload_path = os.path.join(self.temp_dir.name, "payload.bin")
+        self.ish_path = os.path.join(self.temp_dir.name, "payload.ish")
+        self.index_path = self.ish_path + ish.INDEX_SUFFIX
+        self.range_path = os.path.join(self.temp_dir.name, "range.bin")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_payload_size_excludes_padding(self):
+        for size in (1, self.group + 1, 1000 * self.group + 2):
+            with self.subTest(size=size):
+                payload = os.urandom(size)
+                with open(self.payload_path, 'wb') as file:
+                    file.write(payload)
+
+                ish.encrypt(self.encrypt_list, self.payload_path,
+                            self.ish_path, mode="wide",
+                            index_path=self.index_path, index_interval=999)
+
+                # The closing pair holds the payload and ish file sizes.
+                checkpoints = ish.read_index(self.index_path)
+                self.assertEqual(checkpoints[-1],
+                                 (size, os.path.getsize(self.ish_path)))
+
+                # A range running to the end stops at the payload's end.
+                ish.decrypt_range(self.decrypt_list, self.ish_path,
+                                  self.range_path, size - 1, size + 10,
+                                  mode="wide")
+                with open(self.range_path, 'rb') as file:
+                    self.assertEqual(file.read(), payload[-1:])
+
+
+class TokenizerTest(unittest.TestCase):
+    """The byte tokenizer gives the words of the original text pipeline."""
+
+    # Word characters, including some whose case changes their UTF-8 length
+    LETTERS = string.ascii_letters + string.digits + "éÉßİΣσçÇ" + "日本"
+
+    # Punctuation the tables strip, kept apart from words now and then
+    PUNCTUATION = string.punctuation + "”“—"
+
+    # Whitespace of every kind str.split() knows, and line endings
+    SPACES = [" ", "  ", "\t", "\n", "\r\n", "\r", "\x0b", "\x0c",
+              "\x1c", "\x1f", "\x85", "\xa0", "\u1680", "\u2028",
+              "\u2029", "\u202f", "\u205f", "\u3000"] + \
+        [chr(code) for code in range(0x2000, 0x200b)]
+
+    def random_text(self, rng, count):
+        parts = []
+        for _ in range(count):
+            word = "".join(rng.choice(self.LETTERS)
+                           for _ in range(rng.randint(1, 8)))
+            if rng.random() < 0.3:
+                word = rng.choice(self.PUNCTUATION) + word
+            if rng.random() < 0.2:
+                word = "".join(rng.choice(self.PUNCTUATION)
+                               for _ in range(rng.randint(1, 3)))
+            parts.append(word + rng.choice(self.SPACES))
+        return "".join(parts)
+
+    @staticmethod
+    def baseline_words(file_path):
+        """The word list as the original wordlistgen built it."""
+
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read().lower()
+
+        raw_words = text.split()
+        random.Random(text).shuffle(raw_words)
+
+        remove_punctuation = str.maketrans(
+            '', '', string.punctuation + "”" + "“" + "—")
+        words = [w.translate(remove_punctuation) for w in raw_words]
+
+        return list(dict.fromkeys(words))
+
+    def test_chunks(self):
+        rng = random.Random(1)
+        for trial in range(20):
+            text = self.random_text(rng, 300)
+            data = text.encode('utf-8')
+
+            # What the text reader would give, universal newlines included
+            expected = text.replace("\r\n", "\n").replace("\r", "\n")
+            expected = expected.lower()
+
+            for size in (1, 2, 3, 5, 16, 100):
+                with self.subTest(trial=trial, size=size):
+                    blocks = [data[start:start + size]
+                              for start in range(0, len(data), size)]
+                    lowered = []
+                    tokens = []
+                    for chunk in ish.cut_chunks(blocks):
+                        lowered.append(ish.lower_chunk(chunk))
+                        tokens.extend(ish.split_chunk(lowered[-1]))
+
+                    self.assertEqual(b''.join(lowered).decode('utf-8'),
+                                     expected)
+                    self.assertEqual([token.decode('utf-8')
+                                      for token in tokens], expected.split())
+
+    def test_wordlist_words(self):
+        rng = random.Random(2)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "corpus.txt")
+            for trial in range(5):
+                with self.subTest(trial=trial):
+                    with open(file_path, 'wb') as file:
+                        file.write(self.random_text(rng, 5000).encode('utf-8'))
+
+                    self.assertEqual(ish.wordlist_words(file_path),
+                                     self.baseline_words(file_path))
+
+
+class WidePackingTest(unittest.TestCase):
+    """Wide symbols round trip at every width and payload length."""
+
+    def test_pack_round_trip(self):
+        rng = random.Random(0)
+        for bits in range(ish.WIDE_MIN_BITS, ish.WIDE_MAX_BITS + 1):
+            group = ish.wide_group(bits)
+            for length in range(2 * bits + 1):
+                with self.subTest(bits=bits, length=length):
+                    payload = rng.randbytes(length)
+
+                    # The end marker then zeros up to a whole group.
+                    padding = ish.wide_padding(length, group)
+                    self.assertEqual(padding[:1], b'\x80')
+                    self.assertEqual(padding[1:], bytes(len(padding) - 1))
+                    self.assertLessEqual(len(padding), group)
+                    padded = payload + padding
+                    self.assertEqual(len(padded) % group, 0)
+
+                    # Symbols are the padded bits read most significant
+                    # first, bits at a time.
+                    symbols = ish.unpack_symbols(padded, bits)
+                    number = int.from_bytes(padded, 'big')
+                    count = 8 * len(padded) // bits
+                    expected = [number >> (bits * (count - 1 - index))
+                                & ((1 << bits) - 1)
+                                for index in range(count)]
+                    self.assertEqual(list(symbols), expected)
+
+                    self.assertEqual(ish.pack_symbols(symbols, bits), padded)
+
+                    # Decoding strips the padding and end marker again.
+                    out_file = io.BytesIO()
+                    pending = ish.write_quanta(symbols, out_file, "wide",
+                                               bits)
+                    ish.finish_quanta(pending, out_file, "wide", bits)
+                    self.assertEqual(out_file.getvalue(), payload)
+
+    def test_missing_end_marker(self):
+        for bits in range(ish.WIDE_MIN_BITS, ish.WIDE_MAX_BITS + 1):
+            with self.subTest(bits=bits):
+                symbols = ish.unpack_symbols(bytes(ish.wide_group(bits)),
+                                             bits)
+                with self.assertRaises(ValueError):
+                    ish.finish_quanta(symbols, io.BytesIO(), "wide", bits)
+
+    def test_tables(self):
+        for bits in range(ish.WIDE_MIN_BITS, ish.WIDE_MAX_BITS + 1):
+            with self.subTest(bits=bits):
+                # Just enough words for the width, plus a remainder.
+                count = ish.WIDE_MIN_SYNONYMS << bits
+                words = ["word%d" % number for number in range(count + 3)]
+                self.assertEqual(ish.wide_bits(len(words)), bits)
+
+                buckets, decode_table = ish.wide_tables(words)
+                self.assertEqual(len(buckets), 1 << bits)
+                for symbol, bucket in enumerate(buckets):
+                    self.assertGreaterEqual(len(bucket),
+                                            ish.WIDE_MIN_SYNONYMS)
+                    for word in bucket:
+                        self.assertEqual(decode_table[word], symbol)
+
+
+class Interrupted(Exception):
+    """Stands in for a run being killed."""
+
+
+def interrupt_after(saves):
+    """Patches checkpoints so the run stops once it saved a few
+
+    The run is stopped as it goes to save the next checkpoint, after the
+    block before it was written, so the output runs past the checkpoint
+    like that of a killed run can.
+
+    :param saves: (int) The number of checkpoints saved before stopping
+    :return: The patcher, to use as a context manager
+    """
+
+    original = ish.Checkpoint.save
+    saved = []
+
+    def save(self, out_file, resumed, force=False):
+        if len(saved) == saves:
+            raise Interrupted()
+        saved.append(resumed)
+        original(self, out_file, resumed, force)
+
+    return mock.patch.object(ish.Checkpoint, "save", save)
+
+
+class ResumeTest(unittest.TestCase):
+    """A run stopped part way and resumed gives the whole result."""
+
+    def setUp(self):
+        # Enough made up words for every mode, 12 bit wide words.
+        self.words = ["word%d" % number for number in range(4 * 4096)]
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.payload_path = os.path.join(self.temp_dir.name, "payload.bin")
+        self.ish_path = os.path.join(self.temp_dir.name, "payload.ish")
+        self.save_path = os.path.join(self.temp_dir.name, "payload.out")
+        self.checkpoint_path = os.path.join(self.temp_dir.name, "run.ckpt")
+
+        self.payload = os.urandom(50000)
+        with open(self.payload_path, 'wb') as file:
+            file.write(self.payload)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def tables(self, mode):
+        if mode == "sixbit":
+            return ish.sixbit_tables(self.words)
+        if mode == "wide":
+            return ish.wide_tables(self.words)
+        return ish.build_tables(self.words)
+
+    def test_encrypt(self):
+        for mode in ("base64", "sixbit", "wide"):
+            with self.subTest(mode=mode):
+                encrypt_list, decrypt_list = self.tables(mode)
+
+                with interrupt_after(5), self.assertRaises(Interrupted):
+                    ish.encrypt_resumable(encrypt_list, self.payload_path,
+                                          self.ish_path, self.checkpoint_path,
+                                          block_size=3000, mode=mode,
+                                          interval=0)
+
+                # Only offsets are kept, nothing about the words picked.
+                with open(self.checkpoint_path) as file:
+                    progress = json.load(file)["progress"]
+                self.assertEqual(set(progress),
+                                 {"input_offset", "output_offset"})
+                self.assertGreater(os.path.getsize(self.ish_path),
+                                   progress["output_offset"])
+
+                ish.encrypt_resumable(encrypt_list, self.payload_path,
+                                      self.ish_path, self.checkpoint_path,
+                                      block_size=3000, mode=mode,
+                                      resume=True, interval=0)
+                self.assertFalse(os.path.exists(self.checkpoint_path))
+
+                ish.decrypt(decrypt_list, self.ish_path, self.save_path,
+                            mode=mode)
+                with open(self.save_path, 'rb') as file:
+                    self.assertEqual(file.read(), self.payload)
+
+    def test_decrypt(self):
+        for mode in ("base64", "sixbit", "wide"):
+            with self.subTest(mode=mode):
+                encrypt_list, decrypt_list = self.tables(mode)
+                ish.encrypt(encrypt_list, self.payload_path, self.ish_path,
+                            mode=mode)
+
+                # Blocks that end part way through a quantum or group keep
+                # symbols pending in the checkpoint.
+                with interrupt_after(5), self.assertRaises(Interrupted):
+                    ish.decrypt_resumable(decrypt_list, self.ish_path,
+                                          self.save_path,
+                                          self.checkpoint_path,
+                                          block_size=4001, mode=mode,
+                                          interval=0)
+                self.assertTrue(os.path.exists(self.checkpoint_path))
+
+                ish.decrypt_resumable(decrypt_list, self.ish_path,
+                                      self.save_path, self.checkpoint_path,
+                                      block_size=4001, mode=mode,
+                                      resume=True, interval=0)
+                self.assertFalse(os.path.exists(self.checkpoint_path))
+
+                with open(self.save_path, 'rb') as file:
+                    self.assertEqual(file.read(), self.payload)
+
+
+class DecryptOutputTest(unittest.TestCase):
+    """A failed decrypt leaves no plaintext behind."""
+
+    def setUp(self):
+        words = ["word%d" % number for number in range(1000)]
+        self.encrypt_list, self.decrypt_list = ish.build_tables(words)
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ish_path = os.path.join(self.temp_dir.name, "payload.ish")
+        self.save_path = os.path.join(self.temp_dir.name, "payload.bin")
+
+        # Enough payload for many blocks to be written before the error.
+        self.payload = os.urandom(4 * ish.BLOCK_SIZE)
+        payload_path = os.path.join(self.temp_dir.name, "payload")
+        with open(payload_path, 'wb') as file:
+            file.write(self.payload)
+        ish.encrypt(self.encrypt_list, payload_path, self.ish_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        ish.decrypt(self.decrypt_list, self.ish_path, self.save_path)
+        with open(self.save_path, 'rb') as file:
+            self.assertEqual(file.read(), self.payload)
+
+    def test_malformed_input(self):
+        # An unknown word far into the message.
+        with open(self.ish_path, 'rb') as file:
+            ish_bytes = file.read()
+        cut = ish_bytes.index(b' ', len(ish_bytes) * 3 // 4)
+        with open(self.ish_path, 'wb') as file:
+            file.write(ish_bytes[:cut] + b' unknown' + ish_bytes[cut:])
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                with self.assertRaises(Exception):
+                    ish.decrypt(self.decrypt_list, self.ish_path,
+                                self.save_path, workers=workers)
+                self.assertEqual(sorted(os.listdir(self.temp_dir.name)),
+                                 ["payload", "payload.ish"])
+
+    def test_missing_input(self):
+        os.remove(self.ish_path)
+        with self.assertRaises(FileNotFoundError):
+            ish.decrypt(self.decrypt_list, self.ish_path, self.save_path)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["payload"])
+
+    def test_existing_output_kept(self):
+        with open(self.save_path, 'wb') as file:
+            file.write(b"earlier")
+        os.remove(self.ish_path)
+
+        with self.assertRaises(FileNotFoundError):
+            ish.decrypt(self.decrypt_list, self.ish_path, self.save_path)
+        with open(self.save_path, 'rb') as file:
+            self.assertEqual(file.read(), b"earlier")
+
+
+class PurgeCacheTest(unittest.TestCase):
+    """Purging the cache deletes its entries and nothing else."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_purge(self):
+        key = "0" * 64
+        ish.save_cached_codebook(self.cache_dir, key, ["a", "b"])
+        ish.save_vocabulary(os.path.join(self.cache_dir,
+                                         "vocabulary-%s.json" % key), {})
+        self.assertEqual(ish.purge_cache(self.cache_dir), 2)
+
+        self.assertIsNone(ish.load_cached_codebook(self.cache_dir, key))
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.assertEqual(ish.purge_cache(self.cache_dir), 0)
+
+    def test_other_files_kept(self):
+        ish.save_cached_codebook(self.cache_dir, "f" * 64, ["a", "b"])
+        other_path = os.path.join(self.cache_dir, "notes.json")
+        with open(other_path, 'w') as file:
+            file.write("{}")
+
+        self.assertEqual(ish.purge_cache(self.cache_dir), 1)
+        self.assertEqual(os.listdir(self.cache_dir), ["notes.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Tests for ishdaemon
+
+Run with:
+    python -m unittest test_ishdaemon
+"""
+import asyncio
+import concurrent.futures
+import os
+import tempfile
+import threading
+import unittest
+
+import IshCMDOnly as ish
+import ishclient
+import ishdaemon
+
+
+class LongWordTest(unittest.TestCase):
+    """Output of long words is sent in frames the client accepts."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.temp_dir.name, "ish.sock")
+
+        # Words of 20 characters, so a whole encode piece comes to more
+        # words than fit in one frame.
+        wordlist_path = os.path.join(self.temp_dir.name, "long.txt")
+        with open(wordlist_path, 'w') as file:
+            file.write(" ".join("longword%012d" % number
+                                for number in range(4096)))
+        paths = {"long": wordlist_path}
+
+        # Serve from a thread of this process, workers are threads too.
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            1, initializer=ishdaemon.init_daemon_worker,
+            initargs=(paths, "python", ish.CodebookRegistry()))
+        daemon = ishdaemon.Daemon(paths, self.pool, 1)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_unix_server(daemon.handle, path=self.socket_path))
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+        self.pool.shutdown()
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        payload = os.urandom(ishdaemon.ENCODE_PIECE_SIZE + 5)
+
+        with ishclient.connect(self.socket_path) as sock:
+            ish_bytes = ishclient.encrypt_bytes(sock, "long", payload)
+            self.assertGreater(len(ish_bytes), ishclient.MAX_FRAME)
+            self.assertEqual(ishclient.decrypt_bytes(sock, "long", ish_bytes),
+                             payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,399 @@
+"""Peak memory regression suite for the ish cipher
+
+Measures the peak traced allocations and peak resident set size of the
+codebook build, encode and decode for every shipped corpus against generated
+payloads, using the real functions from IshCMDOnly. Every measurement runs
+in a fresh process, so one stage never inherits the heap of another.
+
+Results are compared with a stored baseline, and the run fails when a peak
+has grown past it by more than the tolerance. Traced peaks only depend on
+the code and the Python version, so they are checked by default. RSS also
+depends on the machine and is only checked with --check-rss.
+
+Example:
+    python IshmaelMemory.py --save-baseline
+    python IshmaelMemory.py --tolerance 5 --output memory.json
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from IshmaelTiming import CORPORA, HERE, PAYLOADS, ish, make_payload, \
+    skipped
+
+# Default payload sizes in bytes. Streaming should keep the peaks flat as
+# these grow.
+PAYLOAD_SIZES = [64 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+# Baseline results are compared against unless another is given.
+DEFAULT_BASELINE = os.path.join(HERE, "memory_baseline.json")
+
+# Percentage a peak may grow past its baseline before the run fails.
+DEFAULT_TOLERANCE = 10.0
+
+# Version of the JSON layout written by this script.
+REPORT_VERSION = 1
+
+
+def reset_peak_rss():
+    """Resets the peak resident set size of this process, where Linux allows
+
+    :return: Nothing, elsewhere the peak covers the whole process lifetime.
+    """
+
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", 'w') as file:
+            file.write("5")
+
+
+def peak_rss():
+    """Reads the peak resident set size of this process
+
+    :return: (int) The peak in bytes, None where it cannot be read
+    """
+
+    # Linux keeps a peak that reset_peak_rss can clear.
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def build_tables(corpus_path, mode, schedule, codebook):
+    """Builds the tables a run would use
+
+    :param corpus_path: (str) The corpus to build from
+    :param mode: (str) The encoding mode, one of ish.MODES
+    :param schedule: (int) The key schedule, one of ish.SCHEDULES
+    :param codebook: (str) 'dict' or 'compact'
+    :return: The encode and decode tables
+    """
+
+    tables = ish.mode_tables(corpus_path, mode, schedule=schedule)
+    if codebook == "compact":
+        tables = ish.compact_tables(tables[0])
+
+    return tables
+
+
+def measure(stage, corpus_path, payload_path, ish_path, out_path, mode,
+            schedule, codebook, engine):
+    """Measures the peak memory of one stage, run in a fresh process.
+
+    The tables an encode or decode needs are built before measuring, so
+    only the stage itself is counted.
+
+    :param stage: (str) One of 'build', 'encode' or 'decode'
+    :param corpus_path: (str) The corpus to build from
+    :param payload_path: (str) The payload to encode
+    :param ish_path: (str) Where the encode writes and the decode reads
+    :param out_path: (str) Where the decode writes
+    :param mode: (str) The encoding mode, one of ish.MODES
+    :param schedule: (int) The key schedule, one of ish.SCHEDULES
+    :param codebook: (str) 'dict' or 'compact'
+    :param engine: (str) The encode engine, one of ish.ENGINES
+    :return: (dict) The traced and RSS peaks in bytes
+    """
+
+    if stage != "build":
+        encrypt_list, decrypt_list = build_tables(corpus_path, mode,
+                                                  schedule, codebook)
+
+    # Start from a clean slate so earlier garbage does not count.
+    gc.collect()
+    reset_peak_rss()
+    rss_before = peak_rss()
+    tracemalloc.start()
+
+    if stage == "build":
+        tables = build_tables(corpus_path, mode, schedule, codebook)
+    elif stage == "encode":
+        ish.encrypt(encrypt_list, payload_path, ish_path, engine=engine,
+                    mode=mode)
+    else:
+        ish.decrypt(decrypt_list, ish_path, out_path, mode=mode)
+
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_peak = peak_rss()
+
+    return {
+        "traced_peak_bytes": traced_peak,
+        "rss_peak_bytes": rss_peak,
+        "rss_growth_bytes": (rss_peak - rss_before
+                             if rss_peak is not None else None),
+    }
+
+
+def run_measure(*args):
+    """Runs measure in a fresh interpreter
+
+    :return: (dict) The result of measure
+    """
+
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(measure, *args).result()
+
+
+def summarize(corpus, stage, payload_bytes, input_bytes, peaks):
+    """Builds the result record for one measured stage.
+
+    :param corpus: (str) The corpus name
+    :param stage: (str) One of 'build', 'encode' or 'decode'
+    :param payload_bytes: (int) The payload size, None for codebook builds
+    :param input_bytes: (int) The bytes the stage read: the corpus, the
+        payload or the ish file
+    :param peaks: (dict) The result of measure
+    :return: (dict) The result record
+    """
+
+    record = {
+        "corpus": corpus,
+        "stage": stage,
+        "payload_bytes": payload_bytes,
+        "input_bytes": input_bytes,
+    }
+    record.update(peaks)
+
+    # Memory per byte of input shows whether a stage streams or buffers.
+    record["traced_bytes_per_byte"] = (peaks["traced_peak_bytes"]
+                                       / input_bytes if input_bytes else None)
+    if payload_bytes:
+        record["traced_bytes_per_payload_byte"] = (peaks["traced_peak_bytes"]
+                                                   / payload_bytes)
+
+    return record
+
+
+def run_suite(corpora, sizes, mode, engine, seed,
+              schedule=ish.DEFAULT_SCHEDULE, codebook="dict",
+              payload="random"):
+    """Runs the full measurement grid.
+
+    :param corpora: (list) Corpus names from CORPORA
+    :param sizes: (list) Payload sizes in bytes
+    :param mode: (str) The encoding mode, one of ish.MODES
+    :param engine: (str) The encode engine, one of ish.ENGINES
+    :param seed: (int) Seed for the generated payloads
+    :param schedule: (int) The key schedule, one of ish.SCHEDULES
+    :param codebook: (str) 'dict' or 'compact'
+    :param payload: (str) The kind of payload, one of PAYLOADS
+    :return: (list) Result records
+    """
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        payload_path = os.path.join(temp_dir, "payload.bin")
+        ish_path = os.path.join(temp_dir, "payload.ish")
+        out_path = os.path.join(temp_dir, "payload.out")
+
+        for corpus in corpora:
+            corpus_path = os.path.join(HERE, corpus + ".txt")
+            settings = (mode, schedule, codebook, engine)
+
+            # Corpora with too few words for the mode are reported instead
+            # of stopping the whole suite.
+            try:
+                ish.mode_tables(corpus_path, mode, schedule=schedule)
+            except IndexError as error:
+                results.append(skipped(corpus, error))
+                continue
+
+            peaks = run_measure("build", corpus_path, None, None, None,
+                                *settings)
+            results.append(summarize(corpus, "build", None,
+                                     os.path.getsize(corpus_path), peaks))
+
+            for size in sizes:
+                # The same seed gives the same payload on every machine.
+                rng = random.Random("%d:%d" % (seed, size))
+                with open(payload_path, 'wb') as file:
+                    file.write(make_payload(payload, size, rng))
+
+                peaks = run_measure("encode", corpus_path, payload_path,
+                                    ish_path, out_path, *settings)
+                results.append(summarize(corpus, "encode", size, size,
+                                         peaks))
+
+                peaks = run_measure("decode", corpus_path, payload_path,
+                                    ish_path, out_path, *settings)
+                results.append(summarize(corpus, "decode", size,
+                                         os.path.getsize(ish_path), peaks))
+
+                # Memory figures for a broken cipher are worthless.
+                with open(payload_path, 'rb') as a, open(out_path, 'rb') as b:
+                    if a.read() != b.read():
+                        raise RuntimeError("Round trip failed for %s at %d "
+                                           "bytes." % (corpus, size))
+
+    return results
+
+
+def compare(report, baseline, tolerance, check_rss=False):
+    """Finds every peak that grew past its baseline by more than tolerance.
+
+    :param report: (dict) The report of this run
+    :param baseline: (dict) The stored baseline report
+    :param tolerance: (float) The growth allowed, in percent
+    :param check_rss: (bool) Whether to check RSS peaks as well
+    :return: (list) A message for every regression
+    """
+
+    def key(record):
+        return record["corpus"], record["stage"], record["payload_bytes"]
+
+    stored = {key(record): record for record in baseline["results"]}
+    fields = ["traced_peak_bytes"]
+    if check_rss:
+        fields.append("rss_peak_bytes")
+
+    regressions = []
+    for record in report["results"]:
+        old = stored.get(key(record))
+        if old is None:
+            continue
+
+        for field in fields:
+            if not old.get(field) or record.get(field) is None:
+                continue
+
+            growth = 100.0 * (record[field] / old[field] - 1)
+            if growth > tolerance:
+                regressions.append(
+                    "%s %s %s: %s %d, baseline %d (+%.1f%%)"
+                    % (record["corpus"], record["stage"],
+                       record["payload_bytes"], field, record[field],
+                       old[field], growth))
+
+    return regressions
+
+
+def main():
+    """Main function
+
+    :return: Nothing, exits with status 1 if any peak regressed.
+    """
+
+    parser = argparse.ArgumentParser(description="Measure the peak memory "
+                                                 "of the ish cipher.")
+    parser.add_argument("--corpora", nargs="+", choices=CORPORA,
+                        default=CORPORA, help="Corpora to measure.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=PAYLOAD_SIZES,
+                        metavar="BYTES", help="Payload sizes to measure.")
+    parser.add_argument("--mode", choices=ish.MODES, default="base64",
+                        help="Encoding mode. Defaults to %(default)s.")
+    parser.add_argument("--schedule", type=int, choices=ish.SCHEDULES,
+                        default=ish.DEFAULT_SCHEDULE,
+                        help="Key schedule. Defaults to %(default)s.")
+    parser.add_argument("--codebook", choices=("dict", "compact"),
+                        default="dict",
+                        help="Codebook representation. Defaults to "
+                             "%(default)s.")
+    parser.add_argument("--engine", choices=sorted(ish.ENGINES),
+                        default="python",
+                        help="Encode engine. Defaults to %(default)s.")
+    parser.add_argument("--payload", choices=PAYLOADS, default="random",
+                        help="Kind of payload. Defaults to %(default)s.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for generated payloads.")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE,
+                        help="Baseline report to compare against. Defaults "
+                             "to %(default)s.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this run as the baseline instead of "
+                             "comparing against it.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        metavar="PERCENT",
+                        help="Growth over the baseline allowed before "
+                             "failing. Defaults to %(default)s.")
+    parser.add_argument("--check-rss", action="store_true",
+                        help="Also fail on RSS peaks, which vary between "
+                             "machines.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    results = run_suite(args.corpora, args.sizes, args.mode, args.engine,
+                        args.seed, args.schedule, args.codebook, args.payload)
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "algorithm_version": ish.ALGORITHM_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": ish.np is not None,
+        "mode": args.mode,
+        "schedule": args.schedule,
+        "codebook": args.codebook,
+        "engine": args.engine,
+        "payload": args.payload,
+        "seed": args.seed,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at %s, run with --save-baseline to store one."
+              % args.baseline, file=sys.stderr)
+        return
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+
+    # Peaks from other settings or another Python are not comparable.
+    for name in ("mode", "schedule", "codebook", "engine", "payload", "seed"):
+        if baseline.get(name) != report[name]:
+            sys.exit("Baseline was measured with %s %s, not %s."
+                     % (name, baseline.get(name), report[name]))
+    if baseline.get("python") != report["python"]:
+        print("Baseline was measured on Python %s, peaks may differ."
+              % baseline.get("python"), file=sys.stderr)
+
+    regressions = compare(report, baseline, args.tolerance, args.check_rss)
+    for message in regressions:
+        print("Memory regression: " + message, file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
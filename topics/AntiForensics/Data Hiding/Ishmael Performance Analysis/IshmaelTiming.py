@@ -1,325 +1,288 @@
-"""POC for a cipher system that translates 1 char into multiple words
+"""Reproducible benchmark suite for the ish cipher
+
+Times codebook build, encode and decode separately for every shipped corpus
+against generated payloads, using the real functions from IshCMDOnly. Every
+measurement is repeated and reported as median and p95 in JSON, so results
+from different versions can be compared directly.
+
+Payloads are either random bytes or text cut from warandpeace.txt. Running
+the text payloads with and without --compress shows how much the optional
+compression stage shrinks the output and saves time.
+
+Example:
+    python IshmaelTiming.py --repeat 5 --output results.json
+    python IshmaelTiming.py --payload text --compress lzma
 """
-import string as s
+import argparse
+import json
 import math
+import os
+import platform
 import random
-from collections import OrderedDict
-import base64
+import statistics
+import sys
+import tempfile
 import time
 
-# A list of valid characters for ascii encoding
-ascii_chars = list(s.ascii_letters + s.whitespace + s.punctuation + s.digits)
-
-# A list of valid characters in base64
-base_chars = list(s.ascii_letters + s.digits + "+" + "/" + "=")
-
-
-# Code below from following site
-# https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
-def divide_chunks(list_to_chunk, n):
-	"""Yields successive n-sized chunks from list list_to_chunk
-
-	:param list_to_chunk: (list) A list to be chunked
-	:param n: (int) The number of elements to be put into each chunk
-	:return: The chunks of equal size using a yield statement
-	"""
-
-	# Yield each chunk.
-	for x in range(0, len(list_to_chunk), n):
-		yield list_to_chunk[x:x + n]
-
-
-# Function for generation the word lists used for encoding.
-def wordlistgen():
-	"""Generates a list of unique words when passed a list of mixed words
-
-	:return: A list of unique words in order of appearance in original list
-	"""
-
-	# Provide user context for what their input should do
-	print(
-		"To encode or decode a message a word list is required." 
-		"A longer list will give better results."
-		"If decoding, the same list used to encode, must decode"
-	)
-	print("Ex. The full text of Moby Dick; or, The Whale")
-
-	# Create the master word list as a set to prevent duplicate words.
-	word_list = list()
-
-	# Read the contents of the file and save it to a variable.
-	while True:
-		try:
-			# Prompt user for input
-			file_path = input(
-				"Please enter the full path (including extension) of your file: "
-			)
-
-			with open(file_path, 'r', encoding='utf-8') as text_file:
-				text = text_file.read()
-			break
-		except FileNotFoundError:
-			print("File not found, please ensure the path/filename is correct")
-
-	time_var = time.clock()
-	# Cast all upper case characters to lowercase
-	text = text.lower()
-
-	# Split up the line into it's component words
-	raw_words = text.split()
-
-	# Create a translate table to remove punctuation
-	remove_punctuation = str.maketrans('', '', s.punctuation + "”" + "“" + "—")
-
-	# Use a list comprehension. For each word, strip punctuation
-	words = [w.translate(remove_punctuation) for w in raw_words]
-
-	# DEBUG print the contents of raw_words
-	# print(word_list)
-
-	# Remove the blank entry that can sometimes be created for the wordlist
-	try:
-		word_list.remove('')
-	except ValueError:
-		pass
-
-	# Briefly cast the word list as keys in an ordered dict to remove dupes
-	words = list(OrderedDict.fromkeys(words))
-
-	return words, time_var
-
-
-# Ask user which function they want to perform
-while True:
-	print("1. Encode a text message")
-	print("2. Decode a text message")
-	print("3. Encode a file")
-	print("4. Decode a file")
-	print("5. Quit")
-
-	# Prompt user for a number, handle non number answers.
-	try:
-		choice = int(input("Please enter your choice: "))
-	except ValueError:
-		print("Please enter a valid number")
-		continue
-
-	# Encode message
-	if choice == 1:
-		# Call wordlistgen() to generate the word list needed for cipher
-		cipher_list = wordlistgen()
-
-		message = str(input("Please enter in the message to be encoded: "))
-
-		# Determine how many words should be in each chunk.
-		words_per_chunk = math.ceil(len(cipher_list) / len(ascii_chars))
-
-		# Call divide_chunks to break the cipher_list into equally sized chunks
-		chunked_wordlist = divide_chunks(list(cipher_list), words_per_chunk)
-		chunked_wordlist = list(chunked_wordlist)
-
-		# Create the encoding table as an empty dictionary
-		encode_table = dict()
-
-		# Create an iterator i to track progress through chunked_wordlist
-		i = 0
-
-		# Loop through all the characters in valid characters
-		for character in ascii_chars:
-
-			# Selected a chunk as the value for the character
-			encode_table[character] = chunked_wordlist[i]
-
-			# Add one to the iterator to get next chunk.
-			i += 1
-
-		# Create a list to store the encoded message.
-		encoded_message = []
-
-		# Loop through all the characters, include whitespaces
-		for character in list(message):
-
-			# For each character, add a random word from all words that are
-			# associated with that character to the list.
-			encoded_message.append(random.choice(encode_table[character]))
-
-		# Cast the encoded message back into a string.
-		encoded_message = ' '.join(encoded_message)
-
-		print("Your encoded message is....")
-		print(encoded_message)
-
-	# Decode message
-	elif choice == 2:
-		print(
-			"You must use the same wordlist to decode that you used to encode."
-		)
-		decode_list = wordlistgen()
-
-		cipher_text = str(input("Enter in your cipher text: "))
-
-		# TODO Make this chunk of code into a function
-		# Determine how many words should be in each chunk.
-		words_per_chunk = math.ceil(len(decode_list) / len(ascii_chars))
-
-		# Call divide_chunks to break the cipher_list into equally sized chunks
-		chunked_wordlist = divide_chunks(list(decode_list), words_per_chunk)
-		chunked_wordlist = list(chunked_wordlist)
-
-		# Create the encoding table as an empty dictionary
-		association_table = dict()
-
-		# Create an iterator i to track progress through chunked_wordlist
-		i = 0
-
-		# Loop through all the characters in valid characters3
-		for character in ascii_chars:
-			# Selected a chunk as the value for the character
-			association_table[character] = chunked_wordlist[i]
-
-			# Add one to the iterator to get next chunk.
-			i += 1
-
-		decode_table = dict()
-
-		for key in association_table.keys():
-			for word in association_table[key]:
-				decode_table[word] = key
-
-		cipher_text = cipher_text.split(" ")
-
-		message = [decode_table[word] for word in cipher_text]
-		print("Your decoded message is...")
-		print(''.join(message))
-
-	# Encode Message
-	elif choice == 3:
-
-		# Prompt user for filepath where file to be translated is located
-		encode_path = str(input("Enter the path for the file to be encoded: "))
-
-		# Open the file as raw bytecode
-		with open(encode_path, "rb") as file:
-			file_raw = file.read()
-
-		# Cast raw byte code to base64 encoded bytecode
-		file_base = base64.b64encode(file_raw)
-
-		# Cast base64 bytecode into base64 encoded strings
-		base_string = file_base.decode("utf-8")
-
-		# Call wordlistgen() to generate the word list needed for cipher
-		cipher_list, start_time = wordlistgen()
-
-		# Determine how many words should be in each chunk.
-		words_per_chunk = math.ceil(len(cipher_list) / len(base_chars))
-
-		# Call divide_chunks to break the cipher_list into equally sized chunks
-		chunked_wordlist = divide_chunks(list(cipher_list), words_per_chunk)
-		chunked_wordlist = list(chunked_wordlist)
-
-		# Create the encoding table as an empty dictionary
-		encode_table = dict()
-
-		# Create an iterator i to track progress through chunked_wordlist
-		i = 0
-
-		# Loop through all the characters in valid characters
-		for character in base_chars:
-			# Selected a chunk as the value for the character
-			encode_table[character] = chunked_wordlist[i]
-
-			# Add one to the iterator to get next chunk.
-			i += 1
-
-		# Create a list to store the encoded message.
-		ish_list = []
-
-		# Loop through all the characters, include whitespaces
-		for character in base_string:
-			# For each character, add a random word from all words that are
-			# associated with that character to the list.
-			ish_list.append(random.choice(encode_table[character]))
-
-		# Cast the encoded message back into a string.
-		ish_string = ' '.join(ish_list)
-
-		end_time = time.clock()
-		total_time = end_time - start_time
-		print("It took " + str(total_time) + "seconds to encrypt!")
-
-		# Prompt user for save
-		save_path = str(input("Enter the path to save the encoded data: "))
-		print("Saving your encoded message...")
-		with open(save_path, "w") as file:
-			file.write(ish_string)
+# The cipher lives next to this directory, import it from there.
+HERE = os.path.dirname(os.path.abspath(__file__))
+CIPHER_DIR = os.path.join(os.path.dirname(HERE), "Ishmael Code Refactor")
+sys.path.insert(0, CIPHER_DIR)
 
-	# Decode Message
-	elif choice == 4:
+import IshCMDOnly as ish  # noqa: E402
 
-		# Generate a wordlist used to decode the text
-		decode_list = wordlistgen()
+# The corpora shipped with the analysis, smallest first.
+CORPORA = ["minwords", "smallwords", "common", "aliceinwonderland",
+           "mobydick", "warandpeace"]
 
-		# Get filepath
-		decode_path = str(input("Enter in the file path for file to decode: "))
-		with open(decode_path, "r") as file:
-			ish_string = file.read()
+# Default payload sizes in bytes.
+PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024]
 
-		# TODO Make this chunk of code into a function
-		# Determine how many words should be in each chunk.
-		words_per_chunk = math.ceil(len(decode_list) / len(base_chars))
+# Kinds of generated payload
+PAYLOADS = ("random", "text")
 
-		# Call divide_chunks to break the cipher_list into equally sized chunks
-		chunked_wordlist = divide_chunks(list(decode_list), words_per_chunk)
-		chunked_wordlist = list(chunked_wordlist)
+# Corpus text payloads are cut from
+TEXT_SOURCE = "warandpeace"
 
-		# Create the encoding table as an empty dictionary
-		association_table = dict()
+# Version of the JSON layout written by this script.
+REPORT_VERSION = 2
 
-		# Create an iterator i to track progress through chunked_wordlist
-		i = 0
 
-		# Loop through all the characters in valid characters
-		for character in base_chars:
-			# Selected a chunk as the value for the character
-			association_table[character] = chunked_wordlist[i]
+def percentile(samples, fraction):
+    """Picks a percentile from a list of samples using the nearest rank.
 
-			# Add one to the iterator to get next chunk.
-			i += 1
+    :param samples: (list) The measured values
+    :param fraction: (float) The percentile as a fraction, e.g. 0.95
+    :return: (float) The sample at that rank
+    """
 
-		# Create a dictionary to use to decode
-		decode_table = dict()
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
 
-		# For each word in original dictionary, create a word -> character rel.
-		for key in association_table.keys():
-			for word in association_table[key]:
-				decode_table[word] = key
 
-		# Cast the list encoded by ish to a string
-		ish_list = ish_string.split(" ")
+def make_payload(kind, size, rng):
+    """Generates a payload
 
-		# Cast the ish string to a base64 encoded list
-		base_list = [decode_table[word] for word in ish_list]
+    :param kind: (str) One of PAYLOADS
+    :param size: (int) The payload size in bytes
+    :param rng: (random.Random) The generator to draw the payload with
+    :return: (bytes) The payload
+    """
 
-		# Cast the base64 encoded list to a base64 encoded string
-		base_string = " ".join(base_list)
+    if kind == "random":
+        return rng.randbytes(size)
 
-		# Cast the base64 encoded string to a base64 encoded bytecode
-		decode_base = base_string.encode("utf-8")
+    # Cut a window out of the text, wrapping around if it is too short.
+    with open(os.path.join(HERE, TEXT_SOURCE + ".txt"), 'rb') as file:
+        text = file.read()
+    start = rng.randrange(len(text))
+    text = text[start:] + text[:start]
+    return (text * (size // len(text) + 1))[:size]
 
-		# Cast base64 encoded bytecode to raw bytecode for writing
-		new_file_base = base64.b64decode(decode_base)
 
-		# Prompt user for filepath and write bytecode
-		save_path = str(input("Enter the path to save the file to: "))
-		print("Saving your decoded message...")
-		with open(save_path, "wb") as file:
-			file.write(new_file_base)
+def summarize(corpus, stage, payload_bytes, samples, output_bytes=None):
+    """Builds the result record for one measured stage.
 
-	# Exit program by breaking main loop
-	elif choice == 5:
-		break
+    :param corpus: (str) The corpus name
+    :param stage: (str) One of 'build', 'encode' or 'decode'
+    :param payload_bytes: (int) The payload size, None for codebook builds
+    :param samples: (list) Wall clock seconds of every run
+    :param output_bytes: (int) The size of the ish output, for encodes
+    :return: (dict) The result record
+    """
 
-	# Catch exception where user provides number not associated with a choice
-	else:
-		print("The entered number does not correspond to a choice.")
+    median = statistics.median(samples)
+    record = {
+        "corpus": corpus,
+        "stage": stage,
+        "payload_bytes": payload_bytes,
+        "runs": len(samples),
+        "median_s": median,
+        "p95_s": percentile(samples, 0.95),
+        "samples_s": samples,
+    }
+
+    # Throughput only makes sense when a payload went through the stage.
+    if payload_bytes:
+        record["median_mb_s"] = (payload_bytes / median / 1e6
+                                 if median else None)
+
+    # Record how much the payload grew on its way to words.
+    if output_bytes is not None:
+        record["output_bytes"] = output_bytes
+        record["expansion"] = (output_bytes / payload_bytes
+                               if payload_bytes else None)
+
+    return record
+
+
+def skipped(corpus, error):
+    """Builds the record of a corpus left out of the run, and reports it.
+
+    :param corpus: (str) The corpus name
+    :param error: (IndexError) Why its tables could not be built, usually
+        too few words for the mode
+    :return: (dict) The result record
+    """
+
+    print("Skipping %s: %s" % (corpus, error), file=sys.stderr)
+
+    return {"corpus": corpus, "stage": "build", "payload_bytes": None,
+            "skipped": str(error)}
+
+
+def time_call(repeat, function, *args, **kwargs):
+    """Runs a function several times and times every run.
+
+    :param repeat: (int) The number of runs
+    :param function: The function to time
+    :return: (list) Wall clock seconds of every run
+    """
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def run_suite(corpora, sizes, repeat, mode, engine, workers, seed,
+              schedule=ish.DEFAULT_SCHEDULE, payload="random", compress=None):
+    """Runs the full benchmark grid.
+
+    :param corpora: (list) Corpus names from CORPORA
+    :param sizes: (list) Payload sizes in bytes
+    :param repeat: (int) The number of runs per measurement
+    :param mode: (str) The encoding mode, one of ish.MODES
+    :param engine: (str) The encode engine, one of ish.ENGINES
+    :param workers: (int) The number of worker processes
+    :param seed: (int) Seed for the generated payloads
+    :param schedule: (int) The key schedule, one of ish.SCHEDULES
+    :param payload: (str) The kind of payload, one of PAYLOADS
+    :param compress: (str) Codec from ish.CODECS to compress payloads with,
+        None for none
+    :return: (list) Result records
+    """
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        payload_path = os.path.join(temp_dir, "payload.bin")
+        ish_path = os.path.join(temp_dir, "payload.ish")
+        out_path = os.path.join(temp_dir, "payload.out")
+
+        for corpus in corpora:
+            corpus_path = os.path.join(HERE, corpus + ".txt")
+
+            # Corpora with too few words for the mode are reported instead
+            # of stopping the whole suite.
+            try:
+                encrypt_list, decrypt_list = ish.mode_tables(
+                    corpus_path, mode, schedule=schedule)
+            except IndexError as error:
+                results.append(skipped(corpus, error))
+                continue
+
+            # Time the codebook build without the on-disk cache.
+            samples = time_call(repeat, ish.mode_tables, corpus_path, mode,
+                                schedule=schedule)
+            results.append(summarize(corpus, "build", None, samples))
+
+            for size in sizes:
+                # The same seed gives the same payload on every machine.
+                rng = random.Random("%d:%d" % (seed, size))
+                with open(payload_path, 'wb') as file:
+                    file.write(make_payload(payload, size, rng))
+
+                samples = time_call(repeat, ish.encrypt, encrypt_list,
+                                    payload_path, ish_path, engine=engine,
+                                    mode=mode, workers=workers,
+                                    compress=compress)
+                results.append(summarize(corpus, "encode", size, samples,
+                                         os.path.getsize(ish_path)))
+
+                samples = time_call(repeat, ish.decrypt, decrypt_list,
+                                    ish_path, out_path, mode=mode,
+                                    workers=workers,
+                                    decompress=compress is not None)
+                results.append(summarize(corpus, "decode", size, samples))
+
+                # A benchmark of a broken cipher is worthless.
+                with open(payload_path, 'rb') as a, open(out_path, 'rb') as b:
+                    if a.read() != b.read():
+                        raise RuntimeError("Round trip failed for %s at %d "
+                                           "bytes." % (corpus, size))
+
+    return results
+
+
+def main():
+    """Main function
+
+    :return: Nothing, just runs the benchmarks and writes the report.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the ish cipher.")
+    parser.add_argument("--corpora", nargs="+", choices=CORPORA,
+                        default=CORPORA, help="Corpora to benchmark.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=PAYLOAD_SIZES,
+                        metavar="BYTES", help="Payload sizes to benchmark.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per measurement. Defaults to %(default)s.")
+    parser.add_argument("--mode", choices=ish.MODES, default="base64",
+                        help="Encoding mode. Defaults to %(default)s.")
+    parser.add_argument("--schedule", type=int, choices=ish.SCHEDULES,
+                        default=ish.DEFAULT_SCHEDULE,
+                        help="Key schedule. Defaults to %(default)s.")
+    parser.add_argument("--engine", choices=sorted(ish.ENGINES),
+                        default="python",
+                        help="Encode engine. Defaults to %(default)s.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes. Defaults to %(default)s.")
+    parser.add_argument("--payload", choices=PAYLOADS, default="random",
+                        help="Kind of payload. Defaults to %(default)s.")
+    parser.add_argument("--compress", choices=sorted(ish.CODECS),
+                        default=None,
+                        help="Compress payloads before encoding.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for generated payloads.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    results = run_suite(args.corpora, args.sizes, args.repeat, args.mode,
+                        args.engine, args.workers, args.seed, args.schedule,
+                        args.payload, args.compress)
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "algorithm_version": ish.ALGORITHM_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": ish.np is not None,
+        "mode": args.mode,
+        "schedule": args.schedule,
+        "engine": args.engine,
+        "workers": args.workers,
+        "payload": args.payload,
+        "compress": args.compress,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()